@@ -0,0 +1,59 @@
+"""
+Measure bcrypt hashes per second on this host for each cost factor, on one thread and through the hashing
+process pool, to pick BCRYPT_LOG_ROUNDS and BCRYPT_POOL_SIZE.
+
+    $ python -m benchmarks.bcrypt_cost --min-cost 10 --max-cost 13 --pool-size 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_app
+
+
+def measure(hasher, cost, duration, concurrency):
+    """
+    Hash passwords from concurrent threads for about given duration.
+    :return: hashes per second
+    """
+    deadline = time.perf_counter() + duration
+
+    def work(_):
+        count = 0
+        while time.perf_counter() < deadline:
+            hasher.generate_password_hash('correct horse battery staple', rounds=cost)
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        total = sum(executor.map(work, range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-cost', type=int, default=10)
+    parser.add_argument('--max-cost', type=int, default=13)
+    parser.add_argument('--pool-size', type=int, default=os.cpu_count())
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds per measurement')
+    args = parser.parse_args()
+
+    app, _ = setup_app()
+    # Hashing threads run outside of the application context, they get the hasher itself.
+    hasher = app.extensions['password_hasher']
+
+    print(f'{"cost":>4} {"inline h/s":>11} {"ms/hash":>8} {f"pool({args.pool_size}) h/s":>14}')
+    for cost in range(args.min_cost, args.max_cost + 1):
+        app.config['BCRYPT_POOL_SIZE'] = 0
+        inline = measure(hasher, cost, args.duration, concurrency=1)
+
+        app.config['BCRYPT_POOL_SIZE'] = args.pool_size
+        pooled = measure(hasher, cost, args.duration, concurrency=args.pool_size * 2)
+
+        print(f'{cost:>4} {inline:>11.1f} {1000 / inline:>8.1f} {pooled:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Rows per second of bulk product import (validation and batched inserts) and streamed export, and peak memory
+of export which must not grow with the number of products.
+
+    $ python -m benchmarks.bulk_import --rows 100000 --batch-size 1000
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+from benchmarks.common import setup_app, seed, CATEGORIES, NOUNS
+
+
+def csv_file(rows):
+    lines = ['product_name,product_description,category,minimum_bid,last_date_to_bid']
+    lines.extend(f'{NOUNS[i % len(NOUNS)].title()} {i},Imported item {i},{CATEGORIES[i % len(CATEGORIES)]},'
+                 f'{100 + i % 5000},2031-01-01' for i in range(rows))
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    user_id = seed(db, users=1, products=0, bids_per_product=0)[0]
+
+    from bid.utilities.bulk import import_products, export_query, export_rows
+
+    with app.test_request_context():
+        stream = csv_file(args.rows)
+        started = time.perf_counter()
+        result = import_products(stream, 'csv', user_id, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f'import: {result.imported} rows, {result.failed} skipped, {result.imported / elapsed:.0f} rows/s')
+
+        for fmt in ('csv', 'jsonl'):
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in export_rows(*export_query(user_id), fmt))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'export {fmt:<5}: {size / 1e6:.1f} MB, {args.rows / elapsed:.0f} rows/s, '
+                  f'peak memory {peak / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
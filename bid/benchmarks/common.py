@@ -0,0 +1,219 @@
+"""
+Shared helpers for benchmark scripts. Run scripts from project directory, e.g.:
+
+    $ python -m benchmarks.listing_queries
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from random import Random
+
+from sqlalchemy import event
+
+
+def setup_app(database_uri='sqlite://', engine_options=None):
+    """
+    Create application against benchmark database, push its application context for the rest of the script and
+    create its tables.
+    :param database_uri: defaults to in-memory SQLite database
+    :param engine_options: SQLAlchemy create_engine() options
+    :return: tuple of (app, db)
+    """
+    import config
+    from bid import create_app, db
+
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SECRET_KEY': config.SECRET_KEY or 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+        'MAIL_SUPPRESS_SEND': True,
+        'RATE_LIMIT_ENABLED': False,
+    }
+    if engine_options:
+        settings['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    app = create_app(settings)
+    app.app_context().push()
+    db.create_all()
+    return app, db
+
+
+CATEGORIES = ['Books', 'Electronics', 'Furniture', 'Art', 'Toys', 'Home Decor', 'Sports', 'Music', 'Jewellery',
+              'Clothing']
+ADJECTIVES = ['vintage', 'antique', 'modern', 'rare', 'signed', 'handmade', 'classic', 'wooden', 'golden', 'leather',
+              'silver', 'mint', 'restored', 'limited', 'original', 'compact', 'portable', 'electric', 'ceramic', 'brass']
+NOUNS = ['lamp', 'chair', 'guitar', 'camera', 'watch', 'painting', 'novel', 'table', 'bicycle', 'vase', 'radio',
+         'poster', 'ring', 'jacket', 'clock', 'mirror', 'piano', 'sculpture', 'typewriter', 'telescope']
+
+
+def seed(db, users=10, products=100, bids_per_product=10, password='password', seed_value=0, batch_size=10000):
+    """
+    Bulk insert users, products in categories and bids with their bid events. Bid aggregates on products and
+    active counts of categories are filled in the same pass.
+    Product names and descriptions are made of a small vocabulary so full-text searches have realistic hit rates.
+    :param db:
+    :param users:
+    :param products:
+    :param bids_per_product: capped to number of users other than the owner
+    :param password: plain text password of every seeded user
+    :param seed_value: seed of random generator, same seed gives same data
+    :param batch_size: rows inserted per statement, bounds memory of large catalogues
+    :return:
+    """
+    from bid.models import User, Product, Bidder, BidEvent
+    from bid.utilities.hashing import hasher
+    from bid.utilities.categories import category_ids, adjust_active_counts
+
+    rnd = Random(seed_value)
+    hashed_password = hasher.generate_password_hash(password)
+    now = datetime.now().replace(microsecond=0)
+
+    user_offset = db.session.query(db.func.coalesce(db.func.max(User.id), 0)).scalar()
+    user_ids = list(range(user_offset + 1, user_offset + users + 1))
+    for start in range(0, users, batch_size):
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{uid}', 'email': f'user{uid}@example.com', 'password': hashed_password}
+            for uid in user_ids[start:start + batch_size]
+        ])
+
+    categories = category_ids(CATEGORIES)
+    active_counts = Counter()
+    product_offset = db.session.query(db.func.coalesce(db.func.max(Product.id), 0)).scalar()
+    product_rows = list()
+    bid_rows = list()
+    for i in range(1, products + 1):
+        product_id = product_offset + i
+        owner_id = rnd.choice(user_ids)
+        minimum_bid = rnd.randrange(100, 10000)
+        bidders = rnd.sample(user_ids, min(bids_per_product + 1, len(user_ids)))
+        bids = [(uid, minimum_bid + rnd.randrange(1, 5000)) for uid in bidders if uid != owner_id][:bids_per_product]
+        leader = max(bids, key=lambda item: item[1], default=(None, None))
+        adjective, noun = rnd.choice(ADJECTIVES), rnd.choice(NOUNS)
+
+        product_rows.append({
+            'id': product_id,
+            'user_id': owner_id,
+            'product_name': f'{adjective.title()} {noun} {product_id}',
+            'product_description': f'{rnd.choice(ADJECTIVES).title()} and {rnd.choice(ADJECTIVES)} {noun}, '
+                                   f'{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} included.',
+            'category': rnd.choice(CATEGORIES),
+            'minimum_bid': minimum_bid,
+            'post_created': now - timedelta(minutes=products - i),
+            'last_updated': now,
+            'last_date_to_bid': now + timedelta(days=rnd.randrange(1, 30)),
+            'picture': 'default.png',
+            'highest_bid': leader[1],
+            'highest_bidder_id': leader[0],
+            'bid_count': len(bids)
+        })
+        product_rows[-1]['category_id'] = categories[product_rows[-1]['category']]
+        active_counts[product_rows[-1]['category_id']] += 1
+        bid_rows.extend({'bidders_id': uid, 'product_id': product_id, 'bid_value': value, 'note': None}
+                        for uid, value in bids)
+
+        if len(product_rows) >= batch_size or i == products:
+            db.session.execute(Product.__table__.insert(), product_rows)
+            if bid_rows:
+                db.session.execute(Bidder.__table__.insert(), bid_rows)
+                db.session.execute(BidEvent.__table__.insert(), [
+                    {'product_id': row['product_id'], 'bidder_id': row['bidders_id'], 'bid_value': row['bid_value'],
+                     'created_at': now} for row in bid_rows
+                ])
+            product_rows, bid_rows = list(), list()
+
+    adjust_active_counts(active_counts)
+    db.session.commit()
+
+    return user_ids
+
+
+def login(app, email, password='password'):
+    """
+    Test client logged in as given user.
+    :param app:
+    :param email:
+    :param password:
+    :return:
+    """
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': password})
+    assert response.status_code == 302, 'Login failed.'
+    return client
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Count SQL statements executed on engine inside the block.
+    :param engine:
+    :return: list which receives executed statements
+    """
+    statements = list()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile.
+    :param values: sorted list
+    :param fraction: e.g. 0.99
+    :return: value or None when there are no values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def latency_summary(latencies, elapsed):
+    """
+    :param latencies: seconds of every request
+    :param elapsed: wall clock seconds the requests took altogether
+    :return: dict of requests, p50_ms, p99_ms and rps
+    """
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def print_summaries(summaries):
+    """
+    Print table of latency summaries.
+    :param summaries: dict of name -> latency_summary() dict, optionally with errors
+    :return:
+    """
+    print(f'{"endpoint":<16} {"requests":>9} {"errors":>7} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>9}')
+    for name, summary in summaries.items():
+        print(f'{name:<16} {summary["requests"]:>9} {summary.get("errors", 0):>7} {summary["p50_ms"] or 0:>8.2f} '
+              f'{summary["p99_ms"] or 0:>8.2f} {summary["rps"] or 0:>9.1f}')
+
+
+def compare_summaries(summaries, baseline, tolerance):
+    """
+    Regressions against summaries of an earlier run: p99 latency grown or throughput dropped by more than tolerance.
+    :param summaries: dict of name -> latency_summary() dict
+    :param baseline: same, of the earlier run
+    :param tolerance: allowed relative change, e.g. 0.2
+    :return: list of messages, empty without regressions
+    """
+    regressions = list()
+    for name, summary in summaries.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before['p99_ms'] and summary['p99_ms'] and summary['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p99 {before["p99_ms"]:.2f} ms -> {summary["p99_ms"]:.2f} ms')
+        if before['rps'] and summary['rps'] and summary['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {before["rps"]:.1f} req/s -> {summary["rps"]:.1f} req/s')
+    return regressions
@@ -0,0 +1,64 @@
+"""
+Check that rendering a listing page issues a constant number of queries regardless of bid volume,
+for every listing strategy.
+
+    $ python -m benchmarks.listing_queries
+"""
+import sys
+
+from benchmarks.common import setup_app, seed, login, count_queries
+
+BID_VOLUMES = (0, 5, 50)
+
+
+def main():
+    app, db = setup_app()
+    from bid.models import User
+    from bid.utilities.listing import LISTING_STRATEGIES, paginate_listing, home_listing_query
+
+    failed = False
+    view_counts = list()
+    for strategy in LISTING_STRATEGIES:
+        counts = list()
+        for bids_per_product in BID_VOLUMES:
+            db.drop_all()
+            db.create_all()
+            seed(db, users=max(bids_per_product + 1, 10), products=20, bids_per_product=bids_per_product)
+            client = login(app, User.query.first().email)
+
+            with count_queries(db.engine) as statements:
+                with app.test_request_context('/'):
+                    pagination = paginate_listing(home_listing_query(), page=2, per_page=5, strategy=strategy)
+                    for product in pagination.items:
+                        product.owner.username, product.bid_stats.highest_bid
+            counts.append(len(statements))
+
+            if strategy == LISTING_STRATEGIES[0]:
+                # Warm up session user cache, so every volume counts the same queries.
+                client.get('/')
+                with count_queries(db.engine) as statements:
+                    client.get('/?page=2')
+                view_counts.append(len(statements))
+            db.session.remove()
+
+        failed = report(strategy, counts) or failed
+
+    failed = report('home view', view_counts) or failed
+
+    sys.exit(1 if failed else 0)
+
+
+def report(name, counts):
+    """
+    Print query counts measured at each bid volume.
+    :param name:
+    :param counts:
+    :return: True when counts differ between bid volumes
+    """
+    consistent = len(set(counts)) == 1
+    print(f'{name:<13} queries per page at {BID_VOLUMES} bids/product: {counts} {"OK" if consistent else "FAIL"}')
+    return not consistent
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+HTTP load generator for the bidding workflow: worker processes, each with its own logged in user and connection,
+request the home listing, products, sellers' products and place bids for a fixed duration.
+Reports p50/p99 latency and requests per second per endpoint.
+
+Without --url the application is served from this process by the threaded development server on a seeded
+SQLite database, which measures the application code rather than a production setup. Point --url to a deployment
+(e.g. gunicorn against MySQL, seeded with the same users, with RATE_LIMIT_ENABLED=false) for realistic numbers.
+
+    $ python -m benchmarks.load --workers 8 --duration 20
+    $ python -m benchmarks.load --url http://127.0.0.1:8000 --workers 32 --duration 60 --compare baseline.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.common import setup_app, seed, latency_summary, print_summaries, compare_summaries
+from benchmarks.workflow import Workflow
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class Session(object):
+    """
+    Keep-alive HTTP connection carrying the session cookie of a logged in user.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.cookies = dict()
+        self.csrf_token = None
+
+    def request(self, method, path, data=None):
+        """
+        :return: tuple (status, body)
+        """
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode(dict(data, csrf_token=self.csrf_token) if self.csrf_token else data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # Server closed idle keep-alive connection, retry once on a new one.
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        content = response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+        return response.status, content
+
+    def login(self, email, password):
+        _, content = self.request('GET', '/login')
+        match = CSRF_TOKEN.search(content.decode())
+        self.csrf_token = match.group(1) if match else None
+
+        status, _ = self.request('POST', '/login', {'email': email, 'password': password})
+        if status != 302:
+            raise RuntimeError(f'Login of {email} failed with status {status}.')
+
+
+def worker(index, args, product_ids, usernames, start, results):
+    """
+    Log in as user number index, then make requests of the workflow until duration is over.
+    Puts dict of endpoint -> (latencies, errors) on results queue.
+    """
+    session = Session(args.url)
+    session.login(f'user{index + 1}@example.com', args.password)
+    # Workers outbid each other with distinct, rising values.
+    workflow = Workflow(product_ids, usernames, seed_value=index, bid_base=1000000 + index, bid_step=args.workers)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    start.wait(timeout=600)
+    measure_from = time.perf_counter() + args.warmup
+    deadline = measure_from + args.duration
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        endpoint, method, path, data = workflow.next_request()
+        try:
+            status, _ = session.request(method, path, data)
+        except OSError:
+            status = 599
+        if now < measure_from:
+            continue
+        latencies[endpoint].append(time.perf_counter() - now)
+        if status >= 400:
+            errors[endpoint] += 1
+
+    results.put({endpoint: (values, errors[endpoint]) for endpoint, values in latencies.items()})
+
+
+def serve(args):
+    """
+    Seed temporary database and serve application from a background thread.
+    :return: tuple (url, product ids, usernames, server)
+    """
+    app, db = setup_app(f'sqlite:///{os.path.join(tempfile.mkdtemp(), "load.db")}',
+                        engine_options={'connect_args': {'timeout': 30}})
+    app.config['AUCTION_CLOSER_ENABLED'] = False
+    seed(db, users=max(args.users, args.workers), products=args.products, bids_per_product=args.bids,
+         password=args.password)
+
+    from werkzeug.serving import make_server
+    from bid.models import User, Product
+
+    product_ids = [product_id for product_id, in db.session.query(Product.id)]
+    usernames = [username for username, in db.session.query(User.username).limit(100)]
+    db.session.remove()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}', product_ids, usernames, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running application, seeded by benchmarks.common.seed()')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent client processes')
+    parser.add_argument('--duration', type=float, default=20, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of requests before measuring')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=2000, help='seeded products, or products of --url')
+    parser.add_argument('--bids', type=int, default=10, help='seeded bids per product')
+    parser.add_argument('--password', default='password', help='password of seeded users')
+    parser.add_argument('--save', metavar='FILE', help='write results as JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='exit with status 1 when regressed against baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        product_ids = list(range(1, args.products + 1))
+        usernames = [f'user{number}' for number in range(1, min(args.users, 100) + 1)]
+    else:
+        args.url, product_ids, usernames, server = serve(args)
+
+    # Forked workers only talk HTTP, they never touch the application state copied from this process.
+    context = multiprocessing.get_context('fork')
+    # Workers log in first, then start loading together.
+    start = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(index, args, product_ids, usernames, start, results))
+                 for index in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for _ in processes:
+        for endpoint, (values, failed) in results.get(timeout=args.warmup + args.duration + 600).items():
+            latencies[endpoint].extend(values)
+            errors[endpoint] += failed
+    for process in processes:
+        process.join()
+    if server is not None:
+        server.shutdown()
+
+    summaries = {endpoint: dict(latency_summary(values, args.duration), errors=errors[endpoint])
+                 for endpoint, values in sorted(latencies.items())}
+    summaries['all'] = dict(latency_summary([value for values in latencies.values() for value in values],
+                                            args.duration), errors=sum(errors.values()))
+    print(f'{args.workers} workers against {args.url} for {args.duration:.0f}s')
+    print_summaries(summaries)
+
+    if args.save:
+        with open(args.save, 'w') as baseline:
+            json.dump(summaries, baseline, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare_summaries(summaries, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions or summaries['all']['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Leaderboard of a hot auction, top bids and rank of the requesting bidder, served by the in-memory order book against
+the same answer queried from the bidder table, while bids keep being placed. Checks both agree after every bid.
+
+    $ python -m benchmarks.order_book --bidders 2000 --lookups 5000 --bids 200
+"""
+import argparse
+import sys
+import time
+from random import Random
+
+from benchmarks.common import setup_app, seed, count_queries
+
+
+def sql_leaderboard(db, product_id, bidder_id, count=10):
+    """
+    Top bids and rank of bidder queried from current bids.
+    :return: tuple (list of (bidder id, bid value), rank or None)
+    """
+    from bid.models import Bidder
+
+    top = db.session.query(Bidder.bidders_id, Bidder.bid_value) \
+        .filter(Bidder.product_id == product_id) \
+        .order_by(Bidder.bid_value.desc(), Bidder.id) \
+        .limit(count) \
+        .all()
+    bid_value = db.session.query(Bidder.bid_value) \
+        .filter(Bidder.product_id == product_id, Bidder.bidders_id == bidder_id) \
+        .scalar()
+    if bid_value is None:
+        return top, None
+    higher = db.session.query(db.func.count(Bidder.id)) \
+        .filter(Bidder.product_id == product_id, Bidder.bid_value > bid_value) \
+        .scalar()
+    return top, higher + 1
+
+
+def measure(lookup, bidder_ids, lookups, rnd):
+    """
+    :return: microseconds per lookup
+    """
+    started = time.perf_counter()
+    for _ in range(lookups):
+        lookup(rnd.choice(bidder_ids))
+    return (time.perf_counter() - started) / lookups * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bidders', type=int, default=2000, help='bidders of the hot auction')
+    parser.add_argument('--lookups', type=int, default=5000, help='leaderboard lookups measured per method')
+    parser.add_argument('--bids', type=int, default=200, help='bids placed while checking ranks')
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    bidder_ids = seed(db, users=args.bidders + 1, products=1, bids_per_product=args.bidders)
+
+    from bid.models import Product
+    from bid.utilities.bidding import place_bid, BID_ACCEPTED
+    from bid.utilities.orderbook import leaderboard, order_books
+
+    product = Product.query.get(1)
+    rnd = Random(0)
+
+    def book_lookup(bidder_id):
+        return leaderboard(Product.query.get(1), bidder_id=bidder_id)
+
+    def sql_lookup(bidder_id):
+        return sql_leaderboard(db, 1, bidder_id)
+
+    # Bidders ranked within the book are answered from memory, ones below its depth are ranked from database.
+    book = order_books.get(product)
+    ranked = [bid.bidder_id for bid in book.top(len(book))]
+    print(f'{args.bidders} bidders, top 10 and rank of a random bidder:')
+    for name, candidates in ((f'top {len(ranked)} bidders', ranked), ('any bidder', bidder_ids)):
+        for method, lookup in (('order book', book_lookup), ('SQL', sql_lookup)):
+            with count_queries(db.engine) as statements:
+                for bidder_id in candidates[:100]:
+                    lookup(bidder_id)
+            queries = len(statements) / len(candidates[:100])
+            us = measure(lookup, candidates, args.lookups, rnd)
+            print(f'  {name:<16} {method:<10} {us:>9.1f} us per lookup, {queries:.1f} queries')
+
+    mismatches = 0
+    loads = order_books.loads
+    for _ in range(args.bids):
+        bidder_id = rnd.choice(bidder_ids)
+        if bidder_id == product.user_id:
+            continue
+        current = Product.query.get(1).highest_bid
+        result = place_bid(1, bidder_id, int(current) + rnd.randrange(1, 100))
+        if result.status != BID_ACCEPTED:
+            continue
+        checked = rnd.choice(bidder_ids)
+        top, rank = book_lookup(checked)
+        expected_top, expected_rank = sql_lookup(checked)
+        if [(bid.bidder_id, bid.bid_value) for bid in top] != [tuple(row) for row in expected_top] \
+                or rank != expected_rank:
+            mismatches += 1
+    print(f'{args.bids} bids placed: {order_books.loads - loads} order book reloads, {mismatches} mismatches')
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
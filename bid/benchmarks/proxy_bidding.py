@@ -0,0 +1,169 @@
+"""
+Replay a stream of bids twice on the same seeded catalogue: once as placed by hand, every bid its own transaction,
+and once with automatic bidding, where every bidder registers the highest value they reached in the stream as maximum
+on their first bid and never bids again. Reports transactions, written rows and bid events of both, and whether
+auctions end with the same winners.
+
+Without --stream a bidding war is generated: bidders with private limits outbid the leader by small steps until
+only one of them is left. Streams are JSON lines of {"product_id", "bidder_id", "bid_value"}, e.g. written by
+--save-stream, and refer to users and products of a catalogue seeded with the same options.
+
+    $ python -m benchmarks.proxy_bidding --products 50 --bidders 8
+    $ python -m benchmarks.proxy_bidding --save-stream bids.jsonl
+    $ python -m benchmarks.proxy_bidding --stream bids.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from random import Random
+
+from benchmarks.common import setup_app, seed, count_queries
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def generate_stream(db, bidders, max_step, rnd):
+    """
+    Bids of people raising their bid by hand whenever outbid, until their limit is reached.
+    :param db:
+    :param bidders: bidders per product
+    :param max_step: highest amount a bid is raised by over the highest bid
+    :param rnd:
+    :return: list of dicts (product_id, bidder_id, bid_value) in the order bids are placed
+    """
+    from bid.models import User, Product
+
+    user_ids = [user_id for user_id, in db.session.query(User.id)]
+    auctions = dict()
+    for product_id, owner_id, minimum_bid in db.session.query(Product.id, Product.user_id, Product.minimum_bid):
+        limits = {user_id: int(minimum_bid) + rnd.randrange(10, 2000)
+                  for user_id in rnd.sample([user_id for user_id in user_ids if user_id != owner_id], bidders)}
+        auctions[product_id] = [int(minimum_bid), None, limits]
+
+    stream = list()
+    while auctions:
+        product_id = rnd.choice(list(auctions))
+        highest, leader_id, limits = auctions[product_id]
+        candidates = [user_id for user_id, limit in limits.items() if limit > highest and user_id != leader_id]
+        if not candidates:
+            del auctions[product_id]
+            continue
+
+        bidder_id = rnd.choice(candidates)
+        value = min(limits[bidder_id], highest + rnd.randint(1, max_step))
+        auctions[product_id][:2] = value, bidder_id
+        stream.append({'product_id': product_id, 'bidder_id': bidder_id, 'bid_value': value})
+    return stream
+
+
+def replay(db, stream, automatic):
+    """
+    Place bids of stream on current database.
+    :param db:
+    :param stream: list of dicts (product_id, bidder_id, bid_value)
+    :param automatic: register highest value of each bidder in stream as maximum on first bid, skip later bids
+    :return: dict of results
+    """
+    from flask import current_app
+    from bid.models import Product, BidEvent
+    from bid.utilities.bidding import place_bid, BID_PLACED
+
+    increment = current_app.config.get('BID_INCREMENT', 1)
+
+    maximums = dict()
+    for bid in stream:
+        key = (bid['product_id'], bid['bidder_id'])
+        maximums[key] = max(maximums.get(key, 0), bid['bid_value'])
+
+    placed = rejected = 0
+    registered = set()
+    started = time.perf_counter()
+    with count_queries(db.engine) as statements:
+        for bid in stream:
+            product_id, bidder_id, bid_value = bid['product_id'], bid['bidder_id'], bid['bid_value']
+            max_bid = None
+            if automatic:
+                key = (product_id, bidder_id)
+                if key in registered:
+                    continue
+                registered.add(key)
+                max_bid = maximums[key]
+                # Automatic bids may have raised the highest bid beyond the one this bid was placed over.
+                highest = db.session.query(Product.highest_bid).filter(Product.id == product_id).scalar()
+                if highest is not None and bid_value <= highest:
+                    bid_value = min(max_bid, int(highest) + increment)
+
+            result = place_bid(product_id, bidder_id, bid_value, max_bid=max_bid)
+            if result.status in BID_PLACED:
+                placed += 1
+            else:
+                rejected += 1
+    elapsed = time.perf_counter() - started
+
+    outcomes = {product_id: (leader_id, highest) for product_id, leader_id, highest in
+                db.session.query(Product.id, Product.highest_bidder_id, Product.highest_bid)}
+    return {
+        'transactions': placed,
+        'rejected': rejected,
+        'writes': sum(1 for statement in statements if statement.lstrip().upper().startswith(WRITES)),
+        'events': BidEvent.query.count(),
+        'seconds': elapsed,
+        'outcomes': outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--bidders', type=int, default=8, help='bidders per product of generated stream')
+    parser.add_argument('--max-step', type=int, default=50, help='largest raise of generated bids')
+    parser.add_argument('--stream', metavar='FILE', help='replay bids of JSON lines file instead of generating them')
+    parser.add_argument('--save-stream', metavar='FILE', help='write replayed bids as JSON lines')
+    args = parser.parse_args()
+
+    app, db = setup_app(f'sqlite:///{os.path.join(tempfile.mkdtemp(), "proxy_bidding.db")}')
+    app.config['AUCTION_CLOSER_ENABLED'] = False
+
+    def reseed():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        seed(db, users=args.users, products=args.products, bids_per_product=0)
+
+    reseed()
+    if args.stream:
+        with open(args.stream) as lines:
+            stream = [json.loads(line) for line in lines if line.strip()]
+    else:
+        stream = generate_stream(db, args.bidders, args.max_step, Random(0))
+    if args.save_stream:
+        with open(args.save_stream, 'w') as lines:
+            lines.writelines(json.dumps(bid) + '\n' for bid in stream)
+
+    manual = replay(db, stream, automatic=False)
+    reseed()
+    automatic = replay(db, stream, automatic=True)
+
+    print(f'{len(stream)} bids on {args.products} products:')
+    print(f'{"":<10} {"transactions":>12} {"rejected":>9} {"writes":>8} {"bid events":>11} {"seconds":>8}')
+    for name, result in (('by hand', manual), ('automatic', automatic)):
+        print(f'{name:<10} {result["transactions"]:>12} {result["rejected"]:>9} {result["writes"]:>8} '
+              f'{result["events"]:>11} {result["seconds"]:>8.2f}')
+
+    same_winner = sum(1 for product_id, (leader_id, _) in manual['outcomes'].items()
+                      if automatic['outcomes'][product_id][0] == leader_id)
+    cheaper = sum(1 for product_id, (_, highest) in manual['outcomes'].items()
+                  if highest is not None and automatic['outcomes'][product_id][1] < highest)
+    print(f'writes reduced by {1 - automatic["writes"] / max(manual["writes"], 1):.0%}, '
+          f'same winner on {same_winner}/{len(manual["outcomes"])} products, '
+          f'lower final price on {cheaper} (second highest maximum plus increment)')
+
+    sys.exit(1 if automatic['writes'] >= manual['writes'] else 0)
+
+
+if __name__ == '__main__':
+    main()
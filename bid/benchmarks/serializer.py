@@ -0,0 +1,90 @@
+"""
+Rows per second of model serialization: the former per-row inspecting object_as_dict helper against the
+shared serializer, with every field, a field selection and JSON encoding as done by the API.
+
+    $ python -m benchmarks.serializer --products 20000
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
+
+from benchmarks.common import setup_app, seed
+
+
+def legacy_object_as_dict(obj):
+    """
+    Helper as it was duplicated on User and Product before the shared serializer.
+    """
+    resultant_list = list()
+
+    if isinstance(obj, list):
+        for row in obj:
+            if row:
+                resultant_list.append(
+                    dict(map(lambda c: (c.key, getattr(row, c.key)), inspect(row).mapper.column_attrs))
+                )
+    elif obj:
+        resultant_list.append(dict(map(lambda c: (c.key, getattr(obj, c.key)), inspect(obj).mapper.column_attrs)))
+
+    return resultant_list
+
+
+def measure(func, rows, repeat):
+    """
+    Best rows per second out of repeat runs.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    seed(db, users=100, products=args.products, bids_per_product=0)
+
+    from bid.models import Product
+    from bid.api import product_serializer
+    from bid.utilities.serializer import object_as_dict, serializer_for
+
+    products = Product.query.options(joinedload(Product.owner)).all()
+    columns = serializer_for(Product)
+    fields = ('id', 'product_name', 'highest_bid')
+
+    def stream():
+        for _ in product_serializer.stream(products):
+            pass
+
+    # (name, function, case it is compared to)
+    cases = [
+        ('legacy object_as_dict', lambda: legacy_object_as_dict(products), None),
+        ('object_as_dict', lambda: object_as_dict(products), 'legacy object_as_dict'),
+        ('serializer, all columns', lambda: columns.serialize_many(products), 'legacy object_as_dict'),
+        ('serializer, 3 fields', lambda: columns.serialize_many(products, fields), 'legacy object_as_dict'),
+        ('legacy + json.dumps', lambda: json.dumps(legacy_object_as_dict(products), default=str), None),
+        ('api: dicts + json.dumps', lambda: json.dumps(product_serializer.serialize_many(products)),
+         'legacy + json.dumps'),
+        ('api: streamed JSON', stream, 'legacy + json.dumps'),
+    ]
+
+    rates = dict()
+    print(f'{"case":<26} {"rows/s":>11} {"speedup":>8}')
+    for name, func, baseline in cases:
+        rates[name] = measure(func, len(products), args.repeat)
+        speedup = f'{rates[name] / rates[baseline]:>7.1f}x' if baseline else ''
+        print(f'{name:<26} {rates[name]:>11.0f} {speedup:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Load test of bid update streams: opens thousands of idle server-sent event subscriptions to one product on a
+threaded server, then places bids and measures how long every subscriber waits for each update.
+Client sockets run in the same process as the server, so memory per subscriber is an upper bound.
+The server starts a thread per connection. gunicorn's gthread workers serve as many streams as they have --threads
+and sync workers a single one, size SSE_MAX_STREAMS accordingly.
+
+    $ python -m benchmarks.sse_subscribers --subscribers 2000 --bids 10
+"""
+import argparse
+import logging
+import os
+import resource
+import selectors
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.common import setup_app, seed, login
+
+
+class Subscriber(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.received = list()
+
+    def feed(self, data):
+        self.buffer += data
+        *events, self.buffer = self.buffer.split(b'\n\n')
+        now = time.perf_counter()
+        self.received.extend(now for event in events if event.startswith(b'event: bid'))
+
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def pump(selector, subscribers, events, timeout):
+    """
+    Read streams until every subscriber received given number of bid events.
+    :return: whether all of them did before timeout
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(len(subscriber.received) >= events for subscriber in subscribers):
+            return True
+        for key, _ in selector.select(timeout=0.2):
+            data = key.fileobj.recv(65536)
+            if data:
+                key.data.feed(data)
+            else:
+                selector.unregister(key.fileobj)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--bids', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for deliveries')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.subscribers * 2 + 100:
+        parser.error(f'Open files limit {hard} is too low for {args.subscribers} subscribers.')
+
+    path = os.path.join(tempfile.mkdtemp(), 'sse_subscribers.db')
+    app, db = setup_app(f'sqlite:///{path}', engine_options={'connect_args': {'timeout': 30}})
+    app.config['SSE_HEARTBEAT'] = 5
+    app.config['SSE_MAX_STREAMS'] = args.subscribers
+    seed(db, users=2, products=1, bids_per_product=0)
+
+    from werkzeug.serving import make_server
+    from bid.models import Product, User
+    from bid.utilities.bidding import place_bid
+    from bid.utilities.pubsub import pubsub, product_channel
+
+    product = Product.query.first()
+    bidder = User.query.filter(User.id != product.user_id).first()
+    client = login(app, bidder.email)
+    cookie = next(cookie for cookie in client.cookie_jar if cookie.name == 'session')
+    db.session.remove()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = server.server_address
+
+    request = (f'GET /product/{product.id}/events HTTP/1.1\r\nHost: {address[0]}\r\n'
+               f'Accept: text/event-stream\r\nCookie: session={cookie.value}\r\n\r\n').encode()
+
+    rss_before, threads_before = rss_mb(), threading.active_count()
+    selector = selectors.DefaultSelector()
+    subscribers = list()
+    started = time.perf_counter()
+    for _ in range(args.subscribers):
+        sock = socket.create_connection(address)
+        sock.sendall(request)
+        sock.setblocking(False)
+        subscriber = Subscriber(sock)
+        selector.register(sock, selectors.EVENT_READ, subscriber)
+        subscribers.append(subscriber)
+
+    if not pump(selector, subscribers, 1, args.timeout):
+        raise SystemExit('Not every subscriber received the initial update.')
+
+    connected = pubsub.broker.subscriber_count(product_channel(product.id))
+    print(f'{connected} subscribers connected in {time.perf_counter() - started:.1f}s')
+    print(f'idle cost: {(rss_mb() - rss_before) * 1024 / args.subscribers:.0f} KiB and '
+          f'{(threading.active_count() - threads_before) / args.subscribers:.1f} threads per subscriber')
+
+    latencies = list()
+    deliveries = list()
+    with app.app_context():
+        for number in range(1, args.bids + 1):
+            published = time.perf_counter()
+            place_bid(product.id, bidder.id, product.minimum_bid + number)
+            db.session.remove()
+
+            if not pump(selector, subscribers, number + 1, args.timeout):
+                raise SystemExit(f'Bid {number} was not delivered to every subscriber.')
+            arrivals = [subscriber.received[number] - published for subscriber in subscribers]
+            latencies.extend(arrivals)
+            deliveries.append(max(arrivals))
+
+    latencies.sort()
+    print(f'{args.bids} bids fanned out to {args.subscribers} subscribers: '
+          f'p50 {statistics.median(latencies) * 1000:.1f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms, '
+          f'slowest delivery {max(deliveries) * 1000:.1f} ms')
+
+    selector.close()
+    for subscriber in subscribers:
+        subscriber.sock.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Startup cost of the application: import and create_app() time in fresh interpreters, modules they load, time until
+forked workers of a preloaded application answer their first request and the memory they stop sharing with it,
+and the cost of a new application with its own in-memory database, e.g. one per test.
+Exits with status 1 when importing the application loads a module only some requests need.
+
+    $ python -m benchmarks.startup --runs 5 --apps 50 --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules only loaded by processes using them: pictures, migrations, process pools and request profiling
+HEAVY_MODULES = ('PIL', 'alembic', 'flask_migrate', 'multiprocessing', 'cProfile')
+SETTINGS = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SECRET_KEY': 'benchmark',
+    'TESTING': True,
+    'WTF_CSRF_ENABLED': False,
+    'MAIL_SUPPRESS_SEND': True,
+    'AUCTION_CLOSER_ENABLED': False,
+}
+
+
+def measure_process():
+    """
+    Run in a fresh interpreter by measure_startup(): time import, create_app() and first request.
+    Prints JSON result.
+    """
+    started = time.perf_counter()
+    import bid
+    imported = time.perf_counter()
+    app = bid.create_app(SETTINGS)
+    created = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    with app.app_context():
+        bid.db.create_all()
+    requested = time.perf_counter()
+    status = app.test_client().get('/login').status_code
+    finished = time.perf_counter()
+
+    print(json.dumps({
+        'import_ms': (imported - started) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'first_request_ms': (finished - requested) * 1000,
+        'status': status,
+        'modules': len(sys.modules),
+        'heavy_modules': loaded,
+    }))
+
+
+def measure_startup(runs):
+    """
+    :return: list of results of measure_process(), one per interpreter
+    """
+    results = list()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--measure-process'],
+                                stdout=subprocess.PIPE, check=True).stdout
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+    return results
+
+
+def measure_apps(count):
+    """
+    Create applications with their own in-memory database and serve a request from each, like a test per app.
+    :return: list of milliseconds per application
+    """
+    from bid import create_app, db
+    from bid.models import User
+
+    timings = list()
+    for number in range(count):
+        started = time.perf_counter()
+        app = create_app(SETTINGS)
+        with app.app_context():
+            db.create_all()
+            app.test_client().get('/login')
+            # Every application has a database of its own, nothing is left over from previous ones.
+            assert User.query.count() == 0
+            db.session.add(User(username=f'user{number}', email=f'user{number}@example.com', password='x'))
+            db.session.commit()
+            db.session.remove()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def private_dirty_kb():
+    """
+    Memory written by this process since it was forked, i.e. not shared with its parent anymore.
+    :return: kilobytes or None where /proc/self/smaps_rollup is not available
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def measure_workers(workers, requests, prepare):
+    """
+    Preload application like `gunicorn --preload`, fork workers and let each serve requests.
+    :param workers:
+    :param requests: requests per worker
+    :param prepare: warm_up() and gc.freeze() after preloading, like wsgi.py
+    :return: list of tuples (milliseconds from fork to first response, private dirty kilobytes) per worker
+    """
+    from bid import create_app, warm_up
+
+    app = create_app(SETTINGS)
+    gc.collect()
+    if prepare:
+        warm_up(app)
+        gc.freeze()
+
+    results = list()
+    children = list()
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            client = app.test_client()
+            client.get('/login')
+            ready = time.perf_counter()
+            for _ in range(requests - 1):
+                client.get('/login')
+            gc.collect()
+            os.write(write_end, json.dumps([(ready - forked) * 1000, private_dirty_kb()]).encode())
+            os._exit(0)
+
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    for pid, read_end in children:
+        with os.fdopen(read_end) as pipe:
+            results.append(tuple(json.loads(pipe.read())))
+        os.waitpid(pid, 0)
+
+    if prepare:
+        gc.unfreeze()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters measured')
+    parser.add_argument('--apps', type=int, default=50, help='applications created in one process')
+    parser.add_argument('--workers', type=int, default=4, help='workers forked from preloaded application')
+    parser.add_argument('--requests', type=int, default=50, help='requests per forked worker')
+    parser.add_argument('--measure-process', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_process:
+        measure_process()
+        return
+
+    results = measure_startup(args.runs)
+    print(f'fresh interpreter, median of {args.runs} runs:')
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        print(f'  {key:<18} {statistics.median(result[key] for result in results):>8.1f}')
+    print(f'  {"modules":<18} {results[0]["modules"]:>8}')
+    heavy = sorted({name for result in results for name in result['heavy_modules']})
+    print(f'  heavy modules loaded by import and create_app(): {", ".join(heavy) or "none"}')
+
+    timings = sorted(measure_apps(args.apps))
+    print(f'{args.apps} applications with in-memory databases: p50 {statistics.median(timings):.1f} ms, '
+          f'max {timings[-1]:.1f} ms per create_app() + create_all() + request')
+
+    if hasattr(os, 'fork'):
+        for prepare in (False, True):
+            workers = measure_workers(args.workers, args.requests, prepare)
+            ready = statistics.median(ms for ms, _ in workers)
+            dirty = [kb for _, kb in workers if kb is not None]
+            memory = f', private memory {statistics.median(dirty) / 1024:.1f} MB' if dirty else ''
+            print(f'{args.workers} preloaded workers{" with warm_up() and gc.freeze()" if prepare else ""}: '
+                  f'first response {ready:.1f} ms after fork{memory}')
+
+    sys.exit(1 if heavy else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Signed tokens: verify throughput of serializers built per token, as password reset tokens were verified before,
+against the shared serializers of bid.utilities.tokens. Then authenticated API requests with a bearer token against
+a session cookie, and revocation: once tokens are revoked, the old token and session must be refused and a new token
+accepted.
+Exits with status 1 when a revoked token or session is still accepted.
+
+    $ python -m benchmarks.tokens --verifications 20000 --requests 1000
+"""
+import argparse
+import sys
+import time
+
+from itsdangerous import TimedJSONWebSignatureSerializer, URLSafeTimedSerializer
+
+from benchmarks.common import setup_app, seed, login, count_queries
+
+API_URL = '/api/v1/dashboard'
+
+
+def ops_per_second(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - started)
+
+
+def measure_requests(client, db, count, headers=None):
+    """
+    :return: tuple (requests per second, queries per request)
+    """
+    response = client.get(API_URL, headers=headers)
+    assert response.status_code == 200, response.status_code
+    with count_queries(db.engine) as statements:
+        started = time.perf_counter()
+        for _ in range(count):
+            client.get(API_URL, headers=headers)
+        elapsed = time.perf_counter() - started
+    return count / elapsed, len(statements) / count
+
+
+def check_revocation(app, user):
+    """
+    Revoke tokens of user through the API, with a bearer token and a session issued before.
+    :return: list of descriptions of credentials answered wrongly
+    """
+    client = app.test_client()
+    credentials = {'email': user.email, 'password': 'password'}
+    token = client.post('/api/v1/tokens', json=credentials).get_json()['token']
+    bearer = {'Authorization': f'Bearer {token}'}
+    session = login(app, user.email)
+    assert client.get(API_URL, headers=bearer).status_code == 200
+    assert session.get(API_URL).status_code == 200
+
+    assert client.delete('/api/v1/tokens', headers=bearer).status_code == 204
+    new_token = client.post('/api/v1/tokens', json=credentials).get_json()['token']
+    checks = [
+        ('revoked token', client.get(API_URL, headers=bearer).status_code, 401),
+        ('revoked session', session.get(API_URL).status_code, 401),
+        ('new token', client.get(API_URL, headers={'Authorization': f'Bearer {new_token}'}).status_code, 200),
+    ]
+    return [f'{name}: status {status}, expected {expected}' for name, status, expected in checks if status != expected]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verifications', type=int, default=20000, help='tokens verified by each method')
+    parser.add_argument('--requests', type=int, default=1000, help='API requests of each kind')
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from bid.models import User
+    from bid.utilities.tokens import tokens, AUTH_TOKEN_SALT
+
+    seed(db, users=10, products=100, bids_per_product=5)
+    user = User.query.first()
+    secret_key = app.config['SECRET_KEY']
+
+    with app.test_request_context():
+        reset_token = user.get_reset_token()
+        auth_token = user.get_auth_token()
+        max_age = app.config['AUTH_TOKEN_MAX_AGE']
+        results = [
+            ('reset token, serializer per token', ops_per_second(
+                lambda: TimedJSONWebSignatureSerializer(secret_key).loads(reset_token), args.verifications)),
+            ('reset token, shared serializer', ops_per_second(
+                lambda: tokens.verify_reset_token(reset_token), args.verifications)),
+            ('auth token, serializer per token', ops_per_second(
+                lambda: URLSafeTimedSerializer(secret_key, salt=AUTH_TOKEN_SALT).loads(auth_token, max_age=max_age),
+                args.verifications)),
+            ('auth token, shared serializer', ops_per_second(
+                lambda: tokens.verify_auth_token(auth_token), args.verifications)),
+        ]
+    print(f'{"":<36} {"verifications/s":>16}')
+    for name, rate in results:
+        print(f'{name:<36} {rate:>16.0f}')
+
+    cookie = measure_requests(login(app, user.email), db, args.requests)
+    bearer = measure_requests(app.test_client(), db, args.requests, headers={'Authorization': f'Bearer {auth_token}'})
+    print(f'GET {API_URL}: {"req/s":>8} {"queries/req":>12}')
+    for name, (rate, queries) in (('session cookie', cookie), ('bearer token', bearer)):
+        print(f'{name:<20} {rate:>8.0f} {queries:>12.2f}')
+
+    wrong = check_revocation(app, user)
+    for description in wrong:
+        print(f'FAIL {description}')
+    print('revoked token and session refused, new token accepted' if not wrong else
+          f'{len(wrong)} credentials answered wrongly after revocation')
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Latency of the bidding workflow through the Flask test client: logged in users browse the home listing, open
+products, look at sellers' products and place bids. Reports p50/p99 latency and requests per second per endpoint.
+Save a run as baseline and compare later runs against it to catch regressions before deploy.
+
+    $ python -m benchmarks.workflow --users 200 --products 5000 --bids 10 --requests 2000 --save baseline.json
+    $ python -m benchmarks.workflow --users 200 --products 5000 --bids 10 --requests 2000 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from random import Random
+
+from benchmarks.common import setup_app, seed, login, latency_summary, print_summaries, compare_summaries
+
+# (endpoint, weight) of requests made by a browsing and bidding user
+WORKFLOW = (('home', 40), ('product', 30), ('user_product', 15), ('bid_product', 15))
+
+
+class Workflow(object):
+    """
+    Random requests of the bidding workflow against seeded data. Bids outbid the seeded ones and keep rising.
+    """
+
+    def __init__(self, product_ids, usernames, products_per_page=5, seed_value=0, bid_base=1000000, bid_step=1):
+        self.product_ids = product_ids
+        self.usernames = usernames
+        self.pages = max(1, min(20, len(product_ids) // products_per_page))
+        self.rnd = Random(seed_value)
+        self.endpoints = [endpoint for endpoint, _ in WORKFLOW]
+        self.weights = [weight for _, weight in WORKFLOW]
+        self.bid_value = bid_base
+        self.bid_step = bid_step
+
+    def next_request(self):
+        """
+        :return: tuple (endpoint, method, path, form data or None)
+        """
+        endpoint = self.rnd.choices(self.endpoints, self.weights)[0]
+        if endpoint == 'home':
+            return endpoint, 'GET', f'/?page={self.rnd.randint(1, self.pages)}', None
+        if endpoint == 'product':
+            return endpoint, 'GET', f'/product/{self.rnd.choice(self.product_ids)}', None
+        if endpoint == 'user_product':
+            return endpoint, 'GET', f'/user/{self.rnd.choice(self.usernames)}', None
+
+        self.bid_value += self.bid_step
+        return endpoint, 'POST', f'/bid/product/{self.rnd.choice(self.product_ids)}', {'bid_value': self.bid_value}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--bids', type=int, default=10, help='seeded bids per product')
+    parser.add_argument('--clients', type=int, default=10, help='logged in users taking turns')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100, help='requests made before measuring')
+    parser.add_argument('--save', metavar='FILE', help='write results as JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='exit with status 1 when regressed against baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f'sqlite:///{os.path.join(tempfile.mkdtemp(), "workflow.db")}'
+    app, db = setup_app(database_uri)
+    app.config['AUCTION_CLOSER_ENABLED'] = False
+
+    from bid.models import User, Product
+
+    started = time.perf_counter()
+    db.drop_all()
+    db.create_all()
+    seed(db, users=args.users, products=args.products, bids_per_product=args.bids)
+    print(f'seeded {args.users} users, {args.products} products, {args.products * args.bids} bids '
+          f'in {time.perf_counter() - started:.1f}s')
+
+    users = User.query.order_by(User.id).limit(args.clients).all()
+    clients = [login(app, user.email) for user in users]
+    workflow = Workflow([product_id for product_id, in db.session.query(Product.id)],
+                        [user.username for user in User.query.limit(100)])
+    db.session.remove()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    total = 0.0
+    for number in range(args.warmup + args.requests):
+        client = clients[number % len(clients)]
+        endpoint, method, path, data = workflow.next_request()
+
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        elapsed = time.perf_counter() - request_started
+
+        if number < args.warmup:
+            continue
+        latencies[endpoint].append(elapsed)
+        total += elapsed
+        if response.status_code >= 400:
+            errors[endpoint] += 1
+
+    summaries = {endpoint: dict(latency_summary(values, sum(values)), errors=errors[endpoint])
+                 for endpoint, values in sorted(latencies.items())}
+    summaries['all'] = dict(latency_summary([value for values in latencies.values() for value in values], total),
+                            errors=sum(errors.values()))
+    print_summaries(summaries)
+
+    if args.save:
+        with open(args.save, 'w') as baseline:
+            json.dump(summaries, baseline, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare_summaries(summaries, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions or summaries['all']['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,73 @@
 from flask import Flask
 from flask_mail import Mail
-from flask_bcrypt import Bcrypt
-from flask_migrate import Migrate
 from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-app = Flask(__name__)
-app.config.from_object('config')
+from bid.utilities.database import SQLAlchemy
 
-db = SQLAlchemy(app)
-migrate = Migrate(app=app, db=db)
+# Extensions are bound to applications by create_app(), so any number of applications can share them,
+# e.g. one per test with its own database.
+db = SQLAlchemy()
 
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 
-mail = Mail(app=app)
+mail = Mail()
 
-from bid import views
+
+def create_app(config=None, script_info=None):
+    """
+    Application factory. Creating an application opens no database connection and starts no thread, they are
+    created on first use in the process using them, so a preloading server can fork workers from it.
+    :param config: dict of settings overriding config module, e.g. {'SQLALCHEMY_DATABASE_URI': 'sqlite://'}
+    :param script_info: passed by flask command line, the only place migrations are run from
+    :return: Flask application
+    """
+    app = Flask(__name__)
+    app.config.from_object('config')
+    if config:
+        app.config.update(config)
+
+    if app.config.get('TRUSTED_PROXIES'):
+        # Client address and scheme as seen by the outermost trusted proxy, e.g. for rate limits per ip.
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    mail.init_app(app)
+
+    if script_info is not None:
+        # Alembic takes longer to import than the rest of the application, web workers never need it.
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from bid.utilities import cache, fragments, images, hashing, mailer, pubsub, ratelimit, auctions, metrics, \
+        orderbook, tokens
+    for extension in (cache, fragments, images, hashing, mailer, pubsub, ratelimit, auctions, metrics, orderbook,
+                      tokens):
+        extension.init_app(app)
+
+    from bid.views import main
+    from bid.api import api, API_PREFIX
+    from bid.commands import commands
+    app.register_blueprint(main)
+    app.register_blueprint(api, url_prefix=API_PREFIX)
+    app.register_blueprint(commands)
+
+    return app
+
+
+def warm_up(app):
+    """
+    Do the work every worker would otherwise repeat on its first requests, before a preloading server forks them:
+    compile templates and configure mappers. Workers share the result with the master process.
+    :param app:
+    :return:
+    """
+    from sqlalchemy.orm import configure_mappers
+
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+    configure_mappers()
@@ -0,0 +1,332 @@
+from functools import wraps
+from logging import error
+
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
+from flask_login import current_user
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import HTTPException
+
+from bid import db
+from bid.models import Product, BidEvent, User
+from bid.utilities.bidding import place_bid, BID_ACCEPTED, BID_OUTBID, BID_NOT_FOUND, BID_RETRY, BID_PLACED
+from bid.utilities.categories import category_tree, find_category
+from bid.utilities.dashboard import dashboard_summary, active_bids, seller_stats
+from bid.utilities.listing import keyset_listing, home_listing_query, browse_category, BROWSE_SORTS
+from bid.utilities.orderbook import leaderboard
+from bid.utilities.serializer import ModelSerializer, stream_rows
+from bid.utilities.hashing import hasher
+from bid.utilities.ratelimit import rate_limit
+
+API_PREFIX = '/api/v1'
+MAX_PER_PAGE = 100
+
+# Registered under API_PREFIX by create_app()
+api = Blueprint('api', __name__)
+
+product_serializer = ModelSerializer(Product, extra={'owner': lambda product: product.owner.username})
+# Bid history. Notes and maximum bids, private to their bidder, are kept on Bidder only.
+bid_serializer = ModelSerializer(BidEvent)
+
+BID_STATUS_CODES = {
+    BID_ACCEPTED: 201,
+    BID_OUTBID: 201,
+    BID_NOT_FOUND: 404,
+    BID_RETRY: 503,
+}
+
+
+def api_error(status_code, message, **extra):
+    """
+    JSON error response.
+    :param status_code:
+    :param message:
+    :param extra: additional keys of response body
+    :return:
+    """
+    response = jsonify(dict(extra, error=message))
+    response.status_code = status_code
+    return response
+
+
+def api_login_required(func):
+    """
+    Like login_required, but answers anonymous requests with 401 instead of redirecting to login page.
+    """
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return api_error(401, 'Authentication required.')
+        return func(*args, **kwargs)
+
+    return decorated_view
+
+
+def selected_fields(serializer):
+    """
+    Fields requested with ?fields=a,b,c, every field when absent.
+    :param serializer:
+    :return:
+    """
+    try:
+        return serializer.select(request.args.get('fields'))
+    except ValueError as e:
+        raise InvalidFields(str(e))
+
+
+class InvalidFields(Exception):
+    pass
+
+
+@api.errorhandler(InvalidFields)
+def invalid_fields(e):
+    return api_error(400, str(e))
+
+
+@api.app_errorhandler(HTTPException)
+def http_error(e):
+    """
+    HTTP errors of API requests as JSON, other requests get usual error pages.
+    """
+    if request.path.startswith(API_PREFIX + '/'):
+        response = api_error(e.code, e.description)
+        if getattr(e, 'retry_after', None):
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return e
+
+
+@api.route('/products')
+@api_login_required
+def api_products():
+    """
+    Products open for bidding, newest first, paginated by cursor.
+    Query parameters: cursor, per_page (at most 100), fields.
+    :return:
+    """
+    fields = selected_fields(product_serializer)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), MAX_PER_PAGE))
+    page = keyset_listing(home_listing_query(), cursor=request.args.get('cursor'), per_page=per_page,
+                          strategy='denormalized')
+
+    return jsonify({
+        'items': product_serializer.serialize_many(page.items, fields),
+        'next_cursor': page.next_cursor if page.has_next else None,
+        'prev_cursor': page.prev_cursor if page.has_prev else None
+    })
+
+
+def category_json(node):
+    """
+    :param node: CategoryNode
+    :return: dict of category with its subcategories
+    """
+    return {
+        'id': node.id,
+        'name': node.name,
+        'active_count': node.active_count,
+        'total': node.total,
+        'children': [category_json(child) for child in node.children]
+    }
+
+
+@api.route('/categories')
+@api_login_required
+def api_categories():
+    """
+    Category tree. Active auction counts of categories and totals including subcategories lag at most
+    CATEGORY_CACHE_TTL seconds behind.
+    :return:
+    """
+    return jsonify({'items': [category_json(node) for node in category_tree().roots]})
+
+
+@api.route('/categories/<int:category_id>/products')
+@api_login_required
+def api_category_products(category_id):
+    """
+    Products of category and its subcategories open for bidding, paginated by cursor.
+    Query parameters: sort (ending or highest), cursor, per_page (at most 100), fields.
+    :param category_id:
+    :return:
+    """
+    fields = selected_fields(product_serializer)
+    sort = request.args.get('sort', 'ending')
+    if sort not in BROWSE_SORTS:
+        return api_error(400, f'Unknown sort, expected one of: {", ".join(BROWSE_SORTS)}.')
+    node = find_category(category_id)
+    if node is None:
+        return api_error(404, 'Category not found.')
+
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), MAX_PER_PAGE))
+    page = browse_category(node, sort, cursor=request.args.get('cursor'), per_page=per_page)
+
+    return jsonify({
+        'items': product_serializer.serialize_many(page.items, fields),
+        'next_cursor': page.next_cursor
+    })
+
+
+@api.route('/products/<int:product_id>')
+@api_login_required
+def api_product(product_id):
+    """
+    Product details.
+    :param product_id:
+    :return:
+    """
+    fields = selected_fields(product_serializer)
+    product = Product.query.options(joinedload(Product.owner)).filter(Product.id == product_id).first_or_404()
+
+    return jsonify(product_serializer.serialize(product, fields))
+
+
+@api.route('/products/<int:product_id>/bids')
+@api_login_required
+def api_product_bids(product_id):
+    """
+    Bid history of product, every accepted bid in the order placed, streamed as JSON array however many there are.
+    Current bid of every bidder is served by the leaderboard.
+    :param product_id:
+    :return:
+    """
+    fields = selected_fields(bid_serializer)
+    Product.query.get_or_404(product_id)
+
+    bids = BidEvent.query \
+        .filter(BidEvent.product_id == product_id) \
+        .order_by(BidEvent.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(1000)
+
+    return Response(stream_with_context(bid_serializer.stream(bids, fields)), mimetype='application/json')
+
+
+@api.route('/products/<int:product_id>/leaderboard')
+@api_login_required
+def api_product_leaderboard(product_id):
+    """
+    Highest current bids of product and rank of current user's bid, served from the in-memory order book.
+    Query parameters: count (at most 100).
+    :param product_id:
+    :return:
+    """
+    count = max(1, min(request.args.get('count', 10, type=int), MAX_PER_PAGE))
+    product = Product.query.get_or_404(product_id)
+    top_bids, my_rank = leaderboard(product, bidder_id=current_user.id, count=count)
+
+    return jsonify({
+        'highest_bid': str(top_bids[0].bid_value) if top_bids else None,
+        'items': [{'bidder_id': bid.bidder_id, 'bid_value': str(bid.bid_value)} for bid in top_bids],
+        'my_rank': my_rank
+    })
+
+
+@api.route('/dashboard')
+@api_login_required
+def api_dashboard():
+    """
+    Totals of current user's bids and products, cached.
+    :return:
+    """
+    return jsonify(dashboard_summary(current_user.id))
+
+
+@api.route('/dashboard/bids')
+@api_login_required
+def api_dashboard_bids():
+    """
+    Active bids of current user, ending soonest first, with status 'winning' or 'outbid'. Streamed as JSON array.
+    :return:
+    """
+    return Response(stream_with_context(stream_rows(active_bids(current_user.id))), mimetype='application/json')
+
+
+@api.route('/dashboard/products')
+@api_login_required
+def api_dashboard_products():
+    """
+    Products of current user, newest first, with their total bids, top bid and number of bidders. Streamed as JSON
+    array.
+    :return:
+    """
+    return Response(stream_with_context(stream_rows(seller_stats(current_user.id))), mimetype='application/json')
+
+
+@api.route('/products/<int:product_id>/bids', methods=['POST'])
+@api_login_required
+@rate_limit()
+def api_place_bid(product_id):
+    """
+    Place or raise bid of current user.
+    Body: {"bid_value": <integer>, "max_bid": <integer to bid automatically up to, optional>, "note": <text, optional>}.
+    Status of response body is "outbid" when the bid was placed, but an automatic bid of the leader outbid it.
+    Only JSON bodies are accepted, which browsers do not send cross-site without CORS approval.
+    :param product_id:
+    :return:
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return api_error(415, 'Expected a JSON object with application/json content type.')
+
+    bid_value = data.get('bid_value')
+    note = data.get('note')
+    if not isinstance(bid_value, int) or isinstance(bid_value, bool) or bid_value <= 0:
+        return api_error(400, 'bid_value must be a positive integer.')
+    if note is not None and (not isinstance(note, str) or len(note) > 500):
+        return api_error(400, 'note must be text of at most 500 characters.')
+    max_bid = data.get('max_bid')
+    if max_bid is not None and (not isinstance(max_bid, int) or isinstance(max_bid, bool) or max_bid < bid_value):
+        return api_error(400, 'max_bid must be an integer not lower than bid_value.')
+
+    try:
+        result = place_bid(product_id, current_user.id, bid_value, note, max_bid=max_bid)
+    except Exception as e:
+        error(str(e), exc_info=True)
+        return api_error(500, 'Bid could not be placed.')
+
+    if result.status not in BID_PLACED:
+        return api_error(BID_STATUS_CODES.get(result.status, 409), result.message, status=result.status)
+
+    product = Product.query.options(joinedload(Product.owner)).get(product_id)
+    response = jsonify({'status': result.status, 'message': result.message,
+                        'product': product_serializer.serialize(product)})
+    response.status_code = BID_STATUS_CODES[result.status]
+    return response
+
+
+@api.route('/tokens', methods=['POST'])
+@rate_limit()
+def api_create_token():
+    """
+    Signed token for clients without session cookie, sent as 'Authorization: Bearer <token>'. Requests carrying it
+    are authenticated without reading the session or, while the user is cached, the database.
+    Body: {"email": <text>, "password": <text>}.
+    :return:
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return api_error(415, 'Expected a JSON object with application/json content type.')
+
+    email, password = data.get('email'), data.get('password')
+    if not isinstance(email, str) or not isinstance(password, str):
+        return api_error(400, 'email and password are required.')
+
+    user = User.query.filter_by(email=email).first()
+    if user is None or not hasher.check_password_hash(user.password, password):
+        return api_error(401, 'Invalid email or password.')
+
+    response = jsonify({'token': user.get_auth_token(), 'expires_in': current_app.config['AUTH_TOKEN_MAX_AGE']})
+    response.status_code = 201
+    return response
+
+
+@api.route('/tokens', methods=['DELETE'])
+@api_login_required
+def api_revoke_tokens():
+    """
+    Revoke every token and session of current user, including the token of this request.
+    :return:
+    """
+    current_user.revoke_tokens()
+    db.session.commit()
+    return '', 204
@@ -0,0 +1,142 @@
+import click
+
+import os
+
+from flask import Blueprint
+
+from bid.models import User
+from bid.utilities.bidding import reconcile_bid_aggregates
+from bid.utilities.auctions import close_due_auctions
+from bid.utilities.categories import reconcile_category_counts
+from bid.utilities.explain import view_queries, explain
+from bid.utilities.bulk import import_products, directory_pictures, export_query, export_rows, format_of, FORMATS
+from bid.utilities.images import pipeline
+
+# Commands are added to the flask command itself, e.g. `flask close-auctions`
+commands = Blueprint('commands', __name__, cli_group=None)
+
+
+@commands.cli.command('reconcile-bids')
+@click.option('--batch-size', default=500, show_default=True, help='Number of products per transaction.')
+def reconcile_bids(batch_size):
+    """
+    Backfill or repair denormalized bid aggregates on products.
+    :param batch_size:
+    :return:
+    """
+    corrected = reconcile_bid_aggregates(batch_size=batch_size)
+    click.echo(f'Bid aggregates corrected for {corrected} product(s).')
+
+
+@commands.cli.command('reconcile-categories')
+def reconcile_categories():
+    """
+    Assign categories to products without one and repair active auction counts of categories.
+    :return:
+    """
+    corrected = reconcile_category_counts()
+    click.echo(f'Active counts corrected for {corrected} categories.')
+
+
+@commands.cli.command('close-auctions')
+@click.option('--batch-size', default=500, show_default=True, help='Number of auctions per transaction.')
+def close_auctions(batch_size):
+    """
+    Close auctions past their deadline, e.g. from cron when the background closer is disabled.
+    :param batch_size:
+    :return:
+    """
+    closed = close_due_auctions(batch_size=batch_size)
+    click.echo(f'Closed {closed} auction(s).')
+
+
+@commands.cli.command('explain-queries')
+@click.pass_context
+def explain_queries(ctx):
+    """
+    Check with EXPLAIN that every hot path query of views is served by an index.
+    Exits with status 1 when a query reads a whole table.
+    :param ctx:
+    :return:
+    """
+    failed = False
+    for name, query in view_queries():
+        uses_index, plan = explain(query)
+        failed = failed or not uses_index
+        click.echo(f'[{"OK" if uses_index else "FULL SCAN"}] {name}')
+        for line in plan:
+            click.echo(f'    {line}')
+
+    if failed:
+        ctx.exit(1)
+
+
+def _find_user(user):
+    """
+    User by username or email, aborts command when there is none.
+    :param user:
+    :return:
+    """
+    found = User.query.filter((User.username == user) | (User.email == user)).first()
+    if found is None:
+        raise click.BadParameter(f'No user {user}.', param_hint='--user')
+    return found
+
+
+@commands.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', required=True, help='Username or email of seller.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to file extension.')
+@click.option('--pictures-dir', type=click.Path(exists=True, file_okay=False),
+              help='Directory of pictures named in rows, defaults to directory of file.')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of products per transaction.')
+def import_products_command(path, user, fmt, pictures_dir, batch_size):
+    """
+    Add products of a seller from CSV or JSON lines file, validated like the add product form.
+    :param path:
+    :param user:
+    :param fmt:
+    :param pictures_dir:
+    :param batch_size:
+    :return:
+    """
+    seller = _find_user(user)
+    open_picture = directory_pictures(pictures_dir or os.path.dirname(os.path.abspath(path)))
+
+    with open(path, 'rb') as stream:
+        result = import_products(stream, fmt or format_of(path, 'csv'), seller.id, open_picture=open_picture,
+                                 batch_size=batch_size)
+
+    for line, messages in result.errors:
+        click.echo(f'Line {line}: {"; ".join(messages)}', err=True)
+    click.echo(f'Imported {result.imported} product(s), skipped {result.failed} row(s). Generating pictures...')
+    pipeline.drain()
+
+
+@commands.cli.command('export-products')
+@click.option('--user', required=True, help='Username or email of seller.')
+@click.option('--data', type=click.Choice(('products', 'bids')), default='products', show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='jsonl', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='Defaults to standard output.')
+def export_products_command(user, data, fmt, output):
+    """
+    Write products of a seller, or bids on them, as CSV or JSON lines.
+    :param user:
+    :param data:
+    :param fmt:
+    :param output:
+    :return:
+    """
+    query, serializer = export_query(_find_user(user).id, data)
+    for chunk in export_rows(query, serializer, fmt):
+        output.write(chunk)
+
+
+@commands.cli.command('move-originals')
+def move_originals():
+    """
+    Move uploaded pictures stored under the static folder by earlier versions out of it, to IMAGE_ORIGINALS_DIR.
+    :return:
+    """
+    moved = pipeline.move_legacy_originals()
+    click.echo(f'Moved {moved} original(s) to {pipeline.originals_dir}.')
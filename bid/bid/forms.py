@@ -2,10 +2,15 @@ from datetime import date
 from flask_wtf import FlaskForm
 from wtforms.fields.html5 import DateField
 from flask_wtf.file import FileAllowed, FileField, FileRequired
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, ValidationError, IntegerField, TextAreaField
-from wtforms.validators import DataRequired, Length, Email, EqualTo
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, ValidationError, IntegerField, TextAreaField, \
+    MultipleFileField
+from wtforms.validators import DataRequired, Length, Email, EqualTo, Optional
 
 from bid.models import User
+from bid.utilities.utilities import normalize_category
+
+PICTURE_EXTENSIONS = ['jpg', 'jpeg', 'png']
+IMPORT_EXTENSIONS = ['csv', 'jsonl', 'ndjson', 'json']
 
 
 class RegistrationForm(FlaskForm):
@@ -66,14 +71,17 @@ class AddProductForm(FlaskForm):
     Add new product.
     """
 
-    product_name = StringField('Product Name', validators=[DataRequired(message='Must provide product name.')])
-    product_description = TextAreaField('Product Description')
-    category = StringField('Category', validators=[DataRequired(message='Must provide product category.')])
+    product_name = StringField('Product Name', validators=[DataRequired(message='Must provide product name.'),
+                                                           Length(max=100)])
+    product_description = TextAreaField('Product Description', validators=[Length(max=550)])
+    category = StringField('Category', validators=[DataRequired(message='Must provide product category.'),
+                                                   Length(max=50)],
+                           filters=[normalize_category])
     minimum_bid = IntegerField('Minimum Bidding', validators=[DataRequired(message='Enter minimum bidding amount.')])
     last_date_to_bid = DateField('Last Date To Bid', validators=[
         DataRequired(message='Enter last date to bid on product.')
     ])
-    picture = FileField('Add picture', validators=[FileRequired(), FileAllowed(['jpg', 'jpeg', 'png'])])
+    picture = FileField('Add picture', validators=[FileRequired(), FileAllowed(PICTURE_EXTENSIONS)])
     submit = SubmitField('Submit')
 
     def validate_last_date_to_bid(self, *args, **kwargs):
@@ -81,11 +89,34 @@ class AddProductForm(FlaskForm):
             raise ValueError('Last date must be from future.')
 
 
+class ProductRowForm(AddProductForm):
+    """
+    Rules of AddProductForm for rows of bulk imports, their pictures are named in rows instead of uploaded.
+    """
+    picture = None
+    submit = None
+
+
+class ImportProductsForm(FlaskForm):
+    """
+    Add many products at once from CSV or JSON lines file, rows are validated like AddProductForm.
+    """
+    products_file = FileField('Products file (CSV or JSON lines)',
+                              validators=[FileRequired(), FileAllowed(IMPORT_EXTENSIONS)])
+    pictures = MultipleFileField('Pictures named in picture column')
+    submit = SubmitField('Import')
+
+
 class ApplyBid(FlaskForm):
     """
     Start bidding on product.
     """
     bid_value = IntegerField('Bidding Amount',
                              validators=[DataRequired(message='Must provide amount to apply bidding!')])
+    max_bid = IntegerField('Maximum Bid (bid automatically up to)', validators=[Optional()])
     note = TextAreaField('Note')
     submit = SubmitField('Apply')
+
+    def validate_max_bid(self, max_bid):
+        if self.bid_value.data is not None and max_bid.data < self.bid_value.data:
+            raise ValidationError('Maximum bid must not be lower than bidding amount.')
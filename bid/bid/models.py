@@ -1,13 +1,86 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, Integer, ForeignKey, inspect, String, BigInteger, DECIMAL
-from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from bid import db, login_manager, app
+from collections import namedtuple
+from sqlalchemy import Column, DateTime, Integer, ForeignKey, String, BigInteger, DECIMAL, event
+from sqlalchemy.orm import make_transient_to_detached
+from bid import db, login_manager
 from flask_login import UserMixin
+from bid.utilities.cache import user_cache
+from bid.utilities.tokens import tokens, RESET_TOKEN_EXPIRES
+from bid.utilities.serializer import object_as_dict
+
+
+BidStats = namedtuple('BidStats', ['highest_bid', 'bid_count'])
 
 
 @login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+def load_user(session_id):
+    """
+    Load user of current session, from user cache when possible.
+    :param session_id: user id and token version, see User.get_id()
+    :return: None when session was revoked
+    """
+    user_id, _, version = session_id.partition('.')
+    # Sessions started before token versions existed carry the user id only.
+    return _load_user(int(user_id), int(version) if version else 1)
+
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    """
+    Load user of signed token sent as 'Authorization: Bearer <token>', for API clients without a session.
+    Token is verified by its signature and, when user is cached, without database.
+    :param request:
+    :return: None without valid token
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+
+    claims = tokens.verify_auth_token(token.strip())
+    return _load_user(*claims) if claims is not None else None
+
+
+def _load_user(user_id, version):
+    """
+    User with given token version, from user cache when possible.
+    :return: None when there is no such user or its tokens were revoked since
+    """
+    data = user_cache.get(user_id)
+
+    if data is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            user_cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
+        return user if user is not None and user.token_version == version else None
+
+    if data['token_version'] != version:
+        return None
+    user = User()
+    for key, value in data.items():
+        setattr(user, key, value)
+    # Attach cached state to the session as if it was loaded from database, without querying it.
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    """
+    Remember users changed in transaction, their cache entries are dropped once it commits.
+    """
+    changed = session.info.setdefault('changed_user_ids', set())
+    changed.update(obj.id for obj in session.dirty | session.deleted if isinstance(obj, User))
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.delete(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
 
 
 class User(db.Model, UserMixin):
@@ -18,6 +91,8 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
+    # Signed tokens and sessions carry the version they were issued for, bumping it revokes them all
+    token_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     products = db.relationship('Product', backref='owner', lazy=True)
 
     def __init__(self, **kwargs):
@@ -25,61 +100,98 @@ class User(db.Model, UserMixin):
         self.email = kwargs.get('email')
         self.password = kwargs.get('password')
 
-    def get_reset_token(self, expires_sec=1800):
-        s = Serializer(app.config['SECRET_KEY'], expires_sec)
-        return s.dumps({'user_id': self.id}).decode('utf-8')
+    def get_id(self):
+        """
+        Session identifier, carries token version so revoking tokens ends sessions as well.
+        :return:
+        """
+        return f'{self.id}.{self.token_version}'
+
+    def get_reset_token(self, expires_sec=RESET_TOKEN_EXPIRES):
+        return tokens.reset_token(self.id, self.token_version, expires_sec)
 
     @staticmethod
     def verify_reset_token(token):
-        s = Serializer(app.config['SECRET_KEY'])
-        try:
-            user_id = s.loads(token)['user_id']
-        except Exception as e:
-            print(e)
+        claims = tokens.verify_reset_token(token)
+        if claims is None:
             return None
-        return User.query.get(user_id)
-
-    def __repr__(self):
-        return f"User('{self.username}', '{self.email}', '{self.id})"
+        user_id, version = claims
+        user = User.query.get(user_id)
+        # Tokens are single use: changing the password revokes them.
+        if user is None or (version is not None and version != user.token_version):
+            return None
+        return user
 
-    @staticmethod
-    def object_as_dict(obj):
+    def get_auth_token(self):
         """
-        Inspect model object and return it as dictionary.
-        :param obj: list of dicts
+        Signed API token of user, valid for AUTH_TOKEN_MAX_AGE seconds or until revoke_tokens().
         :return:
         """
+        return tokens.auth_token(self.id, self.token_version)
 
-        resultant_list = list()
+    def revoke_tokens(self):
+        """
+        Invalidate every API token, session and password reset token of user once the transaction commits.
+        Processes which cached the user notice at the latest after USER_CACHE_TTL seconds.
+        :return:
+        """
+        self.token_version = User.token_version + 1
 
-        if isinstance(obj, list):
-            for row in obj:
-                if row:
-                    resultant_list.append(
-                        dict(map(lambda c: (c.key, getattr(row, c.key)), inspect(row).mapper.column_attrs))
-                    )
-        elif obj:
-            resultant_list.append(dict(map(lambda c: (c.key, getattr(obj, c.key)), inspect(obj).mapper.column_attrs)))
+    def __repr__(self):
+        return f"User('{self.username}', '{self.email}', '{self.id})"
 
-        return resultant_list
+    object_as_dict = staticmethod(object_as_dict)
 
 
 class Product(db.Model):
     """
     Model to add product for current user
     """
+    __table_args__ = (
+        # Newest first listings and keyset pagination on (post_created, id).
+        db.Index('ix_product_post_created_id', 'post_created', 'id'),
+        # Products of a user, newest first.
+        db.Index('ix_product_user_id_post_created_id', 'user_id', 'post_created', 'id'),
+        # Listing filter on products still open for bidding.
+        db.Index('ix_product_last_date_to_bid', 'last_date_to_bid'),
+        # Deadlines of auctions not closed yet, in closing order.
+        db.Index('ix_product_closed_at_last_date_to_bid', 'closed_at', 'last_date_to_bid', 'id'),
+        # Category browsing: open auctions of a category ending soonest, and with highest bid.
+        db.Index('ix_product_category_id_closed_at_last_date_to_bid', 'category_id', 'closed_at', 'last_date_to_bid',
+                 'id'),
+        db.Index('ix_product_category_id_closed_at_highest_bid', 'category_id', 'closed_at', 'highest_bid', 'id'),
+    )
+
     id = Column(Integer, nullable=False, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     product_name = Column(String(100), nullable=False)
     product_description = Column(String(550))
     category = Column(String(50), nullable=False)
+    # Category row of category name, see bid.utilities.categories
+    category_id = Column(Integer, nullable=True)
     minimum_bid = Column(BigInteger, nullable=False)
-    post_created = Column(DateTime, default=datetime.now().replace(microsecond=0))
-    last_updated = Column(DateTime, default=datetime.now().replace(microsecond=0))
-    last_date_to_bid = Column(DateTime, default=datetime.now().replace(microsecond=0))
+    # Defaults are called for every insert, not once at import.
+    post_created = Column(DateTime, default=lambda: datetime.now().replace(microsecond=0))
+    last_updated = Column(DateTime, default=lambda: datetime.now().replace(microsecond=0))
+    last_date_to_bid = Column(DateTime, default=lambda: datetime.now().replace(microsecond=0))
     bids = db.relationship('Bidder', backref='product', lazy=True, cascade='all,delete,delete-orphan')
     picture = Column(String(1600), nullable=False, default='default.png')
 
+    # Denormalized bid aggregates, maintained by bid.utilities.bidding on every bid write.
+    highest_bid = Column(DECIMAL, nullable=True)
+    highest_bidder_id = Column(Integer, nullable=True)
+    bid_count = Column(Integer, nullable=False, default=0, server_default='0')
+
+    # Set once when auction is closed by bid.utilities.auctions, no bids are accepted afterwards.
+    closed_at = Column(DateTime, nullable=True)
+    winner_id = Column(Integer, nullable=True)
+    final_price = Column(DECIMAL, nullable=True)
+
+    # Bumped on every update, concurrent writes based on a stale read fail with StaleDataError.
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
     def __init__(self, **kwargs):
         self.user_id = kwargs.get('user_id')
         self.product_name = kwargs.get('product_name')
@@ -90,40 +202,87 @@ class Product(db.Model):
         self.last_date_to_bid = kwargs.get('last_date_to_bid')
         self.picture = kwargs.get('picture')
 
-    @staticmethod
-    def object_as_dict(obj):
+    @property
+    def bid_stats(self):
         """
-        Inspect model object and return it as dictionary.
-        :param obj: list of dicts
-        :return:
+        Highest bid and bid count of product. Listing queries may attach stats computed while loading the page,
+        otherwise denormalized columns are used.
+        :return: BidStats
         """
+        stats = self.__dict__.get('_bid_stats')
+        if stats is None:
+            stats = BidStats(self.highest_bid, self.bid_count or 0)
+        return stats
+
+    object_as_dict = staticmethod(object_as_dict)
 
-        resultant_list = list()
 
-        if isinstance(obj, list):
-            for row in obj:
-                if row:
-                    resultant_list.append(
-                        dict(map(lambda c: (c.key, getattr(row, c.key)), inspect(row).mapper.column_attrs))
-                    )
-        elif obj:
-            resultant_list.append(dict(map(lambda c: (c.key, getattr(obj, c.key)), inspect(obj).mapper.column_attrs)))
+class Category(db.Model):
+    """
+    Category of products, named by normalized category of products. Name 'Electronics / Cameras' is a subcategory
+    of 'Electronics'.
+    """
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(50), unique=True, nullable=False)
+    parent_id = Column(Integer, ForeignKey('category.id'), nullable=True)
+    # Products of this category not closed yet, excluding subcategories. Maintained by bid.utilities.categories
+    # on every product add, update, delete and auction closing.
+    active_count = Column(Integer, nullable=False, default=0, server_default='0')
 
-        return resultant_list
+    def __init__(self, **kwargs):
+        self.name = kwargs.get('name')
+        self.parent_id = kwargs.get('parent_id')
+        self.active_count = kwargs.get('active_count', 0)
 
 
 class Bidder(db.Model):
     """
     Model to apply bidding on product by current user
     """
+    __table_args__ = (
+        # One bid row per user and product, also serves lookups of bids by product.
+        db.UniqueConstraint('product_id', 'bidders_id', name='uq_bidder_product_id_bidders_id'),
+        # Bids of a user, listed on their dashboard.
+        db.Index('ix_bidder_bidders_id_product_id', 'bidders_id', 'product_id'),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     bidders_id = Column(Integer, nullable=False)
     product_id = Column(Integer, ForeignKey('product.id'), nullable=False)
     bid_value = Column(DECIMAL, nullable=False, default=0)
     note = Column(String(500))
+    # Value bid_value is raised up to automatically when outbid, private to its bidder like note
+    max_bid = Column(DECIMAL)
 
     def __init__(self, **kwargs):
         self.bidders_id = kwargs.get('bidders_id')
         self.product_id = kwargs.get('product_id')
         self.bid_value = kwargs.get('bid_value')
         self.note = kwargs.get('note')
+        self.max_bid = kwargs.get('max_bid')
+
+
+class BidEvent(db.Model):
+    """
+    Append-only history of bids, one row per accepted bid. Bidder holds the current bid of every user,
+    events keep every value it had.
+    """
+    __tablename__ = 'bid_event'
+    __table_args__ = (
+        # History of product in order.
+        db.Index('ix_bid_event_product_id_id', 'product_id', 'id'),
+        # Latest event of every bidder of product, read when order books are loaded.
+        db.Index('ix_bid_event_product_id_bidder_id_id', 'product_id', 'bidder_id', 'id'),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey('product.id'), nullable=False)
+    bidder_id = Column(Integer, nullable=False)
+    bid_value = Column(DECIMAL, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    def __init__(self, **kwargs):
+        self.product_id = kwargs.get('product_id')
+        self.bidder_id = kwargs.get('bidder_id')
+        self.bid_value = kwargs.get('bid_value')
+        self.created_at = kwargs.get('created_at', datetime.now().replace(microsecond=0))
@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from logging import error
+
+from flask import current_app
+from sqlalchemy import func
+from werkzeug.local import LocalProxy
+
+from bid import db
+from bid.models import Product, User, Bidder
+from bid.utilities.notifications import send_auction_won_email
+from bid.utilities.categories import adjust_active_counts
+from bid.utilities.cache import dashboard_cache
+from bid.utilities.pubsub import pubsub, product_channel, bid_update
+
+# Last date to bid is a calendar day, auction stays open until that day is over.
+CLOSING_DELAY = timedelta(days=1)
+
+
+def closing_cutoff(now=None):
+    """
+    Auctions with last date to bid before cutoff are over.
+    :param now:
+    :return:
+    """
+    return (now or datetime.now()).replace(microsecond=0) - CLOSING_DELAY
+
+
+def is_closed(product, now=None):
+    """
+    Whether product no longer accepts bids, closed or past its deadline but not closed yet.
+    :param product:
+    :param now:
+    :return:
+    """
+    return product.closed_at is not None or product.last_date_to_bid < closing_cutoff(now)
+
+
+def due_auctions_query(now=None):
+    """
+    Auctions past their deadline which are not closed yet, in closing order. Served by
+    ix_product_closed_at_last_date_to_bid, so only due rows are read however many auctions were closed before.
+    :param now:
+    :return:
+    """
+    return Product.query \
+        .filter(Product.closed_at.is_(None), Product.last_date_to_bid < closing_cutoff(now)) \
+        .order_by(Product.last_date_to_bid, Product.id)
+
+
+def close_due_auctions(batch_size=500, now=None):
+    """
+    Close every auction past its deadline, one transaction per batch. Winner and final price are taken from
+    highest bid. Closing bumps product version, so bids racing with it fail version check, are retried and
+    rejected as closed.
+    :param batch_size: auctions per transaction
+    :param now:
+    :return: number of auctions closed
+    """
+    now = (now or datetime.now()).replace(microsecond=0)
+    closed = 0
+
+    while True:
+        products = _close_batch(batch_size, now)
+        _notify_closed(products)
+        closed += len(products)
+
+        if len(products) < batch_size:
+            return closed
+
+
+def _close_batch(batch_size, now):
+    """
+    Lock a batch of due auctions and close them with one UPDATE.
+    Concurrent closers wait on row locks and skip auctions closed meanwhile.
+    :return: closed products, detached from session
+    """
+    try:
+        products = due_auctions_query(now).limit(batch_size).with_for_update().all()
+        if not products:
+            db.session.commit()
+            return products
+
+        Product.query.filter(Product.id.in_([product.id for product in products]), Product.closed_at.is_(None)) \
+            .update({
+                Product.closed_at: now,
+                Product.winner_id: Product.highest_bidder_id,
+                Product.final_price: Product.highest_bid,
+                Product.version: Product.version + 1
+            }, synchronize_session=False)
+
+        closed_per_category = Counter(product.category_id for product in products)
+        adjust_active_counts({category_id: -count for category_id, count in closed_per_category.items()})
+        # Detached products keep their loaded state for notifications instead of being reloaded one by one.
+        for product in products:
+            db.session.expunge(product)
+            product.closed_at = now
+            product.winner_id = product.highest_bidder_id
+            product.final_price = product.highest_bid
+
+        db.session.commit()
+        return products
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _notify_closed(products):
+    """
+    Invalidate cached dashboards of sellers and bidders, push final state to product pages and
+    congratulate winners.
+    :param products: closed products
+    :return:
+    """
+    # Winners loaded with one query, send_auction_won_email finds them in the identity map as long as this dict
+    # keeps them referenced, the identity map holds objects weakly.
+    winner_ids = {product.winner_id for product in products if product.winner_id is not None}
+    winners = {user.id: user for user in User.query.filter(User.id.in_(winner_ids))} if winner_ids else {}
+
+    if products:
+        product_ids = [product.id for product in products]
+        bidder_ids = {bidder_id for bidder_id, in db.session.query(Bidder.bidders_id)
+                      .filter(Bidder.product_id.in_(product_ids)).distinct()}
+        # Same as bid.utilities.dashboard.invalidate_dashboards(), which imports this module.
+        for user_id in bidder_ids | {product.user_id for product in products}:
+            dashboard_cache.delete(user_id)
+
+    for product in products:
+        pubsub.publish(product_channel(product.id), bid_update(product))
+
+        if product.winner_id in winners:
+            try:
+                send_auction_won_email(product.winner_id, product)
+            except Exception as e:
+                error(str(e), exc_info=True)
+
+
+class AuctionCloser(object):
+    """
+    Background thread closing auctions as their deadlines pass. Sleeps until the nearest deadline of open
+    auctions, at most AUCTION_CLOSER_INTERVAL seconds so auctions added meanwhile are not missed.
+    Several processes may run closers, row locks make sure every auction is closed once.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Threads do not survive fork, every process starts its own.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._stop.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='auction-closer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    close_due_auctions(batch_size=self.app.config.get('AUCTION_CLOSER_BATCH_SIZE', 500))
+                    delay = self._seconds_to_next_deadline()
+                except Exception as e:
+                    error(f'Closing auctions failed: {e}', exc_info=True)
+                    delay = None
+                finally:
+                    db.session.remove()
+
+            interval = self.app.config.get('AUCTION_CLOSER_INTERVAL', 60)
+            self._stop.wait(interval if delay is None else max(1.0, min(delay, interval)))
+
+    @staticmethod
+    def _seconds_to_next_deadline():
+        """
+        Seconds until the nearest open auction is due, read from deadline index.
+        :return: seconds or None without open auctions
+        """
+        deadline = db.session.query(func.min(Product.last_date_to_bid)).filter(Product.closed_at.is_(None)).scalar()
+        if deadline is None:
+            return None
+        return (deadline + CLOSING_DELAY - datetime.now()).total_seconds()
+
+
+def init_app(app):
+    app_closer = app.extensions['auction_closer'] = AuctionCloser(app)
+
+    @app.before_first_request
+    def _start_closer():
+        # Started by the first request so preloading servers fork workers before any thread runs.
+        if app.config.get('AUCTION_CLOSER_ENABLED', False):
+            app_closer.start()
+
+
+closer = LocalProxy(lambda: current_app.extensions['auction_closer'])
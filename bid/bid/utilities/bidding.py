@@ -0,0 +1,313 @@
+from collections import namedtuple
+from logging import error
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+
+from bid import db
+from bid.models import Product, Bidder, BidEvent
+from bid.utilities.notifications import send_outbid_email
+from bid.utilities.pubsub import pubsub, product_channel, bid_update
+from bid.utilities.auctions import is_closed
+from bid.utilities.orderbook import order_books
+from bid.utilities.dashboard import invalidate_dashboards
+
+BID_ACCEPTED = 'accepted'
+# Bid was placed, but the leader's automatic bid outbid it right away.
+BID_OUTBID = 'outbid'
+BID_TOO_LOW = 'too_low'
+BID_NOT_FOUND = 'not_found'
+BID_CLOSED = 'closed'
+# Bid lost a race against concurrent bids on the same product, client may submit it again.
+BID_RETRY = 'retry'
+
+# Statuses of bids which were written
+BID_PLACED = (BID_ACCEPTED, BID_OUTBID)
+
+BidResult = namedtuple('BidResult', ['status', 'message'])
+
+# MySQL lock wait timeout and deadlock errors.
+MYSQL_RETRYABLE_ERRORS = (1205, 1213)
+
+
+def place_bid(product_id, bidder_id, bid_value, note=None, max_bid=None):
+    """
+    Atomically place or raise bid of user on product. Bid must be greater than minimum bid and current highest bid
+    and auction must still be open. Accepted bids are appended to bid history and applied to the product's order
+    book.
+    With max_bid the user bids automatically: whenever outbid, the bid is raised by BID_INCREMENT over the other
+    bid, up to max_bid. Competing automatic bids are resolved in the same transaction, the leader pays the second
+    highest maximum plus increment, and only the resulting bids are written. A bid equal to the maximum of the
+    leader would tie with it and is rejected. The current leader may raise max_bid without raising the bid.
+    Transactions racing on the same product are detected by product version, losers are retried up to
+    BID_RETRIES times and then reported as BID_RETRY.
+    With BID_LOCKING = 'pessimistic' product row is read with SELECT ... FOR UPDATE, which avoids most retries
+    on databases supporting it.
+    :param product_id:
+    :param bidder_id: id of user placing the bid
+    :param bid_value:
+    :param note:
+    :param max_bid: highest value to bid automatically up to, not lower than bid_value
+    :return: BidResult, BID_OUTBID when the bid was placed but an automatic bid of the leader outbid it
+    """
+    retries = current_app.config.get('BID_RETRIES', 5)
+    lock = current_app.config.get('BID_LOCKING', 'optimistic') == 'pessimistic'
+
+    for _ in range(retries + 1):
+        try:
+            result, product, previous_leader_id, events = _place_bid(product_id, bidder_id, bid_value, note, max_bid,
+                                                                     lock)
+            if result.status not in BID_PLACED:
+                db.session.rollback()
+                return result
+
+            update = bid_update(product)
+            leader_id = product.highest_bidder_id
+            seller_id = product.user_id
+            # Product row was flushed once, by the bids or by the maximum of the leader.
+            placed = ([(event.bidder_id, event.bid_value, event.id) for event in events], product.version - 1,
+                      product.version)
+            db.session.commit()
+            break
+
+        except (StaleDataError, IntegrityError, OperationalError) as e:
+            db.session.rollback()
+            if not _is_retryable(e):
+                raise
+    else:
+        return BidResult(BID_RETRY, 'Product is receiving lots of bids right now, please try again!')
+
+    order_books.record(product_id, *placed)
+    if placed[0]:
+        pubsub.publish(product_channel(product_id), update)
+    invalidate_dashboards([bidder_id, previous_leader_id, seller_id] + [bid[0] for bid in placed[0]])
+
+    if previous_leader_id is not None and previous_leader_id != leader_id:
+        try:
+            send_outbid_email(previous_leader_id, product)
+        except Exception as e:
+            error(str(e), exc_info=True)
+
+    return result
+
+
+def resolve_bid(highest_bid, leader_id, leader_max, bidder_id, bid_value, max_bid, increment):
+    """
+    Bids resulting from a bid against the current leader, who may bid automatically up to leader_max.
+    Automatic bids go only as high as needed to lead: the other maximum plus increment, capped by own maximum.
+    On equal maximums the earlier one leads.
+    :param highest_bid: current highest bid, None without bids
+    :param leader_id: current highest bidder
+    :param leader_max: maximum of current highest bidder, None when not bidding automatically
+    :param bidder_id:
+    :param bid_value: bid placed, validated to be greater than highest bid unless bidder is the leader
+    :param max_bid: maximum of bidder, None when not bidding automatically
+    :param increment: BID_INCREMENT
+    :return: list of tuples (bidder id, bid value) to write in order, the last one leads; empty when only the
+             maximum of the leader changes
+    """
+    if highest_bid is None:
+        return [(bidder_id, bid_value)]
+
+    if bidder_id == leader_id:
+        return [(bidder_id, bid_value)] if bid_value > highest_bid else []
+
+    ceiling = max_bid if max_bid is not None else bid_value
+    leader_ceiling = max(leader_max or highest_bid, highest_bid)
+    if ceiling > leader_ceiling:
+        bids = [(leader_id, leader_ceiling)] if leader_ceiling > highest_bid else []
+        return bids + [(bidder_id, max(bid_value, min(ceiling, leader_ceiling + increment)))]
+
+    # Leader outbids automatically. A bid equal to leader's maximum ties with it, _place_bid rejects it before.
+    bids = [(bidder_id, ceiling)] if ceiling < leader_ceiling else []
+    return bids + [(leader_id, min(leader_ceiling, ceiling + increment))]
+
+
+def _place_bid(product_id, bidder_id, bid_value, note, max_bid, lock):
+    """
+    Validate bid against freshly read product and write resulting bids in current transaction.
+    :return: tuple of (BidResult, product, id of previous highest bidder, list of BidEvent of written bids)
+    """
+    query = Product.query.filter(Product.id == product_id).populate_existing()
+    if lock:
+        query = query.with_for_update()
+    product = query.first()
+
+    if product is None:
+        return BidResult(BID_NOT_FOUND, 'Product does not exist!'), None, None, None
+
+    if is_closed(product):
+        return BidResult(BID_CLOSED, 'Bidding on this product is closed!'), product, None, None
+
+    if max_bid is not None and max_bid < bid_value:
+        return BidResult(BID_TOO_LOW, 'Maximum bid must not be lower than bidding value!'), product, None, None
+
+    if bid_value <= product.minimum_bid:
+        return BidResult(BID_TOO_LOW, 'Bidding value must be greater that minimum bidding value!'), product, None, None
+
+    leader_id = product.highest_bidder_id
+    highest_bid = product.highest_bid
+    # Leader may raise only the maximum, anyone else has to beat the highest bid.
+    floor = max_bid if max_bid is not None and leader_id == bidder_id else bid_value
+    if highest_bid is not None and floor <= highest_bid:
+        message = f'Bidding value must be greater than current highest bid {highest_bid}!'
+        return BidResult(BID_TOO_LOW, message), product, None, None
+
+    bidder_ids = {bidder_id} if leader_id is None else {bidder_id, leader_id}
+    rows = {row.bidders_id: row for row in Bidder.query.filter(Bidder.product_id == product_id,
+                                                               Bidder.bidders_id.in_(bidder_ids))}
+    leader_max = rows[leader_id].max_bid if leader_id in rows else None
+    if bidder_id != leader_id and leader_max is not None and \
+            (max_bid if max_bid is not None else bid_value) == leader_max:
+        # Equal maximums tie and the earlier one keeps leading, nothing would be written for this bid.
+        message = 'Bidding value must be greater than the maximum bid of the current highest bidder!'
+        return BidResult(BID_TOO_LOW, message), product, None, None
+
+    bids = resolve_bid(highest_bid, leader_id, leader_max, bidder_id, bid_value, max_bid,
+                       current_app.config.get('BID_INCREMENT', 1))
+
+    events = list()
+    for placed_by, value in bids:
+        row = rows.get(placed_by)
+        if row is None:
+            row = rows[placed_by] = Bidder(bidders_id=placed_by, product_id=product_id, bid_value=value)
+            db.session.add(row)
+            is_new_bid = True
+        else:
+            row.bid_value = value
+            is_new_bid = False
+        if placed_by == bidder_id:
+            row.note = note
+
+        event = BidEvent(product_id=product_id, bidder_id=placed_by, bid_value=value)
+        db.session.add(event)
+        events.append(event)
+        apply_bid_to_aggregates(product, placed_by, value, is_new_bid=is_new_bid)
+
+    own = rows.get(bidder_id)
+    if own is not None and (bidder_id == leader_id or bidder_id in dict(bids)):
+        if max_bid is not None:
+            own.max_bid = max_bid
+        elif own.max_bid is not None and own.max_bid <= own.bid_value:
+            # Plain bid reaching own maximum ends automatic bidding.
+            own.max_bid = None
+    if not bids:
+        # Product row is not changed, its version still has to tell concurrent bids the maximum changed.
+        flag_modified(product, 'highest_bid')
+    db.session.flush()
+
+    if product.highest_bidder_id != bidder_id:
+        return BidResult(BID_OUTBID, 'Bidding applied, but outbid by an automatic bid!'), product, leader_id, events
+    if not bids:
+        return BidResult(BID_ACCEPTED, 'Maximum bid updated!'), product, leader_id, events
+    return BidResult(BID_ACCEPTED, 'Bidding applied!'), product, leader_id, events
+
+
+def _is_retryable(exc):
+    """
+    Whether failed bid transaction may succeed when run again.
+    :param exc:
+    :return:
+    """
+    if isinstance(exc, (StaleDataError, IntegrityError)):
+        return True
+
+    code = exc.orig.args[0] if getattr(exc, 'orig', None) is not None and exc.orig.args else None
+    return code in MYSQL_RETRYABLE_ERRORS or 'database is locked' in str(exc)
+
+
+def apply_bid_to_aggregates(product, bidder_id, bid_value, is_new_bid):
+    """
+    Keep denormalized bid aggregates of product in sync with a bid written in the current session.
+    Must be called before the session is committed so aggregates and bid land in the same transaction.
+    :param product: product being bid on
+    :param bidder_id: id of user who placed the bid
+    :param bid_value: value of the bid
+    :param is_new_bid: True when a new Bidder row was added, False when an existing row was updated
+    :return:
+    """
+    if is_new_bid:
+        product.bid_count = (product.bid_count or 0) + 1
+
+    if product.highest_bid is None or bid_value >= product.highest_bid:
+        product.highest_bid = bid_value
+        product.highest_bidder_id = bidder_id
+
+    elif product.highest_bidder_id == bidder_id:
+        # Current leader lowered own bid, leader has to be looked up again.
+        db.session.flush()
+        product.highest_bid, product.highest_bidder_id = _highest_bid_for(product.id)
+
+
+def _highest_bid_for(product_id):
+    """
+    Find highest bid value and its bidder for product. Earliest bid wins on equal values.
+    :param product_id:
+    :return: tuple of (bid_value, bidders_id) or (None, None) when there are no bids
+    """
+    row = db.session.query(Bidder.bid_value, Bidder.bidders_id) \
+        .filter(Bidder.product_id == product_id) \
+        .order_by(Bidder.bid_value.desc(), Bidder.id) \
+        .first()
+
+    return (row.bid_value, row.bidders_id) if row else (None, None)
+
+
+def reconcile_bid_aggregates(batch_size=500):
+    """
+    Recompute denormalized bid aggregates of all products from bidder table.
+    Products are processed in primary key order, one transaction per batch.
+    :param batch_size: number of products per batch
+    :return: number of products whose aggregates were corrected
+    """
+    corrected = 0
+    last_id = 0
+
+    while True:
+        products = db.session.query(
+            Product.id, Product.highest_bid, Product.highest_bidder_id, Product.bid_count, Product.version
+        ).filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+
+        if not products:
+            break
+
+        product_ids = [row.id for row in products]
+        last_id = product_ids[-1]
+
+        stats = db.session.query(
+            Bidder.product_id,
+            func.max(Bidder.bid_value).label('highest_bid'),
+            func.count(Bidder.id).label('bid_count')
+        ).filter(Bidder.product_id.in_(product_ids)).group_by(Bidder.product_id).subquery()
+
+        leaders = db.session.query(Bidder.product_id, Bidder.bidders_id, stats.c.highest_bid, stats.c.bid_count) \
+            .join(stats, db.and_(Bidder.product_id == stats.c.product_id, Bidder.bid_value == stats.c.highest_bid)) \
+            .order_by(Bidder.product_id, Bidder.id.desc()) \
+            .all()
+
+        # Ordered by id descending so the earliest bidder on equal values is the one left in the dict.
+        expected = {row.product_id: (row.highest_bid, row.bidders_id, row.bid_count) for row in leaders}
+
+        changes = list()
+        for row in products:
+            highest_bid, highest_bidder_id, bid_count = expected.get(row.id, (None, None, 0))
+            if (row.highest_bid, row.highest_bidder_id, row.bid_count) != (highest_bid, highest_bidder_id, bid_count):
+                # Version of the read is checked and bumped like any ORM update, a product changed by a bid since
+                # fails the batch with StaleDataError instead of being overwritten.
+                changes.append({
+                    'id': row.id,
+                    'version': row.version,
+                    'highest_bid': highest_bid,
+                    'highest_bidder_id': highest_bidder_id,
+                    'bid_count': bid_count
+                })
+
+        if changes:
+            db.session.bulk_update_mappings(Product, changes)
+        db.session.commit()
+        corrected += len(changes)
+
+    return corrected
@@ -0,0 +1,297 @@
+import csv
+import io
+import json
+import os
+from collections import Counter
+from datetime import datetime, time
+from logging import error
+
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+
+from bid import db
+from bid.forms import ProductRowForm, PICTURE_EXTENSIONS
+from bid.models import Product, Bidder
+from bid.utilities.categories import category_ids, adjust_active_counts
+from bid.utilities.dashboard import invalidate_dashboards
+from bid.utilities.images import pipeline, DEFAULT_PICTURE, InvalidPicture
+from bid.utilities.serializer import ModelSerializer, serializer_for
+from bid.utilities.utilities import picture_ready
+
+FORMATS = ('csv', 'jsonl')
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}
+MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+IMPORT_FIELDS = ('product_name', 'product_description', 'category', 'minimum_bid', 'last_date_to_bid')
+# Errors kept for the report, rows failing beyond them are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Notes and maximum bids are private to their bidder.
+bid_export_serializer = ModelSerializer(Bidder, exclude=('note', 'max_bid'))
+
+
+class ImportResult(object):
+    """
+    Outcome of an import: imported rows, and rows skipped with their line number and validation errors.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = list()
+
+    def add_error(self, line, messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, messages))
+
+
+def format_of(filename, default=None):
+    """
+    Import/export format from file extension.
+    :param filename:
+    :param default: returned for unknown extensions
+    :return: 'csv', 'jsonl' or default
+    """
+    _, ext = os.path.splitext(filename or '')
+    return FORMAT_EXTENSIONS.get(ext.lower(), default)
+
+
+def read_rows(stream, fmt):
+    """
+    Parse rows one at a time from binary stream, the whole file is never held in memory.
+    :param stream: binary file like object
+    :param fmt: 'csv' (header row with field names) or 'jsonl' (one JSON object per line)
+    :return: generator of tuples (line number, dict or None when line is not a JSON object)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+    finally:
+        # Leave stream open for its owner.
+        text.detach()
+
+
+def validate_row(row, form=None):
+    """
+    Validate row with the rules of AddProductForm, except picture which is optional.
+    :param row: dict of field name -> value
+    :param form: ProductRowForm reused between rows, building a form per row costs more than validating it
+    :return: tuple (dict of column values or None, list of error messages)
+    """
+    formdata = MultiDict((field, str(row[field])) for field in IMPORT_FIELDS if row.get(field) is not None)
+    if form is None:
+        form = ProductRowForm(formdata=formdata, meta={'csrf': False})
+    else:
+        form.process(formdata)
+
+    if not form.validate():
+        return None, [f'{field}: {message}' for field, messages in form.errors.items() for message in messages]
+
+    return {
+        'product_name': form.product_name.data,
+        'product_description': form.product_description.data,
+        'category': form.category.data,
+        'minimum_bid': form.minimum_bid.data,
+        'last_date_to_bid': datetime.combine(form.last_date_to_bid.data, time()),
+    }, []
+
+
+def directory_pictures(directory):
+    """
+    Resolve pictures named in rows to files of directory.
+    :param directory:
+    :return: function of picture name returning open binary stream or None
+    """
+    def open_picture(name):
+        path = os.path.join(directory, name)
+        return open(path, 'rb') if os.path.isfile(path) else None
+
+    return open_picture
+
+
+def uploaded_pictures(files):
+    """
+    Resolve pictures named in rows to files uploaded along with them.
+    :param files: iterable of werkzeug FileStorage
+    :return: function of picture name returning open binary stream or None
+    """
+    uploads = {os.path.basename(upload.filename): upload for upload in files if upload and upload.filename}
+
+    def open_picture(name):
+        upload = uploads.get(os.path.basename(name))
+        return upload.stream if upload is not None else None
+
+    return open_picture
+
+
+def import_products(stream, fmt, user_id, open_picture=None, batch_size=None):
+    """
+    Add products of user from CSV or JSON lines rows. Valid rows are inserted in batches, one executemany
+    statement and transaction per batch; invalid rows are skipped and reported.
+    Pictures are stored while reading rows, their renditions are generated in background after the batch is saved.
+    :param stream: binary file like object
+    :param fmt: 'csv' or 'jsonl'
+    :param user_id: owner of imported products
+    :param open_picture: function resolving picture column to a stream, see directory_pictures(); rows with
+                         pictures are rejected without it
+    :param batch_size: rows per transaction, defaults to BULK_IMPORT_BATCH_SIZE config
+    :return: ImportResult
+    """
+    batch_size = batch_size or current_app.config.get('BULK_IMPORT_BATCH_SIZE', 1000)
+    result = ImportResult()
+    # picture name of rows -> (thumbnail file name, path of original), every picture is stored once per import
+    stored = dict()
+    batch = list()
+    pending = dict()
+    form = ProductRowForm(formdata=None, meta={'csrf': False})
+
+    for line, row in read_rows(stream, fmt):
+        if row is None:
+            result.add_error(line, ['Not a JSON object.'])
+            continue
+
+        values, errors = validate_row(row, form)
+        name = str(row.get('picture') or '').strip()
+        if not errors and name and name not in stored:
+            error_message = _store_picture(name, open_picture, stored)
+            if error_message:
+                errors.append(f'picture: {error_message}')
+        if errors:
+            result.add_error(line, errors)
+            continue
+
+        now = datetime.now().replace(microsecond=0)
+        values.update(user_id=user_id, post_created=now, last_updated=now, picture=DEFAULT_PICTURE)
+        if name:
+            values['picture'], original_path = stored[name]
+            pending[values['picture']] = original_path
+        batch.append((line, values))
+
+        if len(batch) >= batch_size:
+            _insert_batch(batch, pending, user_id, result)
+            batch, pending = list(), dict()
+
+    if batch:
+        _insert_batch(batch, pending, user_id, result)
+
+    return result
+
+
+def _store_picture(name, open_picture, stored):
+    """
+    Store picture named in a row.
+    :return: error message or None
+    """
+    if os.path.splitext(name)[1].lower().lstrip('.') not in PICTURE_EXTENSIONS:
+        return f'Only {", ".join(PICTURE_EXTENSIONS)} pictures are allowed.'
+
+    picture_stream = open_picture(name) if open_picture is not None else None
+    if picture_stream is None:
+        return f'{name} not found.'
+
+    try:
+        stored[name] = pipeline.store(picture_stream, name)
+    except InvalidPicture:
+        return f'{name} is not a readable picture.'
+    finally:
+        picture_stream.close()
+
+
+def _insert_batch(batch, pending, user_id, result):
+    """
+    Insert batch of validated rows and add them to active counts of their categories in one transaction, then
+    schedule renditions of their pictures.
+    :param batch: list of tuples (line number, column values)
+    :param pending: dict of thumbnail file name -> path of original
+    :param user_id:
+    :param result: ImportResult
+    :return:
+    """
+    try:
+        ids = category_ids(values['category'] for _, values in batch)
+        for _, values in batch:
+            values['category_id'] = ids[values['category']]
+        db.session.execute(Product.__table__.insert(), [values for _, values in batch])
+        adjust_active_counts(Counter(values['category_id'] for _, values in batch))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        error(f'Importing products failed: {e}', exc_info=True)
+        for line, _ in batch:
+            result.add_error(line, ['Could not be saved.'])
+        return
+
+    result.imported += len(batch)
+    invalidate_dashboards([user_id])
+    app = current_app._get_current_object()
+    for picture, original_path in pending.items():
+        pipeline.render_in_background(original_path, picture,
+                                      callback=lambda ready: picture_ready(app, user_id, ready))
+
+
+def export_query(user_id, data='products'):
+    """
+    Products of user, or bids on them, in a stable order and loaded in chunks.
+    :param user_id:
+    :param data: 'products' or 'bids'
+    :return: tuple (query, serializer)
+    """
+    if data == 'bids':
+        query = Bidder.query \
+            .join(Product, Product.id == Bidder.product_id) \
+            .filter(Product.user_id == user_id) \
+            .order_by(Bidder.product_id, Bidder.bid_value.desc(), Bidder.id)
+        serializer = bid_export_serializer
+    else:
+        query = Product.query.filter(Product.user_id == user_id).order_by(Product.id)
+        serializer = serializer_for(Product)
+
+    return query.execution_options(stream_results=True).yield_per(1000), serializer
+
+
+def export_rows(objs, serializer, fmt, chunk_size=500):
+    """
+    Serialize instances as CSV (with header row) or JSON lines, piece by piece.
+    :param objs: iterable of model instances, e.g. query with yield_per()
+    :param serializer: ModelSerializer
+    :param fmt: 'csv' or 'jsonl'
+    :param chunk_size: instances per yielded text chunk
+    :return: generator of text chunks
+    """
+    fields = serializer.select()
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+
+        def write(obj):
+            row = serializer.serialize(obj, fields)
+            writer.writerow([row[field] for field in fields])
+    else:
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+
+        def write(obj):
+            buffer.write(encode(serializer.serialize(obj, fields)) + '\n')
+
+    count = 0
+    for obj in objs:
+        write(obj)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
+
+
+class CacheBackend(object):
+    """
+    Storage interface of caches. Implement it on top of a shared store (memcached, redis, ...) and point
+    *_CACHE_BACKEND config to the class to share cached values between processes.
+    Values must be picklable when backend stores them outside of process.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process least recently used cache with per entry time to live.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Names of caches every application gets, see cache_proxy()
+CACHE_NAMES = list()
+
+
+class Cache(object):
+    """
+    Namespaced cache counting hits and misses. Backend is created on first use from config:
+    <NAME>_CACHE_BACKEND (import path of CacheBackend class), <NAME>_CACHE_SIZE and <NAME>_CACHE_TTL.
+    """
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    prefix = self.name.upper()
+                    backend_class = import_string(self.app.config.get(f'{prefix}_CACHE_BACKEND',
+                                                                      'bid.utilities.cache.LRUCache'))
+                    self._backend = backend_class(max_size=self.app.config.get(f'{prefix}_CACHE_SIZE', 1024),
+                                                  ttl=self.app.config.get(f'{prefix}_CACHE_TTL'))
+        return self._backend
+
+    def get(self, key):
+        value = self.backend.get(self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(self._key(key), value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    def stats(self):
+        """
+        Hit and miss counters of this process.
+        :return: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def _key(self, key):
+        return f'{self.name}:{key}'
+
+
+def cache_proxy(name):
+    """
+    Cache named name of current application, created for every application by init_app().
+    :param name:
+    :return: LocalProxy
+    """
+    if name not in CACHE_NAMES:
+        CACHE_NAMES.append(name)
+    return LocalProxy(lambda: current_app.extensions['caches'][name])
+
+
+def init_app(app):
+    app.extensions['caches'] = {name: Cache(app, name) for name in CACHE_NAMES}
+
+
+user_cache = cache_proxy('user')
+category_cache = cache_proxy('category')
+dashboard_cache = cache_proxy('dashboard')
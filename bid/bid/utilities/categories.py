@@ -0,0 +1,170 @@
+from collections import namedtuple, defaultdict, Counter
+
+from sqlalchemy import event, func
+
+from bid import db
+from bid.models import Product, Category
+from bid.utilities.cache import category_cache
+from bid.utilities.utilities import CATEGORY_SEPARATOR
+
+CategoryNode = namedtuple('CategoryNode', ['id', 'name', 'label', 'active_count', 'total', 'children'])
+CategoryTree = namedtuple('CategoryTree', ['roots', 'nodes'])
+
+
+def category_for(name):
+    """
+    Category of normalized category name, created along with its parent categories when missing.
+    Runs in current transaction, concurrent transactions creating the same category end up with the same row.
+    :param name: normalized category, see bid.utilities.utilities.normalize_category
+    :return: Category
+    """
+    category = Category.query.filter(Category.name == name).first()
+    if category is not None:
+        return category
+
+    levels = name.split(CATEGORY_SEPARATOR)
+    parent_id = category_for(CATEGORY_SEPARATOR.join(levels[:-1])).id if len(levels) > 1 else None
+
+    # Unique name makes the insert a no-op when another transaction created the category meanwhile.
+    insert = Category.__table__.insert() \
+        .prefix_with('IGNORE', dialect='mysql') \
+        .prefix_with('OR IGNORE', dialect='sqlite')
+    created = db.session.execute(insert, {'name': name, 'parent_id': parent_id, 'active_count': 0}).rowcount
+    if created:
+        db.session.info['category_tree_changed'] = True
+    return Category.query.filter(Category.name == name).one()
+
+
+def category_ids(names):
+    """
+    Ids of categories, creating missing ones.
+    :param names: normalized category names
+    :return: dict of name -> id
+    """
+    names = set(names)
+    ids = dict(db.session.query(Category.name, Category.id).filter(Category.name.in_(names))) if names else {}
+    for name in names - set(ids):
+        ids[name] = category_for(name).id
+    return ids
+
+
+def adjust_active_counts(deltas):
+    """
+    Add to active counts of categories in current transaction, one UPDATE per category.
+    :param deltas: dict of category id -> number of products opened (positive) or closed/removed (negative)
+    :return:
+    """
+    for category_id, delta in deltas.items():
+        if category_id is not None and delta:
+            Category.query.filter(Category.id == category_id) \
+                .update({Category.active_count: Category.active_count + delta}, synchronize_session=False)
+
+
+def assign_category(product, name):
+    """
+    Move product to category of name, keeping active counts of old and new category in sync.
+    :param product: Product, new or loaded in current session
+    :param name: normalized category name
+    :return:
+    """
+    category_id = category_for(name).id
+    if category_id == product.category_id:
+        return
+
+    if product.closed_at is None:
+        adjust_active_counts(Counter({category_id: 1, product.category_id: -1}))
+    product.category = name
+    product.category_id = category_id
+
+
+def category_tree(refresh=False):
+    """
+    Every category with its active count and the total of its subcategories, cached for CATEGORY_CACHE_TTL seconds
+    so counts may lag that much behind. Creating a category drops the cached tree.
+    :param refresh: rebuild tree from database even when cached
+    :return: CategoryTree, roots sorted by name and nodes by id
+    """
+    tree = None if refresh else category_cache.get('tree')
+    if tree is None:
+        tree = _build_tree()
+        category_cache.set('tree', tree)
+    return tree
+
+
+def find_category(category_id):
+    """
+    Category of cached tree, tree is rebuilt once when category is missing, e.g. created by another process.
+    :param category_id:
+    :return: CategoryNode or None when there is no such category
+    """
+    node = category_tree().nodes.get(category_id)
+    if node is None:
+        node = category_tree(refresh=True).nodes.get(category_id)
+    return node
+
+
+def _build_tree():
+    rows = db.session.query(Category.id, Category.name, Category.parent_id, Category.active_count) \
+        .order_by(Category.name) \
+        .all()
+    children = defaultdict(list)
+    for row in rows:
+        children[row.parent_id].append(row)
+
+    nodes = dict()
+
+    def build(row):
+        subcategories = [build(child) for child in children[row.id]]
+        node = nodes[row.id] = CategoryNode(row.id, row.name, row.name.split(CATEGORY_SEPARATOR)[-1],
+                                            row.active_count,
+                                            row.active_count + sum(child.total for child in subcategories),
+                                            subcategories)
+        return node
+
+    return CategoryTree([build(row) for row in children[None]], nodes)
+
+
+def subtree_ids(node):
+    """
+    :param node: CategoryNode
+    :return: ids of category and all its subcategories
+    """
+    ids = [node.id]
+    for child in node.children:
+        ids.extend(subtree_ids(child))
+    return ids
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_category_tree(session):
+    if session.info.pop('category_tree_changed', False):
+        category_cache.delete('tree')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_category_tree_changes(session):
+    session.info.pop('category_tree_changed', None)
+
+
+def reconcile_category_counts():
+    """
+    Assign categories to products without one, e.g. inserted before categories existed, and recompute active
+    counts of all categories from products.
+    :return: number of categories whose count was corrected
+    """
+    names = [name for name, in db.session.query(Product.category).filter(Product.category_id.is_(None)).distinct()]
+    for name, category_id in category_ids(names).items():
+        Product.query.filter(Product.category_id.is_(None), Product.category == name) \
+            .update({Product.category_id: category_id}, synchronize_session=False)
+
+    counts = dict(db.session.query(Product.category_id, func.count(Product.id))
+                  .filter(Product.closed_at.is_(None), Product.category_id.isnot(None))
+                  .group_by(Product.category_id))
+    changes = [{'id': category_id, 'active_count': counts.get(category_id, 0)}
+               for category_id, active_count in db.session.query(Category.id, Category.active_count)
+               if active_count != counts.get(category_id, 0)]
+    if changes:
+        db.session.bulk_update_mappings(Category, changes)
+        db.session.info['category_tree_changed'] = True
+    db.session.commit()
+    return len(changes)
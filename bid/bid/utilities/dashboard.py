@@ -0,0 +1,131 @@
+from collections import namedtuple
+
+from sqlalchemy import func, case
+
+from bid import db
+from bid.models import Product, Bidder, BidEvent
+from bid.utilities.auctions import closing_cutoff
+from bid.utilities.cache import dashboard_cache
+
+# Status of an active bid on its bidder's dashboard
+BID_WINNING = 'winning'
+BID_LOSING = 'outbid'
+
+ActiveBid = namedtuple('ActiveBid', ['product_id', 'product_name', 'bid_value', 'max_bid', 'highest_bid', 'bidders',
+                                     'last_date_to_bid', 'status'])
+SellerStats = namedtuple('SellerStats', ['product_id', 'product_name', 'last_date_to_bid', 'closed_at', 'total_bids',
+                                         'top_bid', 'bidders'])
+
+# Rows fetched from database at once while streaming dashboards
+DASHBOARD_CHUNK_SIZE = 500
+
+
+def active_bids_query(user_id):
+    """
+    Bids of user on auctions still open, ending soonest first.
+    :param user_id:
+    :return: query of tuples (product id, product name, bid value, max bid, highest bid, bidders,
+             last date to bid, highest bidder id)
+    """
+    return db.session.query(Product.id, Product.product_name, Bidder.bid_value, Bidder.max_bid, Product.highest_bid,
+                            Product.bid_count, Product.last_date_to_bid, Product.highest_bidder_id) \
+        .join(Product, Product.id == Bidder.product_id) \
+        .filter(Bidder.bidders_id == user_id, Product.closed_at.is_(None),
+                Product.last_date_to_bid >= closing_cutoff()) \
+        .order_by(Product.last_date_to_bid, Product.id)
+
+
+def active_bids(user_id):
+    """
+    Active bids of user, read from database in chunks so any number of them can be streamed.
+    :param user_id:
+    :return: generator of ActiveBid
+    """
+    rows = active_bids_query(user_id).execution_options(stream_results=True).yield_per(DASHBOARD_CHUNK_SIZE)
+    for product_id, name, bid_value, max_bid, highest_bid, bidders, last_date_to_bid, leader_id in rows:
+        yield ActiveBid(product_id, name, bid_value, max_bid, highest_bid, bidders, last_date_to_bid,
+                        BID_WINNING if leader_id == user_id else BID_LOSING)
+
+
+def seller_stats_query(user_id):
+    """
+    Bids received by every product of user, newest product first: one grouped pass over bid history instead of
+    loading bid rows.
+    :param user_id:
+    :return: query of SellerStats compatible tuples
+    """
+    return db.session.query(Product.id.label('product_id'), Product.product_name, Product.last_date_to_bid,
+                            Product.closed_at,
+                            func.count(BidEvent.id).label('total_bids'),
+                            func.max(BidEvent.bid_value).label('top_bid'),
+                            func.count(BidEvent.bidder_id.distinct()).label('bidders')) \
+        .outerjoin(BidEvent, BidEvent.product_id == Product.id) \
+        .filter(Product.user_id == user_id) \
+        .group_by(Product.id) \
+        .order_by(Product.post_created.desc(), Product.id.desc())
+
+
+def seller_stats(user_id):
+    """
+    Bid statistics of every product of user, read from database in chunks.
+    :param user_id:
+    :return: generator of SellerStats
+    """
+    rows = seller_stats_query(user_id).execution_options(stream_results=True).yield_per(DASHBOARD_CHUNK_SIZE)
+    for row in rows:
+        yield SellerStats(*row)
+
+
+def dashboard_summary(user_id):
+    """
+    Totals of user's dashboard, cached until a bid, closing or deletion in this process changes them, at most
+    DASHBOARD_CACHE_TTL seconds.
+    :param user_id:
+    :return: dict of active_bids, winning, outbid, products, open_products, total_bids, bidders
+    """
+    summary = dashboard_cache.get(user_id)
+    if summary is None:
+        summary = _compute_summary(user_id)
+        dashboard_cache.set(user_id, summary)
+    return summary
+
+
+def _compute_summary(user_id):
+    active, winning = db.session.query(
+        func.count(Bidder.id),
+        func.coalesce(func.sum(case([(Product.highest_bidder_id == user_id, 1)], else_=0)), 0)) \
+        .join(Product, Product.id == Bidder.product_id) \
+        .filter(Bidder.bidders_id == user_id, Product.closed_at.is_(None),
+                Product.last_date_to_bid >= closing_cutoff()) \
+        .one()
+    products, open_products, bidders = db.session.query(
+        func.count(Product.id),
+        func.coalesce(func.sum(case([(Product.closed_at.is_(None), 1)], else_=0)), 0),
+        func.coalesce(func.sum(Product.bid_count), 0)) \
+        .filter(Product.user_id == user_id) \
+        .one()
+    total_bids = db.session.query(func.count(BidEvent.id)) \
+        .join(Product, Product.id == BidEvent.product_id) \
+        .filter(Product.user_id == user_id) \
+        .scalar()
+
+    return {
+        'active_bids': active,
+        'winning': int(winning),
+        'outbid': active - int(winning),
+        'products': products,
+        'open_products': int(open_products),
+        'total_bids': total_bids,
+        'bidders': int(bidders),
+    }
+
+
+def invalidate_dashboards(user_ids):
+    """
+    Drop cached dashboard totals of users, after their bids or products changed.
+    :param user_ids: iterable of user ids, None is ignored
+    :return:
+    """
+    for user_id in set(user_ids):
+        if user_id is not None:
+            dashboard_cache.delete(user_id)
@@ -0,0 +1,149 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import exc, orm, text
+from sqlalchemy.pool import QueuePool
+
+REPLICA_BIND = 'replica'
+# create_engine() options which only apply to QueuePool, SQLite engines use a single connection or none at all
+POOL_SIZING_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_use_lifo')
+
+
+class PoolStats(object):
+    """
+    Counters of connection checkouts from a pool, shared by pools recreated on dispose.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool measuring time requests wait for a connection, i.e. until one is returned to a full pool or
+    a new one is opened.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_status(engine):
+    """
+    Current state of engine's connection pool.
+    :param engine:
+    :return: dict, checkout counters and wait times only for instrumented pools
+    """
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                      overflow=max(pool.overflow(), 0), max_overflow=pool._max_overflow)
+
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(checkouts=stats.checkouts, timeouts=stats.timeouts,
+                      wait_ms_total=round(stats.wait_total * 1000, 3), wait_ms_max=round(stats.wait_max * 1000, 3))
+    return status
+
+
+def ping(engine):
+    """
+    Run trivial query on engine.
+    :param engine:
+    :return: tuple (ok, milliseconds taken, error message or None)
+    """
+    started = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1')).scalar()
+    except exc.SQLAlchemyError as e:
+        return False, round((time.perf_counter() - started) * 1000, 3), str(e.__class__.__name__)
+    return True, round((time.perf_counter() - started) * 1000, 3), None
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session reading from replica database while its info['use_replica'] is set, see use_replica().
+    Flushes, and every read when no replica is configured, go to primary database.
+    """
+
+    def __init__(self, db, **options):
+        self._db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.info.get('use_replica') and not self._flushing \
+                and REPLICA_BIND in (self.app.config.get('SQLALCHEMY_BINDS') or ()):
+            return self._db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """
+    Flask-SQLAlchemy with instrumented connection pools and sessions able to read from a replica.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.drivername.startswith('sqlite'):
+            for option in POOL_SIZING_OPTIONS:
+                engine_opts.pop(option, None)
+        else:
+            engine_opts.setdefault('poolclass', InstrumentedQueuePool)
+        return super().create_engine(sa_url, engine_opts)
+
+
+def use_replica(func):
+    """
+    Run view reading from replica database, when SQLALCHEMY_BINDS config has a 'replica' URI.
+    For listings only, replica may lag behind so pages reading what was just written should stay on primary.
+    :param func:
+    :return:
+    """
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        session = current_app.extensions['sqlalchemy'].db.session
+        previous = session.info.get('use_replica', False)
+        session.info['use_replica'] = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            session.info['use_replica'] = previous
+
+    return decorated_view
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload
+
+from bid import db
+from bid.models import User, Product, Bidder
+from bid.utilities.listing import home_listing_query, user_listing_query, category_listing_query
+from bid.utilities.auctions import due_auctions_query
+from bid.utilities.orderbook import order_book_query
+from bid.utilities.categories import CategoryNode
+from bid.utilities.dashboard import active_bids_query, seller_stats_query
+
+# Access types in MySQL EXPLAIN output which mean the whole table is read.
+MYSQL_FULL_SCAN_TYPES = ('ALL',)
+
+
+def view_queries():
+    """
+    Queries issued by views on their hot paths, with placeholder parameters.
+    :return: list of tuples (name, query)
+    """
+    user = User(username='explain', email='explain@example.com')
+    user.id = 1
+    category = CategoryNode(1, 'Explain', 'Explain', 0, 0, [])
+
+    return [
+        ('home listing', home_listing_query().options(joinedload(Product.owner)).limit(5)),
+        ('home listing cursor', home_listing_query().options(joinedload(Product.owner)).filter(
+            db.or_(Product.post_created < datetime.now(),
+                   db.and_(Product.post_created == datetime.now(), Product.id < 1))
+        ).limit(6)),
+        ('user listing', user_listing_query(user).options(joinedload(Product.owner)).limit(5)),
+        ('user by username', User.query.filter_by(username='explain')),
+        ('product detail', Product.query.filter(Product.id == 1)),
+        ('bid lookup', Bidder.query.filter(Bidder.bidders_id == 1, Bidder.product_id == 1)),
+        ('highest bid of product', db.session.query(Bidder.bid_value, Bidder.bidders_id).filter(
+            Bidder.product_id == 1).order_by(Bidder.bid_value.desc(), Bidder.id)),
+        ('due auctions', due_auctions_query().limit(500)),
+        ('order book load', order_book_query(1).limit(101)),
+        ('category browse ending', category_listing_query(category).order_by(
+            Product.last_date_to_bid, Product.id).limit(11)),
+        ('category browse highest', category_listing_query(category).order_by(
+            Product.highest_bid.desc(), Product.id.desc()).limit(11)),
+        ('dashboard active bids', active_bids_query(1)),
+        ('dashboard seller stats', seller_stats_query(1)),
+    ]
+
+
+def explain(query):
+    """
+    Run EXPLAIN for query on current database.
+    :param query:
+    :return: tuple of (uses_index, list of plan lines)
+    """
+    bind = db.session.get_bind()
+    compiled = query.statement.compile(dialect=bind.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup] if compiled.positional else compiled.params
+
+    if bind.dialect.name == 'sqlite':
+        rows = bind.execute(f'EXPLAIN QUERY PLAN {compiled}', *params).fetchall()
+        plan = [row[-1] for row in rows]
+        # 'SCAN product' reads whole table, 'SCAN product USING INDEX ...' walks an index in order.
+        # 'SCAN anon_1' reads rows of a subquery materialized by an earlier step, not a table.
+        uses_index = not any(line.startswith('SCAN') and ' USING ' not in line and not line.startswith('SCAN anon_')
+                             for line in plan)
+        return uses_index, plan
+
+    if bind.dialect.name == 'mysql':
+        rows = bind.execute(f'EXPLAIN {compiled}', *params).fetchall()
+        plan = [f"{row['table']}: type={row['type']} key={row['key']} extra={row['Extra']}" for row in rows]
+        # <derivedN> tables are materialized subqueries, their own rows are checked separately.
+        uses_index = all(row['type'] not in MYSQL_FULL_SCAN_TYPES or str(row['table']).startswith('<derived')
+                         for row in rows)
+        return uses_index, plan
+
+    raise NotImplementedError(f'EXPLAIN is not supported for {bind.dialect.name} databases.')
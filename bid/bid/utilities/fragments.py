@@ -0,0 +1,68 @@
+from flask import render_template
+from flask_login import current_user
+from markupsafe import Markup
+
+from bid.utilities.cache import cache_proxy
+
+fragment_cache = cache_proxy('fragment')
+FRAGMENT_TEMPLATES = ('_product_card.html', '_product_detail.html')
+
+
+def cached_fragment(template, product, **context):
+    """
+    Render template for product or return it from fragment cache.
+    Fragments vary by product version and whether current user owns the product. Version is a column every bid,
+    update and closing bumps, so a change in any process invalidates fragments cached by all of them.
+    :param template:
+    :param product:
+    :param context: additional template context
+    :return: Markup
+    """
+    is_owner = current_user.is_authenticated and current_user.id == product.user_id
+    key = _fragment_key(template, product, is_owner)
+
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_template(template, product=product, is_owner=is_owner, **context)
+        fragment_cache.set(key, html)
+
+    return Markup(html)
+
+
+def forget_fragments(product):
+    """
+    Drop fragments of product cached by this process, e.g. once it is deleted. Other processes tell a product
+    reusing the id of a deleted one, as SQLite may, by its creation time.
+    :param product:
+    :return:
+    """
+    for template in FRAGMENT_TEMPLATES:
+        for is_owner in (False, True):
+            fragment_cache.delete(_fragment_key(template, product, is_owner))
+
+
+def _fragment_key(template, product, is_owner):
+    return f'{template}:{product.id}:{product.version}:{product.post_created:%Y%m%d%H%M%S}:{int(is_owner)}'
+
+
+def product_card(product):
+    """
+    Product card shown in listings.
+    :param product:
+    :return:
+    """
+    return cached_fragment(FRAGMENT_TEMPLATES[0], product)
+
+
+def product_detail(product):
+    """
+    Product details shown on product page.
+    :param product:
+    :return:
+    """
+    return cached_fragment(FRAGMENT_TEMPLATES[1], product, my_product=product)
+
+
+def init_app(app):
+    app.add_template_global(product_card)
+    app.add_template_global(product_detail)
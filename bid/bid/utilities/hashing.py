@@ -0,0 +1,105 @@
+import os
+import threading
+
+import bcrypt
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(pw_hash, password):
+    return bcrypt.checkpw(password, pw_hash)
+
+
+class PasswordHasher(object):
+    """
+    Bcrypt password hashing run in a bounded process pool, so hashing bursts use at most BCRYPT_POOL_SIZE CPUs
+    and never hold up request threads on the GIL. At most BCRYPT_MAX_PENDING hashes wait for the pool, further
+    callers block until a slot frees up. With BCRYPT_POOL_SIZE = 0 hashing runs on the calling thread.
+    Hashes are compatible with Flask-Bcrypt.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pool = None
+        self._pid = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    @property
+    def rounds(self):
+        return self.app.config.get('BCRYPT_LOG_ROUNDS', 12)
+
+    def generate_password_hash(self, password, rounds=None):
+        """
+        Hash password with configured cost factor.
+        :param password:
+        :param rounds: cost factor, defaults to BCRYPT_LOG_ROUNDS
+        :return: hash as text
+        """
+        if not password:
+            raise ValueError('Password must be non-empty.')
+
+        return self._run(_hash_password, _to_bytes(password), rounds or self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        """
+        Check password against hash.
+        :param pw_hash:
+        :param password:
+        :return:
+        """
+        return self._run(_check_password, _to_bytes(pw_hash), _to_bytes(password))
+
+    def needs_rehash(self, pw_hash):
+        """
+        Whether hash was made with a cost factor other than the configured one.
+        :param pw_hash: hash in '$2b$<cost>$<salt and digest>' format
+        :return:
+        """
+        try:
+            return int(pw_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def _run(self, fn, *args):
+        pool = self._get_pool()
+        if pool is None:
+            return fn(*args)
+
+        with self._pending:
+            return pool.submit(fn, *args).result()
+
+    def _get_pool(self):
+        size = self.app.config.get('BCRYPT_POOL_SIZE', 0)
+        if not size:
+            return None
+
+        # Pools are not inherited over fork, every process starts its own.
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    # Imports multiprocessing, only processes hashing on a pool pay for it.
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    self._pending = threading.BoundedSemaphore(
+                        self.app.config.get('BCRYPT_MAX_PENDING', size * 4)
+                    )
+                    self._pool = ProcessPoolExecutor(max_workers=size)
+                    self._pid = os.getpid()
+
+        return self._pool
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def init_app(app):
+    app.extensions['password_hasher'] = PasswordHasher(app)
+
+
+hasher = LocalProxy(lambda: current_app.extensions['password_hasher'])
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import error
+
+from flask import current_app, url_for
+from werkzeug.local import LocalProxy
+
+PICTURES_DIR = 'static/pics'
+# Where originals were stored before IMAGE_ORIGINALS_DIR, served as static files with their metadata
+LEGACY_ORIGINALS_DIR = 'static/pics/originals'
+DEFAULT_PICTURE = 'default.png'
+
+# Rendition name -> (bounding box, output format or None to keep uploaded format, file name suffix)
+RENDITIONS = {
+    'thumbnail': ((125, 125), None, ''),
+    'card': ((400, 400), None, '_card'),
+    'detail': ((1024, 1024), None, '_detail'),
+    'webp': ((1024, 1024), 'WEBP', '_detail.webp'),
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidPicture(ValueError):
+    """
+    Uploaded file is not a picture Pillow can read, nothing was stored.
+    """
+    pass
+
+
+class ImagePipeline(object):
+    """
+    Store uploaded pictures under their content hash and generate renditions of them in a pool of IMAGE_WORKERS
+    threads, thumbnail first. Uploading a picture which is already stored writes nothing.
+    Originals keep EXIF data like camera and GPS position, they are stored outside the static folder and only
+    renditions, which Pillow saves without metadata, are served.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def save(self, stream, filename, callback=None):
+        """
+        Store uploaded picture and schedule its renditions, request threads neither decode nor resize it.
+        Listings show the default picture until its thumbnail is generated.
+        :param stream: file like object with picture content
+        :param filename: uploaded file name, only its extension is used
+        :param callback: called with picture once missing renditions are generated
+        :return: file name of thumbnail, relative to pictures directory
+        :raises InvalidPicture: when file is not a readable picture
+        """
+        picture, original_path = self.store(stream, filename)
+        if any(not os.path.exists(self._path(PICTURES_DIR, rendition_name(picture, name))) for name in RENDITIONS):
+            self.render_in_background(original_path, picture, callback)
+        return picture
+
+    def store(self, stream, filename):
+        """
+        Store uploaded picture without generating any rendition.
+        :param stream: file like object with picture content
+        :param filename: uploaded file name, only its extension is used
+        :return: tuple of (file name of thumbnail, path of original)
+        :raises InvalidPicture: when file is not a readable picture
+        """
+        _, ext = os.path.splitext(filename)
+        ext = ext.lower()
+        digest, original_path = self._store_original(stream, ext)
+        return digest + ext, original_path
+
+    def render_in_background(self, original_path, picture, callback=None):
+        """
+        Generate missing renditions of stored picture, thumbnail first, in the background.
+        Listings show the default picture until its thumbnail is generated.
+        :param original_path:
+        :param picture: thumbnail file name
+        :param callback: called with picture once renditions are generated
+        :return:
+        """
+        self._get_pool().submit(self._render_missing, original_path, picture, callback)
+
+    def drain(self):
+        """
+        Wait for scheduled renditions, e.g. before a command line process exits.
+        :return:
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=True)
+
+    def render(self, original_path, picture, name):
+        """
+        Generate one rendition of original picture.
+        :param original_path:
+        :param picture: thumbnail file name, renditions are named after it
+        :param name: key of RENDITIONS
+        :return:
+        """
+        # Pillow is only loaded by processes handling pictures.
+        from PIL import Image
+
+        size, image_format, _ = RENDITIONS[name]
+
+        with Image.open(original_path) as image:
+            output_format = image_format or image.format
+
+            # JPEG decoder can scale down by powers of two while decoding, much cheaper than a full decode.
+            image.draft('RGB', size)
+            image.thumbnail(size)
+
+            if output_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            elif output_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+
+            target = self._path(PICTURES_DIR, rendition_name(picture, name))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as output:
+                    image.save(output, format=output_format)
+                os.replace(tmp_path, target)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+    def _render_missing(self, original_path, picture, callback):
+        try:
+            for name in RENDITIONS:
+                if not os.path.exists(self._path(PICTURES_DIR, rendition_name(picture, name))):
+                    self.render(original_path, picture, name)
+            if callback is not None:
+                callback(picture)
+        except Exception as e:
+            error(f'Rendering {picture} failed: {e}', exc_info=True)
+
+    @property
+    def originals_dir(self):
+        """
+        Directory of uploaded pictures, IMAGE_ORIGINALS_DIR or originals/ in the instance folder.
+        """
+        return self.app.config.get('IMAGE_ORIGINALS_DIR') or os.path.join(self.app.instance_path, 'originals')
+
+    def move_legacy_originals(self):
+        """
+        Move originals stored under the static folder by earlier versions into originals directory.
+        :return: number of files moved
+        """
+        legacy = self._path(LEGACY_ORIGINALS_DIR)
+        if not os.path.isdir(legacy):
+            return 0
+
+        os.makedirs(self.originals_dir, exist_ok=True)
+        moved = 0
+        for name in os.listdir(legacy):
+            source = os.path.join(legacy, name)
+            if os.path.isfile(source):
+                shutil.move(source, os.path.join(self.originals_dir, name))
+                moved += 1
+        return moved
+
+    def _store_original(self, stream, ext):
+        """
+        Copy upload into originals directory under its content hash, once Pillow could read it.
+        :return: tuple of (digest, path of original)
+        """
+        originals = self.originals_dir
+        os.makedirs(originals, exist_ok=True)
+
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=originals, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as output:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                output.write(chunk)
+
+        # Checks headers and structure without decoding pixels, so rejecting a broken upload stays cheap.
+        from PIL import Image
+        try:
+            with Image.open(tmp_path) as image:
+                image.verify()
+        except Exception as e:
+            os.remove(tmp_path)
+            raise InvalidPicture(str(e))
+
+        digest = sha.hexdigest()[:32]
+        original_path = os.path.join(originals, digest + ext)
+        if os.path.exists(original_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, original_path)
+
+        return digest, original_path
+
+    def _path(self, *parts):
+        return os.path.join(self.app.root_path, *parts)
+
+    def _get_pool(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.app.config.get('IMAGE_WORKERS', 2),
+                                                    thread_name_prefix='image-pipeline')
+                    self._pid = os.getpid()
+        return self._pool
+
+
+def rendition_name(picture, name):
+    """
+    File name of rendition of picture.
+    :param picture: thumbnail file name as stored on product
+    :param name: key of RENDITIONS
+    :return:
+    """
+    base, ext = os.path.splitext(picture)
+    suffix = RENDITIONS[name][2]
+    return base + (suffix if '.' in suffix else suffix + ext)
+
+
+def picture_url(picture, name='thumbnail'):
+    """
+    Static url of picture rendition, falls back to the thumbnail while rendition is not generated yet and to
+    the default picture while thumbnail is not generated yet.
+    :param picture: thumbnail file name as stored on product
+    :param name: key of RENDITIONS
+    :return:
+    """
+    directory = os.path.join(current_app.root_path, PICTURES_DIR)
+    rendition = rendition_name(picture, name)
+    if rendition != picture and not os.path.exists(os.path.join(directory, rendition)):
+        rendition = picture
+    if rendition == picture and picture != DEFAULT_PICTURE and not os.path.exists(os.path.join(directory, picture)):
+        rendition = DEFAULT_PICTURE
+    return url_for('static', filename='pics/' + rendition)
+
+
+def init_app(app):
+    app.extensions['image_pipeline'] = ImagePipeline(app)
+    app.add_template_global(picture_url)
+
+
+pipeline = LocalProxy(lambda: current_app.extensions['image_pipeline'])
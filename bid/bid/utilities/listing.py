@@ -0,0 +1,298 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import abort
+from flask_sqlalchemy import Pagination
+from itsdangerous import BadSignature
+from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload, selectinload
+
+from bid import db
+from bid.models import Product, Bidder, BidStats
+from bid.utilities.auctions import closing_cutoff
+from bid.utilities.categories import subtree_ids
+from bid.utilities.tokens import tokens
+
+# How bid aggregates are loaded together with a page of products:
+#   denormalized - read aggregate columns maintained on product, single query
+#   aggregate    - outer join grouped subquery over bidder table, single query
+#   selectin     - load bids of all products on the page with one extra IN query
+LISTING_STRATEGIES = ('denormalized', 'aggregate', 'selectin')
+
+# Orders of category browsing, each served by an index on (category_id, closed_at, <sort column>, id):
+#   ending  - open auctions ending soonest first
+#   highest - highest bid first, auctions without bids last
+BROWSE_SORTS = ('ending', 'highest')
+
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def home_listing_query():
+    """
+    Products still open for bidding, most recent first.
+    :return:
+    """
+    return Product.query \
+        .filter(Product.last_date_to_bid >= closing_cutoff()) \
+        .order_by(Product.post_created.desc(), Product.id.desc())
+
+
+def user_listing_query(user):
+    """
+    Products posted by user, most recent first.
+    :param user:
+    :return:
+    """
+    return Product.query.filter_by(owner=user).order_by(Product.post_created.desc(), Product.id.desc())
+
+
+def category_listing_query(node):
+    """
+    Products of category and its subcategories still open for bidding.
+    :param node: CategoryNode
+    :return:
+    """
+    ids = subtree_ids(node)
+    category_filter = Product.category_id == ids[0] if len(ids) == 1 else Product.category_id.in_(ids)
+    return Product.query.filter(category_filter, Product.closed_at.is_(None),
+                                Product.last_date_to_bid >= closing_cutoff())
+
+
+def _category_cursor_serializer():
+    return tokens.serializer('category-cursor')
+
+
+def _decode_category_cursor(cursor, sort):
+    """
+    Decode cursor of browse_category(). Aborts with 400 on tampered, malformed or other sort's cursor.
+    :return: tuple (sort value, product id)
+    """
+    try:
+        cursor_sort, value, product_id = _category_cursor_serializer().loads(cursor)
+        if cursor_sort != sort:
+            raise ValueError(cursor_sort)
+        if sort == 'ending':
+            value = datetime.strptime(value, CURSOR_DATE_FORMAT)
+        elif value is not None:
+            value = Decimal(value)
+        return value, int(product_id)
+    except (BadSignature, TypeError, ValueError, InvalidOperation):
+        abort(400)
+
+
+def browse_category(node, sort='ending', cursor=None, per_page=10):
+    """
+    Page of open auctions of category, by cursor so deep pages cost the same as the first one.
+    :param node: CategoryNode
+    :param sort: one of BROWSE_SORTS
+    :param cursor: token from previous page, None for first page
+    :param per_page:
+    :return: KeysetPage, without previous page cursors
+    """
+    if sort not in BROWSE_SORTS:
+        raise ValueError(f'Unknown sort {sort!r}.')
+
+    query = category_listing_query(node)
+    if sort == 'ending':
+        if cursor:
+            value, product_id = _decode_category_cursor(cursor, sort)
+            query = query.filter(or_(Product.last_date_to_bid > value,
+                                     and_(Product.last_date_to_bid == value, Product.id > product_id)))
+        query = query.order_by(Product.last_date_to_bid, Product.id)
+    else:
+        if cursor:
+            value, product_id = _decode_category_cursor(cursor, sort)
+            if value is None:
+                query = query.filter(Product.highest_bid.is_(None), Product.id < product_id)
+            else:
+                query = query.filter(or_(Product.highest_bid < value,
+                                         and_(Product.highest_bid == value, Product.id < product_id),
+                                         Product.highest_bid.is_(None)))
+        # Products without bids sort last, NULL is the lowest value for MySQL and SQLite.
+        query = query.order_by(Product.highest_bid.desc(), Product.id.desc())
+
+    # One extra row tells whether there is anything beyond this page.
+    items = load_listing_page(query, limit=per_page + 1)
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        if sort == 'ending':
+            value = last.last_date_to_bid.strftime(CURSOR_DATE_FORMAT)
+        else:
+            value = str(last.highest_bid) if last.highest_bid is not None else None
+        next_cursor = _category_cursor_serializer().dumps([sort, value, last.id])
+
+    return KeysetPage(items, next_cursor=next_cursor)
+
+
+def paginate_listing(query, page, per_page=5, strategy='denormalized'):
+    """
+    Paginate product listing query loading owners and bid aggregates of whole page in one round trip.
+    Aborts with 404 on out of range pages, same as Flask-SQLAlchemy's paginate().
+    :param query: product query, e.g. from home_listing_query()
+    :param page: page number starting from 1
+    :param per_page:
+    :param strategy: one of LISTING_STRATEGIES
+    :return: Pagination with products as items, each carrying its bid_stats
+    """
+    if strategy not in LISTING_STRATEGIES:
+        raise ValueError(f'Unknown listing strategy {strategy!r}.')
+
+    if page < 1:
+        abort(404)
+
+    items = load_listing_page(query, strategy, limit=per_page, offset=(page - 1) * per_page)
+
+    if not items and page != 1:
+        abort(404)
+
+    if page == 1 and len(items) < per_page:
+        total = len(items)
+    else:
+        total = query.order_by(None).count()
+
+    return Pagination(query, page, per_page, total, items)
+
+
+class KeysetPage(object):
+    """
+    Page of products fetched by cursor, newest first. Cursors are opaque signed tokens.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _cursor_serializer():
+    return tokens.serializer('listing-cursor')
+
+
+def encode_cursor(direction, product):
+    """
+    Opaque cursor pointing before ('prev') or after ('next') given product.
+    :param direction: 'next' or 'prev'
+    :param product:
+    :return: url safe token
+    """
+    return _cursor_serializer().dumps([direction, product.post_created.strftime(CURSOR_DATE_FORMAT), product.id])
+
+
+def decode_cursor(cursor):
+    """
+    Decode cursor created by encode_cursor(). Aborts with 400 on tampered or malformed cursor.
+    :param cursor:
+    :return: tuple of (direction, post_created, product id)
+    """
+    try:
+        direction, post_created, product_id = _cursor_serializer().loads(cursor)
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return direction, datetime.strptime(post_created, CURSOR_DATE_FORMAT), int(product_id)
+    except (BadSignature, TypeError, ValueError):
+        abort(400)
+
+
+def keyset_listing(query, cursor=None, per_page=5, strategy='denormalized'):
+    """
+    Paginate product listing query by (post_created, id) without COUNT or OFFSET scans.
+    Ordering of query is replaced by newest first.
+    :param query: product query, e.g. from home_listing_query()
+    :param cursor: token from previous page, None for first page
+    :param per_page:
+    :param strategy: one of LISTING_STRATEGIES
+    :return: KeysetPage
+    """
+    if strategy not in LISTING_STRATEGIES:
+        raise ValueError(f'Unknown listing strategy {strategy!r}.')
+
+    direction = 'next'
+    query = query.order_by(None)
+
+    if cursor:
+        direction, post_created, product_id = decode_cursor(cursor)
+        if direction == 'next':
+            query = query.filter(or_(
+                Product.post_created < post_created,
+                and_(Product.post_created == post_created, Product.id < product_id)
+            ))
+        else:
+            query = query.filter(or_(
+                Product.post_created > post_created,
+                and_(Product.post_created == post_created, Product.id > product_id)
+            ))
+
+    if direction == 'next':
+        query = query.order_by(Product.post_created.desc(), Product.id.desc())
+    else:
+        query = query.order_by(Product.post_created.asc(), Product.id.asc())
+
+    # One extra row tells whether there is anything beyond this page.
+    items = load_listing_page(query, strategy, limit=per_page + 1)
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'prev':
+        items.reverse()
+        has_next, has_prev = bool(items), has_more
+    else:
+        has_next, has_prev = has_more, cursor is not None and bool(items)
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor('next', items[-1]) if has_next else None,
+        prev_cursor=encode_cursor('prev', items[0]) if has_prev else None
+    )
+
+
+def load_listing_page(query, strategy='denormalized', limit=None, offset=None):
+    """
+    Execute product query with given loading strategy.
+    :param query:
+    :param strategy: one of LISTING_STRATEGIES
+    :param limit:
+    :param offset:
+    :return: list of products
+    """
+    if strategy == 'aggregate':
+        # Bids of the page's products only are grouped. Joined as a derived table, MySQL rejects LIMIT in IN (...).
+        page = query.with_entities(Product.id.label('id')).limit(limit).offset(offset).subquery()
+        stats = db.session.query(
+            Bidder.product_id,
+            func.max(Bidder.bid_value).label('highest_bid'),
+            func.count(Bidder.id).label('bid_count')
+        ).join(page, page.c.id == Bidder.product_id).group_by(Bidder.product_id).subquery()
+
+        rows = query.options(joinedload(Product.owner)) \
+            .outerjoin(stats, stats.c.product_id == Product.id) \
+            .add_columns(stats.c.highest_bid, stats.c.bid_count) \
+            .limit(limit).offset(offset) \
+            .all()
+
+        products = list()
+        for product, highest_bid, bid_count in rows:
+            product._bid_stats = BidStats(highest_bid, bid_count or 0)
+            products.append(product)
+        return products
+
+    query = query.options(joinedload(Product.owner))
+
+    if strategy == 'selectin':
+        products = query.options(selectinload(Product.bids)).limit(limit).offset(offset).all()
+        for product in products:
+            product._bid_stats = BidStats(
+                max((item.bid_value for item in product.bids), default=None), len(product.bids)
+            )
+        return products
+
+    return query.limit(limit).offset(offset).all()
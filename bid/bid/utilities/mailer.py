@@ -0,0 +1,155 @@
+import atexit
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+import weakref
+from logging import error, warning
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from bid import mail
+
+
+class MailDispatcher(object):
+    """
+    Send mails from a background thread so requests never wait on SMTP.
+    Queued messages are sent in batches over one SMTP connection, which is kept open while mails keep coming and
+    closed after MAIL_IDLE_TIMEOUT seconds without any. Failed messages are retried with exponential backoff.
+    With MAIL_ASYNC disabled messages are sent synchronously.
+    """
+
+    def __init__(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self._queue = queue.Queue()
+        self._retries = list()
+        self._sequence = itertools.count()
+        self._connection = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        """
+        Queue message for sending.
+        :param message: flask_mail.Message
+        :return:
+        """
+        if not self.app.config.get('MAIL_ASYNC', True):
+            self.mail.send(message)
+            return
+
+        self._ensure_worker()
+        self._queue.put((message, 0))
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message was sent or given up on, including pending retries.
+        :param timeout: seconds to wait at most, None waits forever
+        :return: True when queue was drained in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_worker(self):
+        # Worker threads do not survive fork, every process starts its own.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    self._close_connection()
+                    continue
+
+                for message, attempt in batch:
+                    self._deliver(message, attempt)
+
+    def _next_batch(self):
+        """
+        Wait for next messages to send, due retries first.
+        :return: list of (message, attempt), empty when nothing arrived within idle timeout
+        """
+        batch_size = self.app.config.get('MAIL_BATCH_SIZE', 20)
+        batch = list()
+
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(batch) < batch_size:
+            _, _, message, attempt = heapq.heappop(self._retries)
+            batch.append((message, attempt))
+
+        timeout = self.app.config.get('MAIL_IDLE_TIMEOUT', 30)
+        if self._retries:
+            timeout = min(timeout, max(self._retries[0][0] - now, 0))
+
+        try:
+            if not batch:
+                batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        return batch
+
+    def _deliver(self, message, attempt):
+        try:
+            if self._connection is None:
+                self._connection = self.mail.connect().__enter__()
+            self._connection.send(message)
+
+        except Exception as e:
+            self._close_connection()
+            max_retries = self.app.config.get('MAIL_MAX_RETRIES', 5)
+
+            if attempt < max_retries:
+                delay = self.app.config.get('MAIL_RETRY_BACKOFF', 2) * 2 ** attempt
+                warning(f'Sending mail "{message.subject}" failed, retrying in {delay}s: {e}')
+                heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), message, attempt + 1))
+                return
+
+            error(f'Giving up sending mail "{message.subject}" to {message.recipients}: {e}', exc_info=True)
+
+        self._queue.task_done()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception as e:
+                warning(f'Closing SMTP connection failed: {e}')
+            self._connection = None
+
+
+# Dispatchers of every application of this process, flushed on exit
+dispatchers = weakref.WeakSet()
+
+
+def init_app(app):
+    app.extensions['mail_dispatcher'] = MailDispatcher(app, mail)
+    dispatchers.add(app.extensions['mail_dispatcher'])
+
+
+dispatcher = LocalProxy(lambda: current_app.extensions['mail_dispatcher'])
+
+
+@atexit.register
+def _flush_on_exit():
+    for app_dispatcher in list(dispatchers):
+        app_dispatcher.flush(timeout=app_dispatcher.app.config.get('MAIL_SHUTDOWN_TIMEOUT', 10))
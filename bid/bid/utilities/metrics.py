@@ -0,0 +1,317 @@
+import io
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from logging import warning
+
+from flask import g, request, current_app, has_app_context, has_request_context, before_render_template, \
+    template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from bid import db
+from bid.utilities.database import pool_status, REPLICA_BIND
+
+# Upper bounds, in seconds, of request and template render time histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Endpoint label of work done outside of requests, e.g. by background threads
+NO_ENDPOINT = '-'
+
+
+class Histogram(object):
+    """
+    Counts of observed values per bucket, plus their sum, as Prometheus histograms expose them.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: list of tuples (upper bound as Prometheus 'le' label, observations up to it)
+        """
+        total = 0
+        result = list()
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RequestMetrics(object):
+    """
+    Measurements of current request, kept on flask.g.
+    """
+    __slots__ = ('started', 'queries', 'query_time', 'status', 'profiler')
+
+    def __init__(self, profiler=None):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.status = None
+        self.profiler = profiler
+
+
+class Metrics(object):
+    """
+    Per endpoint request latency, SQL query count and time, template render time and slow queries of this process.
+    Opt-in with METRICS_ENABLED config, hooks are only registered by install() so disabled metrics cost nothing.
+    SQL queries are counted against the metrics of the application whose context runs them.
+    Requests slower than PROFILE_SLOW_REQUEST seconds are logged with their cProfile stats when they were sampled,
+    PROFILE_SAMPLE_RATE of requests run under the profiler.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.buckets = app.config.get('METRICS_LATENCY_BUCKETS', LATENCY_BUCKETS)
+        self.installed = False
+        # (endpoint, method, status) -> count
+        self.requests = defaultdict(int)
+        # (endpoint, method) -> Histogram of seconds
+        self.latency = dict()
+        # endpoint -> count, seconds
+        self.queries = defaultdict(int)
+        self.query_time = defaultdict(float)
+        self.slow_queries = defaultdict(int)
+        # template name -> Histogram of seconds
+        self.templates = dict()
+        self.profiled = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        """
+        Register request hooks, SQLAlchemy engine events and template signals.
+        :return:
+        """
+        if self.installed:
+            return
+        self.installed = True
+
+        self.app.before_request(self._before_request)
+        self.app.after_request(self._after_request)
+        self.app.teardown_request(self._teardown_request)
+        if not event.contains(Engine, 'after_cursor_execute', _after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        before_render_template.connect(self._before_render_template, self.app)
+        template_rendered.connect(self._template_rendered, self.app)
+
+    def _before_request(self):
+        profiler = None
+        if random.random() < self.app.config.get('PROFILE_SAMPLE_RATE', 0):
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        g.request_metrics = RequestMetrics(profiler)
+
+    def _after_request(self, response):
+        current = g.get('request_metrics')
+        if current is not None:
+            current.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc=None):
+        current = g.pop('request_metrics', None)
+        if current is None:
+            return
+
+        elapsed = time.perf_counter() - current.started
+        endpoint = request.endpoint or NO_ENDPOINT
+        status = current.status or 500
+        with self._lock:
+            self.requests[(endpoint, request.method, status)] += 1
+            histogram = self.latency.get((endpoint, request.method))
+            if histogram is None:
+                histogram = self.latency[(endpoint, request.method)] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+
+        if current.profiler is not None:
+            current.profiler.disable()
+            if elapsed >= self.app.config.get('PROFILE_SLOW_REQUEST', 1.0):
+                self._report_profile(current, endpoint, elapsed)
+
+    def _report_profile(self, current, endpoint, elapsed):
+        """
+        Log cumulative time of the most expensive functions of slow request, dump full stats to PROFILE_DIR when set.
+        :param current: RequestMetrics
+        :param endpoint:
+        :param elapsed: seconds
+        :return:
+        """
+        import pstats
+
+        self.profiled += 1
+        output = io.StringIO()
+        pstats.Stats(current.profiler, stream=output).sort_stats('cumulative').print_stats(25)
+        warning(f'Slow request {request.method} {request.path} ({endpoint}): {elapsed * 1000:.1f} ms, '
+                f'{current.queries} queries in {current.query_time * 1000:.1f} ms\n{output.getvalue()}')
+
+        directory = self.app.config.get('PROFILE_DIR')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            current.profiler.dump_stats(os.path.join(directory, f'{endpoint}-{int(time.time() * 1000)}.prof'))
+
+    def record_query(self, statement, elapsed):
+        """
+        Count query against current request and endpoint, log it when slow.
+        :param statement:
+        :param elapsed: seconds
+        :return:
+        """
+        current = g.get('request_metrics')
+        endpoint = (request.endpoint or NO_ENDPOINT) if has_request_context() else NO_ENDPOINT
+        if current is not None:
+            current.queries += 1
+            current.query_time += elapsed
+
+        slow = elapsed >= self.app.config.get('SLOW_QUERY_THRESHOLD', 0.25)
+        with self._lock:
+            self.queries[endpoint] += 1
+            self.query_time[endpoint] += elapsed
+            if slow:
+                self.slow_queries[endpoint] += 1
+
+        if slow:
+            warning(f'Slow query ({elapsed * 1000:.1f} ms) in {endpoint}: {statement}')
+
+    @staticmethod
+    def _before_render_template(sender, template, context, **extra):
+        g.setdefault('template_started', list()).append(time.perf_counter())
+
+    def _template_rendered(self, sender, template, context, **extra):
+        started = g.get('template_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        with self._lock:
+            histogram = self.templates.get(template.name)
+            if histogram is None:
+                histogram = self.templates[template.name] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+
+    def render(self):
+        """
+        Metrics in Prometheus text exposition format, including caches, connection pools, rate limits and
+        event stream subscribers.
+        :return: str
+        """
+        lines = list()
+        with self._lock:
+            _counter(lines, 'bid_requests_total', 'Requests by endpoint, method and status.',
+                     [(dict(endpoint=e, method=m, status=s), n) for (e, m, s), n in sorted(self.requests.items())])
+            _histogram(lines, 'bid_request_duration_seconds', 'Request latency by endpoint and method.',
+                       [(dict(endpoint=e, method=m), h) for (e, m), h in sorted(self.latency.items())])
+            _counter(lines, 'bid_sql_queries_total', 'SQL queries by endpoint.',
+                     [(dict(endpoint=e), n) for e, n in sorted(self.queries.items())])
+            _counter(lines, 'bid_sql_duration_seconds_total', 'Time spent in SQL queries by endpoint.',
+                     [(dict(endpoint=e), n) for e, n in sorted(self.query_time.items())])
+            _counter(lines, 'bid_sql_slow_queries_total', 'Queries over SLOW_QUERY_THRESHOLD by endpoint.',
+                     [(dict(endpoint=e), n) for e, n in sorted(self.slow_queries.items())])
+            _histogram(lines, 'bid_template_render_seconds', 'Template render time.',
+                       [(dict(template=t), h) for t, h in sorted(self.templates.items())])
+            _counter(lines, 'bid_profiled_slow_requests_total', 'Slow requests reported with profiler stats.',
+                     [(dict(), self.profiled)])
+
+        caches = self.app.extensions['caches'].values()
+        _counter(lines, 'bid_cache_hits_total', 'Cache hits.', [(dict(cache=c.name), c.hits) for c in caches])
+        _counter(lines, 'bid_cache_misses_total', 'Cache misses.', [(dict(cache=c.name), c.misses) for c in caches])
+        _gauge(lines, 'bid_cache_entries', 'Entries of in-process caches.',
+               [(dict(cache=c.name), len(c._backend)) for c in caches if hasattr(c._backend, '__len__')])
+
+        limiter = self.app.extensions['rate_limiter']
+        pubsub = self.app.extensions['pubsub']
+        engines = {'primary': db.get_engine(self.app)}
+        if REPLICA_BIND in (self.app.config.get('SQLALCHEMY_BINDS') or ()):
+            engines[REPLICA_BIND] = db.get_engine(self.app, bind=REPLICA_BIND)
+        pools = {name: pool_status(engine) for name, engine in engines.items()}
+        for key, metric, kind, description in POOL_METRICS:
+            samples = [(dict(database=name), status[key]) for name, status in pools.items() if key in status]
+            (_counter if kind == 'counter' else _gauge)(lines, metric, description, samples)
+
+        _counter(lines, 'bid_rate_limited_total', 'Requests rejected by rate limits by endpoint.',
+                 [(dict(endpoint=e), n) for e, n in sorted(limiter.rejected.items())])
+        if hasattr(limiter._backend, '__len__'):
+            _gauge(lines, 'bid_rate_limit_keys', 'Keys tracked by in-process rate limit backend.',
+                   [(dict(), len(limiter._backend))])
+        if pubsub._broker is not None and hasattr(pubsub._broker, 'subscriber_count'):
+            _gauge(lines, 'bid_event_stream_subscribers', 'Open product event streams.',
+                   [(dict(), pubsub._broker.subscriber_count())])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', list()).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    metrics = current_app.extensions.get('metrics') if has_app_context() else None
+    if metrics is not None:
+        metrics.record_query(statement, elapsed)
+
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# (pool_status() key, metric name, type, help)
+POOL_METRICS = (
+    ('size', 'bid_db_pool_size', 'gauge', 'Connections kept in pool.'),
+    ('checked_out', 'bid_db_pool_checked_out', 'gauge', 'Connections currently in use.'),
+    ('overflow', 'bid_db_pool_overflow', 'gauge', 'Connections open beyond pool size.'),
+    ('checkouts', 'bid_db_pool_checkouts_total', 'counter', 'Connections handed out by pool.'),
+    ('timeouts', 'bid_db_pool_timeouts_total', 'counter', 'Requests which gave up waiting for a connection.'),
+    ('wait_ms_total', 'bid_db_pool_wait_milliseconds_total', 'counter', 'Time spent waiting for a connection.'),
+)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _header(lines, name, kind, description):
+    lines.append(f'# HELP {name} {description}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _counter(lines, name, description, samples):
+    _header(lines, name, 'counter', description)
+    lines.extend(f'{name}{_labels(labels)} {value}' for labels, value in samples)
+
+
+def _gauge(lines, name, description, samples):
+    _header(lines, name, 'gauge', description)
+    lines.extend(f'{name}{_labels(labels)} {value}' for labels, value in samples)
+
+
+def _histogram(lines, name, description, samples):
+    _header(lines, name, 'histogram', description)
+    for labels, histogram in samples:
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels(dict(labels, le=bound))} {count}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+
+def init_app(app):
+    if app.config.get('METRICS_ENABLED', False):
+        app.extensions['metrics'] = Metrics(app)
+        app.extensions['metrics'].install()
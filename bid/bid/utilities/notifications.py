@@ -0,0 +1,60 @@
+from flask import url_for
+from flask_mail import Message
+
+from bid.models import User
+from bid.utilities.mailer import dispatcher
+
+
+def product_link(product_id):
+    """
+    External link to product page. Outside of requests it needs SERVER_NAME to be configured.
+    :param product_id:
+    :return: url or None when it can not be built
+    """
+    try:
+        return url_for('main.product', product_id=product_id, _external=True)
+    except RuntimeError:
+        return None
+
+
+def send_outbid_email(user_id, product):
+    """
+    Let previous highest bidder know somebody placed a higher bid.
+    :param user_id: id of outbid user
+    :param product:
+    :return:
+    """
+    user = User.query.get(user_id)
+    if user is None:
+        return
+
+    link = product_link(product.id)
+    msg = Message(f'You were outbid on {product.product_name}', sender='noreply@demo.com', recipients=[user.email])
+    msg.body = f'''Somebody placed a higher bid of {product.highest_bid} on {product.product_name}.
+    {f"Place a new bid here: {link}" if link else ""}
+
+    You are receiving this email because you bid on this product.
+    '''
+    dispatcher.send(msg)
+
+
+def send_auction_won_email(user_id, product):
+    """
+    Congratulate winner of closed auction.
+    :param user_id: id of winning user
+    :param product:
+    :return:
+    """
+    user = User.query.get(user_id)
+    if user is None:
+        return
+
+    link = product_link(product.id)
+    msg = Message(f'You won the auction for {product.product_name}', sender='noreply@demo.com',
+                  recipients=[user.email])
+    msg.body = f'''Congratulations! Your bid of {product.highest_bid} won the auction for {product.product_name}.
+    {f"Auction details: {link}" if link else ""}
+
+    The seller will contact you about payment and delivery.
+    '''
+    dispatcher.send(msg)
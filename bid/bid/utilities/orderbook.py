@@ -0,0 +1,225 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import func
+from werkzeug.local import LocalProxy
+
+from bid import db
+from bid.models import Bidder, BidEvent
+
+RankedBid = namedtuple('RankedBid', ['bidder_id', 'bid_value'])
+
+
+class OrderBook(object):
+    """
+    Current bid of every bidder of one product, highest first, earliest bid first on equal values. Sorted by
+    (-bid value, bid event id) so highest bid, rank of a bidder and top bids are bisect lookups.
+    Keeps the depth highest bids only, books which dropped bids are truncated: bidders outside of them are ranked
+    from database.
+    """
+
+    def __init__(self, version, depth):
+        # Product version the book is current with
+        self.version = version
+        self.depth = depth
+        self.truncated = False
+        self._keys = list()
+        self._bidders = dict()
+        self._lock = threading.Lock()
+
+    def place(self, bidder_id, bid_value, event_id):
+        """
+        Replace current bid of bidder. Bids ranking below the depth highest ones are dropped.
+        :param bidder_id:
+        :param bid_value:
+        :param event_id: id of BidEvent of the bid
+        :return: False when book can not tell the bidder's rank anymore and must be reloaded
+        """
+        with self._lock:
+            previous = self._bidders.pop(bidder_id, None)
+            if previous is not None:
+                del self._keys[bisect_left(self._keys, previous)]
+
+            key = (-bid_value, event_id, bidder_id)
+            insort(self._keys, key)
+            self._bidders[bidder_id] = key
+
+            if len(self._keys) > self.depth:
+                _, _, dropped = self._keys.pop()
+                del self._bidders[dropped]
+                self.truncated = True
+            elif previous is not None and self.truncated and self._keys[-1] == key:
+                # Lowered bid fell to the bottom, a bid which was not kept may rank above it now.
+                return False
+            return True
+
+    def highest(self):
+        """
+        :return: RankedBid or None without bids
+        """
+        with self._lock:
+            if not self._keys:
+                return None
+            value, _, bidder_id = self._keys[0]
+            return RankedBid(bidder_id, -value)
+
+    def rank(self, bidder_id):
+        """
+        Position of bidder's current bid, 1 for the highest.
+        :param bidder_id:
+        :return: rank or None when bidder has no bid in the book
+        """
+        with self._lock:
+            key = self._bidders.get(bidder_id)
+            if key is None:
+                return None
+            return bisect_left(self._keys, key) + 1
+
+    def top(self, count=10):
+        """
+        :param count:
+        :return: list of RankedBid, highest first
+        """
+        with self._lock:
+            return [RankedBid(bidder_id, -value) for value, _, bidder_id in self._keys[:count]]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class OrderBooks(object):
+    """
+    Order books of the ORDER_BOOK_PRODUCTS most recently used products of this process, loaded lazily from bid
+    events and kept current by bids placed in this process. A book is used only while product version, bumped by
+    every bid, matches the version it was loaded or last updated at, so bids placed by other processes make it
+    reload instead of serving stale ranks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._books = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, product):
+        """
+        Order book current with product.
+        :param product: Product, as read in current transaction
+        :return: OrderBook
+        """
+        with self._lock:
+            book = self._books.get(product.id)
+            if book is not None and book.version == product.version:
+                self._books.move_to_end(product.id)
+                return book
+
+        book = self._load(product.id, product.version)
+        with self._lock:
+            self._books[product.id] = book
+            self._books.move_to_end(product.id)
+            while len(self._books) > self.app.config.get('ORDER_BOOK_PRODUCTS', 1000):
+                self._books.popitem(last=False)
+        return book
+
+    def record(self, product_id, bids, previous_version, version):
+        """
+        Apply bids committed by this process to the product's book, if the book was current before them.
+        :param product_id:
+        :param bids: list of tuples (bidder id, bid value, id of BidEvent), in the order they were placed
+        :param previous_version: product version the bids were placed on
+        :param version: product version after the bids
+        :return:
+        """
+        bids = [(bidder_id, self._as_loaded(bid_value), event_id) for bidder_id, bid_value, event_id in bids]
+        with self._lock:
+            book = self._books.get(product_id)
+            if book is None:
+                return
+            if book.version != previous_version \
+                    or not all(book.place(bidder_id, bid_value, event_id) for bidder_id, bid_value, event_id in bids):
+                del self._books[product_id]
+                return
+            book.version = version
+
+    def _as_loaded(self, bid_value):
+        """
+        Bid value as the database returns it, so recorded and loaded bids are alike, e.g. Decimal('150.0000000000')
+        on SQLite for a bid placed as 150.
+        :param bid_value: value as placed, int or Decimal
+        :return: Decimal
+        """
+        process = BidEvent.__table__.c.bid_value.type.result_processor(db.engine.dialect, None)
+        return process(bid_value) if process is not None else Decimal(bid_value)
+
+    def discard(self, product_id):
+        with self._lock:
+            self._books.pop(product_id, None)
+
+    def _load(self, product_id, version):
+        """
+        Build book from the latest event of every bidder of product.
+        :return: OrderBook
+        """
+        depth = self.app.config.get('ORDER_BOOK_DEPTH', 100)
+        book = OrderBook(version, depth)
+        # One row beyond depth tells whether the book is truncated.
+        for bidder_id, bid_value, event_id in order_book_query(product_id).limit(depth + 1):
+            book.place(bidder_id, bid_value, event_id)
+        self.loads += 1
+        return book
+
+
+def order_book_query(product_id):
+    """
+    Latest bid event of every bidder of product, highest bid first.
+    :param product_id:
+    :return: query of tuples (bidder id, bid value, event id)
+    """
+    latest = db.session.query(func.max(BidEvent.id).label('id')) \
+        .filter(BidEvent.product_id == product_id) \
+        .group_by(BidEvent.bidder_id) \
+        .subquery()
+    return db.session.query(BidEvent.bidder_id, BidEvent.bid_value, BidEvent.id) \
+        .join(latest, BidEvent.id == latest.c.id) \
+        .order_by(BidEvent.bid_value.desc(), BidEvent.id)
+
+
+def leaderboard(product, bidder_id=None, count=10):
+    """
+    Top bids of product and rank of a bidder's bid.
+    :param product:
+    :param bidder_id: bidder to rank, e.g. current user
+    :param count: top bids returned
+    :return: tuple (list of RankedBid, rank of bidder or None when bidder has no bid)
+    """
+    book = order_books.get(product)
+    rank = None
+    if bidder_id is not None:
+        rank = book.rank(bidder_id)
+        if rank is None and book.truncated:
+            rank = _rank_from_database(product.id, bidder_id)
+    return book.top(count), rank
+
+
+def _rank_from_database(product_id, bidder_id):
+    """
+    Rank of bidder's current bid, for bids below the ones kept in order book.
+    :return: rank or None when bidder has no bid
+    """
+    bid = Bidder.query.filter(Bidder.product_id == product_id, Bidder.bidders_id == bidder_id).first()
+    if bid is None:
+        return None
+    higher = db.session.query(func.count(Bidder.id)) \
+        .filter(Bidder.product_id == product_id, Bidder.bid_value > bid.bid_value) \
+        .scalar()
+    return higher + 1
+
+
+def init_app(app):
+    app.extensions['order_books'] = OrderBooks(app)
+
+
+order_books = LocalProxy(lambda: current_app.extensions['order_books'])
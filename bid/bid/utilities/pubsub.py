@@ -0,0 +1,220 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
+
+
+class Broker(object):
+    """
+    Publish/subscribe interface. The in-process broker only reaches subscribers of the publishing process,
+    implement it on top of a shared message bus (redis pub/sub, ...) and point PUBSUB_BROKER config to the
+    class when running several worker processes.
+    """
+
+    def publish(self, channel, message):
+        """
+        Deliver message to every current subscriber of channel, without blocking on slow subscribers.
+        :param channel:
+        :param message: JSON serializable value
+        :return:
+        """
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """
+        :param channel:
+        :return: Subscription receiving messages published from now on
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class Subscription(object):
+    """
+    Messages of one channel buffered for one subscriber. When subscriber falls behind by more than queue size,
+    oldest messages are dropped; bid updates are snapshots so only the latest one matters.
+    """
+
+    def __init__(self, broker, channel, queue_size):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def put(self, message):
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Wait for next message.
+        :param timeout: seconds
+        :return: message or None when timed out
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(Broker):
+    """
+    Broker delivering messages to subscribers in this process. Idle subscribers cost a queue each, publishing
+    costs one non-blocking put per subscriber of the channel.
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscriptions) for subscriptions in self._channels.values())
+
+
+class PubSub(object):
+    """
+    Application pub/sub, broker is created on first use from config: PUBSUB_BROKER (import path of Broker class)
+    and PUBSUB_QUEUE_SIZE.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._broker = None
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    @property
+    def broker(self):
+        if self._broker is None:
+            with self._lock:
+                if self._broker is None:
+                    broker_class = import_string(self.app.config.get('PUBSUB_BROKER',
+                                                                     'bid.utilities.pubsub.InProcessBroker'))
+                    self._broker = broker_class(queue_size=self.app.config.get('PUBSUB_QUEUE_SIZE', 16))
+        return self._broker
+
+    def publish(self, channel, message):
+        self.broker.publish(channel, message)
+
+    def subscribe(self, channel):
+        return self.broker.subscribe(channel)
+
+    def acquire_stream(self):
+        """
+        Reserve one of SSE_MAX_STREAMS event streams of this process.
+        :return: False when every stream is taken, otherwise release it with release_stream() once response closes
+        """
+        with self._lock:
+            if self._streams >= self.app.config.get('SSE_MAX_STREAMS', 50):
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+
+def product_channel(product_id):
+    return f'product:{product_id}'
+
+
+def bid_update(product):
+    """
+    Bid state of product pushed to its subscribers.
+    :param product:
+    :return: dict
+    """
+    return {
+        'product_id': product.id,
+        'highest_bid': str(product.highest_bid) if product.highest_bid is not None else None,
+        'highest_bidder_id': product.highest_bidder_id,
+        'bid_count': product.bid_count,
+        'closed': product.closed_at is not None
+    }
+
+
+def event_stream(subscription, initial=None, event='bid', heartbeat=15):
+    """
+    Server-sent events of subscription. A comment line is sent when nothing was published for heartbeat seconds,
+    so proxies keep the connection open and disconnected clients are noticed. Subscription is closed when client
+    goes away.
+    Runs after request context is gone, must not touch database session or current_user.
+    :param subscription:
+    :param initial: message sent right away, so updates published before subscribing are not missed
+    :param event: event name of messages
+    :param heartbeat: seconds
+    :return: generator of text chunks
+    """
+    try:
+        yield f'retry: {heartbeat * 1000}\n\n'
+        if initial is not None:
+            yield f'event: {event}\ndata: {json.dumps(initial)}\n\n'
+
+        while True:
+            message = subscription.get(timeout=heartbeat)
+            if message is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield f'event: {event}\ndata: {json.dumps(message)}\n\n'
+    finally:
+        subscription.close()
+
+
+def poll_stream(initial, event='bid', interval=30):
+    """
+    Server-sent events answering a single poll: the current message, then the stream ends and the browser's event
+    source reconnects after interval seconds. Holds no thread between polls, for clients past SSE_MAX_STREAMS.
+    :param initial: current message
+    :param event: event name of the message
+    :param interval: seconds
+    :return: generator of text chunks
+    """
+    yield f'retry: {interval * 1000}\n\n'
+    yield f'event: {event}\ndata: {json.dumps(initial)}\n\n'
+
+
+def init_app(app):
+    app.extensions['pubsub'] = PubSub(app)
+
+
+pubsub = LocalProxy(lambda: current_app.extensions['pubsub'])
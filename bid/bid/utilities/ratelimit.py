@@ -0,0 +1,233 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.local import LocalProxy
+from werkzeug.utils import import_string
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour|day)\s+per\s+(\w+)\s*$')
+
+
+class RateLimitBackend(object):
+    """
+    Storage of request allowances. In-memory backends limit every worker process on its own, implement this on
+    top of a shared store (redis, memcached, ...) and point RATE_LIMIT_BACKEND config to the class to enforce
+    limits across processes.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+
+    def hit(self, key, limit, period):
+        """
+        Count one request against allowance of key.
+        :param key:
+        :param limit: requests allowed per period
+        :param period: seconds
+        :return: seconds to wait before request is allowed, 0 when it is allowed now
+        """
+        raise NotImplementedError
+
+
+class TokenBucketBackend(RateLimitBackend):
+    """
+    Token bucket per key holding up to limit tokens, refilled at limit / period tokens per second.
+    Allows bursts of limit requests, then a steady rate. Least recently used keys are dropped beyond max_keys.
+    """
+
+    def __init__(self, max_keys=100000):
+        super().__init__(max_keys)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        rate = limit / period
+
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SlidingWindowBackend(RateLimitBackend):
+    """
+    Sliding window counter per key: requests of the current fixed window plus the previous window's requests
+    weighted by how much of it still overlaps the sliding window. Two counters per key, no per-request log.
+    """
+
+    def __init__(self, max_keys=100000):
+        super().__init__(max_keys)
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        window, offset = divmod(now, period)
+        overlap = 1 - offset / period
+
+        with self._lock:
+            current_window, current, previous = self._windows.pop(key, (window, 0, 0))
+            if current_window != window:
+                previous = current if current_window == window - 1 else 0
+                current = 0
+
+            if previous * overlap + current + 1 <= limit:
+                current += 1
+                wait = 0
+            elif current + 1 > limit:
+                # Current window alone is full, wait for the next one.
+                wait = period - offset
+            else:
+                # Wait until enough of the previous window slid out.
+                wait = (overlap - (limit - current - 1) / previous) * period
+
+            self._windows[key] = (window, current, previous)
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+
+        return wait
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class RateLimitExceeded(TooManyRequests):
+
+    def __init__(self, retry_after):
+        super().__init__('Too many requests, please slow down and try again later.')
+        self.retry_after = int(math.ceil(retry_after))
+
+    def get_headers(self, environ=None):
+        return super().get_headers(environ) + [('Retry-After', str(self.retry_after))]
+
+
+class RateLimiter(object):
+    """
+    Limits of endpoints from RATE_LIMITS config, e.g. {'main.login': ['5/minute per ip', '10/hour per email']}.
+    Keys limits are counted per: user (current user, ip when anonymous), ip, email (submitted in form) or any
+    URL variable of the endpoint, e.g. product for product_id.
+    Backend is created on first use from RATE_LIMIT_BACKEND (import path of RateLimitBackend class).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._backend = None
+        self._limits = {}
+        # Rejected requests per endpoint, for metrics
+        self.rejected = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    backend_class = import_string(self.app.config.get('RATE_LIMIT_BACKEND',
+                                                                      'bid.utilities.ratelimit.TokenBucketBackend'))
+                    self._backend = backend_class(max_keys=self.app.config.get('RATE_LIMIT_MAX_KEYS', 100000))
+        return self._backend
+
+    def limits(self, endpoint):
+        """
+        Parsed limits of endpoint, parsed once.
+        :param endpoint:
+        :return: list of tuples (limit, period, scope)
+        """
+        limits = self._limits.get(endpoint)
+        if limits is None:
+            limits = [parse_limit(spec) for spec in self.app.config.get('RATE_LIMITS', {}).get(endpoint, ())]
+            self._limits[endpoint] = limits
+        return limits
+
+    def check(self, endpoint):
+        """
+        Count current request against every limit of endpoint.
+        :param endpoint:
+        :return: seconds to wait when a limit is exceeded, 0 otherwise
+        """
+        wait = 0
+        for limit, period, scope in self.limits(endpoint):
+            key = f'{endpoint}:{scope}:{_scope_value(scope)}'
+            wait = max(wait, self.backend.hit(key, limit, period))
+        if wait:
+            self.rejected[endpoint] += 1
+        return wait
+
+
+def parse_limit(spec):
+    """
+    Parse limit like '10/minute per user'.
+    :param spec:
+    :return: tuple (limit, period in seconds, scope)
+    """
+    match = LIMIT_PATTERN.match(spec)
+    if match is None:
+        raise ValueError(f'Invalid rate limit {spec!r}, expected e.g. "10/minute per user".')
+    limit, period, scope = match.groups()
+    return int(limit), PERIODS[period], scope
+
+
+def _scope_value(scope):
+    if scope == 'user':
+        return current_user.id if current_user.is_authenticated else f'ip:{request.remote_addr}'
+    if scope == 'ip':
+        return request.remote_addr
+    if scope == 'email':
+        email = request.form.get('email')
+        if not email:
+            # Any JSON value parses, views reject bodies which are not objects after the limit is checked.
+            data = request.get_json(silent=True)
+            email = data.get('email') if isinstance(data, dict) else None
+        return str(email or '').strip().lower()
+
+    view_args = request.view_args or {}
+    return view_args.get(scope, view_args.get(f'{scope}_id'))
+
+
+def init_app(app):
+    app.extensions['rate_limiter'] = RateLimiter(app)
+
+
+limiter = LocalProxy(lambda: current_app.extensions['rate_limiter'])
+
+
+def rate_limit(methods=('POST',)):
+    """
+    Apply RATE_LIMITS of endpoint to requests of given methods, answering 429 with Retry-After when exceeded.
+    Place it below login_required so limits per user see the logged in user.
+    :param methods: limited HTTP methods, GET of forms is usually cheap enough to leave alone
+    :return:
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated_view(*args, **kwargs):
+            if request.method in methods and current_app.config.get('RATE_LIMIT_ENABLED', True):
+                wait = limiter.check(request.endpoint)
+                if wait:
+                    raise RateLimitExceeded(wait)
+            return func(*args, **kwargs)
+
+        return decorated_view
+
+    return decorator
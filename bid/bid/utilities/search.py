@@ -0,0 +1,155 @@
+import re
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import DDL, Float, event, func, case, or_, table, column, literal, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+from bid import db
+from bid.models import Product
+from bid.utilities.listing import home_listing_query, paginate_listing
+
+# Full-text index on searchable product columns, MySQL FULLTEXT or SQLite FTS5 table kept in sync by triggers.
+# Same statements are run by the migration which introduced search.
+MYSQL_FULLTEXT_DDL = 'ALTER TABLE product ADD FULLTEXT INDEX ft_product_search ' \
+                     '(product_name, product_description, category)'
+
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE product_fts USING fts5("
+    "product_name, product_description, category, content='product', content_rowid='id')",
+    "CREATE TRIGGER product_fts_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, product_name, product_description, category) "
+    "VALUES (new.id, new.product_name, new.product_description, new.category); END",
+    "CREATE TRIGGER product_fts_delete AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, product_name, product_description, category) "
+    "VALUES ('delete', old.id, old.product_name, old.product_description, old.category); END",
+    "CREATE TRIGGER product_fts_update AFTER UPDATE OF product_name, product_description, category ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, product_name, product_description, category) "
+    "VALUES ('delete', old.id, old.product_name, old.product_description, old.category); "
+    "INSERT INTO product_fts(rowid, product_name, product_description, category) "
+    "VALUES (new.id, new.product_name, new.product_description, new.category); END",
+)
+
+event.listen(Product.__table__, 'after_create', DDL(MYSQL_FULLTEXT_DDL).execute_if(dialect='mysql'))
+for statement in SQLITE_FTS_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS product_fts').execute_if(dialect='sqlite'))
+
+product_fts = table('product_fts', column('rowid'), column('rank'))
+
+
+class FullTextMatch(ColumnElement):
+    """
+    MySQL relevance of columns matching boolean mode full-text query.
+    """
+    type = Float()
+
+    def __init__(self, columns, against):
+        self.columns = columns
+        self.against = literal(against)
+
+
+@compiles(FullTextMatch, 'mysql')
+def compile_full_text_match(element, compiler, **kwargs):
+    return 'MATCH (%s) AGAINST (%s IN BOOLEAN MODE)' % (
+        ', '.join(compiler.process(column, **kwargs) for column in element.columns),
+        compiler.process(element.against, **kwargs)
+    )
+
+
+SearchResult = namedtuple('SearchResult', ['products', 'categories', 'price_bands'])
+Facet = namedtuple('Facet', ['value', 'label', 'count'])
+
+
+def search_products(text, category=None, price_band=None, page=1, per_page=10):
+    """
+    Full-text search over names, descriptions and categories of products open for bidding.
+    Facet counts are computed for all matching products, regardless of selected category and price band.
+    :param text: words to search, every word has to match (prefix match)
+    :param category: show only products of this category
+    :param price_band: show only products in this band, index into SEARCH_PRICE_BANDS
+    :param page:
+    :param per_page:
+    :return: SearchResult
+    """
+    words = re.findall(r'\w+', text or '')
+    price = price_band_expression()
+
+    query = _match(home_listing_query(), words, order_by_relevance=True)
+    if category:
+        query = query.filter(Product.category == category)
+    if price_band is not None:
+        query = query.filter(price == price_band)
+
+    products = paginate_listing(query, page=page, per_page=per_page, strategy='denormalized')
+
+    open_products = home_listing_query().order_by(None)
+
+    category_counts = _match(open_products.with_entities(Product.category, func.count(Product.id)), words) \
+        .group_by(Product.category) \
+        .order_by(func.count(Product.id).desc(), Product.category) \
+        .all()
+
+    band_counts = dict(_match(open_products.with_entities(price, func.count(Product.id)), words)
+                       .group_by(price)
+                       .all())
+
+    return SearchResult(
+        products,
+        [Facet(name, name, count) for name, count in category_counts],
+        [Facet(band, label, band_counts[band]) for band, label in enumerate(price_band_labels()) if band in band_counts]
+    )
+
+
+def price_band_expression():
+    """
+    SQL expression of price band index of product, price being highest bid or minimum bid without bids.
+    :return:
+    """
+    bounds = current_app.config.get('SEARCH_PRICE_BANDS', (1000, 5000, 10000, 50000))
+    price = func.coalesce(Product.highest_bid, Product.minimum_bid)
+    return case([(price < bound, band) for band, bound in enumerate(bounds)], else_=len(bounds))
+
+
+def price_band_labels():
+    """
+    Human readable labels of price bands.
+    :return:
+    """
+    bounds = current_app.config.get('SEARCH_PRICE_BANDS', (1000, 5000, 10000, 50000))
+    lower = [0] + list(bounds)
+    return [f'{low} - {high - 1}' for low, high in zip(lower, bounds)] + [f'{bounds[-1]}+']
+
+
+def _match(query, words, order_by_relevance=False):
+    """
+    Restrict product query to products matching all words, using full-text index of database.
+    :param query:
+    :param words:
+    :param order_by_relevance: replace ordering with best matches first
+    :return:
+    """
+    if not words:
+        return query
+
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        score = FullTextMatch([Product.product_name, Product.product_description, Product.category],
+                              ' '.join(f'+{word}*' for word in words))
+        query = query.filter(score > 0)
+        return query.order_by(None).order_by(score.desc(), Product.id.desc()) if order_by_relevance else query
+
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        query = query.join(product_fts, product_fts.c.rowid == Product.id) \
+            .filter(literal_column('product_fts').op('MATCH')(match))
+        return query.order_by(None).order_by(product_fts.c.rank, Product.id.desc()) if order_by_relevance else query
+
+    # No full-text index, scan with LIKE.
+    for word in words:
+        pattern = f'%{word}%'
+        query = query.filter(or_(Product.product_name.ilike(pattern), Product.product_description.ilike(pattern),
+                                 Product.category.ilike(pattern)))
+    return query
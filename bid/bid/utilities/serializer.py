@@ -0,0 +1,201 @@
+import json
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from operator import methodcaller
+
+from sqlalchemy import inspect, Boolean, Date, DateTime, Integer, Numeric, String
+
+
+def _to_json_value(value):
+    """
+    Convert value of unknown type to JSON compatible value. Decimals become strings so no precision is lost.
+    :param value:
+    :return:
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _column_converter(column):
+    """
+    Converter of column values to JSON compatible values, chosen once from column type.
+    :param column:
+    :return: callable or None when values are JSON compatible as they are
+    """
+    if isinstance(column.type, (DateTime, Date)):
+        return methodcaller('isoformat')
+    if isinstance(column.type, Numeric) and column.type.asdecimal:
+        return str
+    if isinstance(column.type, (Integer, String, Boolean)):
+        return None
+    return _to_json_value
+
+
+class ModelSerializer(object):
+    """
+    Convert model instances to dicts of their columns. Column keys are resolved once per model, not per row,
+    and loaded values are read straight from instance state; only expired or deferred columns go through
+    attribute access and may load from database.
+    """
+
+    def __init__(self, model, exclude=(), extra=None):
+        """
+        :param model: mapped class
+        :param exclude: column keys never serialized
+        :param extra: dict of additional field name -> callable computing it from instance
+        """
+        self.model = model
+        attrs = [attr for attr in inspect(model).column_attrs if attr.key not in exclude]
+        self.columns = tuple(attr.key for attr in attrs)
+        self.converters = {attr.key: _column_converter(attr.columns[0]) for attr in attrs}
+        self.extra = dict(extra or {})
+        self.fields = self.columns + tuple(self.extra)
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def select(self, fields=None):
+        """
+        Validate field selection.
+        :param fields: iterable of field names or comma separated string, None selects every field
+        :return: tuple of field names
+        """
+        if fields is None:
+            return self.fields
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ValueError(f'Unknown field(s) of {self.model.__name__}: {", ".join(unknown)}')
+        return tuple(fields)
+
+    def serialize(self, obj, fields=None):
+        """
+        :param obj: model instance
+        :param fields: field selection, see select()
+        :return: dict
+        """
+        return self._plan(fields)(obj)
+
+    def serialize_many(self, objs, fields=None):
+        """
+        :param objs: iterable of model instances
+        :param fields: field selection, see select()
+        :return: list of dicts
+        """
+        plan = self._plan(fields)
+        return [plan(obj) for obj in objs]
+
+    def stream(self, objs, fields=None, chunk_size=100):
+        """
+        Serialize instances as JSON array, piece by piece, so large results are never held in memory at once.
+        :param objs: iterable of model instances, e.g. query with yield_per()
+        :param fields: field selection, see select()
+        :param chunk_size: instances per yielded text chunk
+        :return: generator of text chunks
+        """
+        plan = self._plan(fields)
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+
+        yield '['
+        chunk = list()
+        first = True
+        for obj in objs:
+            chunk.append(encode(plan(obj)))
+            if len(chunk) >= chunk_size:
+                yield ('' if first else ',') + ','.join(chunk)
+                chunk, first = list(), False
+        if chunk:
+            yield ('' if first else ',') + ','.join(chunk)
+        yield ']'
+
+    def _plan(self, fields):
+        """
+        Build, once per field selection, a function serializing an instance.
+        :param fields:
+        :return:
+        """
+        key = fields if fields is None or isinstance(fields, (str, tuple)) else tuple(fields)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        selected = self.select(fields)
+        columns = [(field, self.converters[field]) for field in selected if field in self.converters]
+        extra = [(field, self.extra[field]) for field in selected if field in self.extra]
+
+        def plan(obj):
+            state = obj.__dict__
+            result = {}
+            for column, convert in columns:
+                value = state[column] if column in state else getattr(obj, column)
+                result[column] = value if convert is None or value is None else convert(value)
+            for field, compute in extra:
+                result[field] = _to_json_value(compute(obj))
+            return result
+
+        with self._lock:
+            if len(self._plans) < 64:
+                self._plans[key] = plan
+        return plan
+
+
+def stream_rows(rows, chunk_size=100):
+    """
+    Serialize named tuples, e.g. rows of column queries, as JSON array of objects piece by piece.
+    :param rows: iterable of named tuples, e.g. query with yield_per()
+    :param chunk_size: rows per yielded text chunk
+    :return: generator of text chunks
+    """
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    yield '['
+    chunk = list()
+    first = True
+    for row in rows:
+        chunk.append(encode({field: _to_json_value(value) for field, value in row._asdict().items()}))
+        if len(chunk) >= chunk_size:
+            yield ('' if first else ',') + ','.join(chunk)
+            chunk, first = list(), False
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+    yield ']'
+
+
+_serializers = {}
+_serializers_lock = threading.Lock()
+
+
+def serializer_for(model):
+    """
+    Shared serializer of every column of model.
+    :param model:
+    :return: ModelSerializer
+    """
+    serializer = _serializers.get(model)
+    if serializer is None:
+        with _serializers_lock:
+            serializer = _serializers.setdefault(model, ModelSerializer(model))
+    return serializer
+
+
+def object_as_dict(obj):
+    """
+    Inspect model object and return it as dictionary.
+    :param obj: model instance or list of them
+    :return: list of dicts, values are left as they are
+    """
+    objs = obj if isinstance(obj, list) else [obj]
+    resultant_list = list()
+
+    for row in objs:
+        if row:
+            state = row.__dict__
+            resultant_list.append({column: state[column] if column in state else getattr(row, column)
+                                   for column in serializer_for(type(row)).columns})
+
+    return resultant_list
@@ -0,0 +1,96 @@
+import threading
+
+from flask import current_app
+from itsdangerous import TimedJSONWebSignatureSerializer, URLSafeTimedSerializer, URLSafeSerializer, BadData
+from werkzeug.local import LocalProxy
+
+AUTH_TOKEN_SALT = 'auth-token'
+# Seconds password reset links stay valid
+RESET_TOKEN_EXPIRES = 1800
+
+
+class TokenService(object):
+    """
+    Signed tokens of one application. Serializers hold no state of the tokens they sign, so every request shares
+    the same instances instead of building them per token.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._serializers = dict()
+        self._lock = threading.Lock()
+
+    def _shared(self, key, factory):
+        serializer = self._serializers.get(key)
+        if serializer is None:
+            with self._lock:
+                serializer = self._serializers.get(key)
+                if serializer is None:
+                    serializer = self._serializers[key] = factory(self.app.config['SECRET_KEY'])
+        return serializer
+
+    def _reset_serializer(self, expires_in):
+        return self._shared(('reset', expires_in),
+                            lambda key: TimedJSONWebSignatureSerializer(key, expires_in=expires_in))
+
+    def _auth_serializer(self):
+        return self._shared(('auth',), lambda key: URLSafeTimedSerializer(key, salt=AUTH_TOKEN_SALT))
+
+    def serializer(self, salt):
+        """
+        Shared URL safe serializer, e.g. of pagination cursors.
+        :param salt: separates tokens of different purposes signed with the same SECRET_KEY
+        :return: URLSafeSerializer
+        """
+        return self._shared(('url', salt), lambda key: URLSafeSerializer(key, salt=salt))
+
+    def reset_token(self, user_id, version, expires_in=RESET_TOKEN_EXPIRES):
+        """
+        Password reset token. It stops working once the password is changed, see User.revoke_tokens.
+        :param user_id:
+        :param version: token version of user
+        :param expires_in: seconds token is valid for
+        :return: token
+        """
+        return self._reset_serializer(expires_in).dumps({'user_id': user_id, 'version': version}).decode('utf-8')
+
+    def verify_reset_token(self, token):
+        """
+        :param token:
+        :return: tuple (user id, token version or None for tokens issued without one), None when token is
+                 tampered or expired
+        """
+        try:
+            # Expiry is read from the token, any instance verifies tokens of every lifetime.
+            claims = self._reset_serializer(RESET_TOKEN_EXPIRES).loads(token)
+            return int(claims['user_id']), claims.get('version')
+        except (BadData, KeyError, TypeError, ValueError):
+            return None
+
+    def auth_token(self, user_id, version):
+        """
+        Stateless token authenticating API requests as user, sent as 'Authorization: Bearer <token>'.
+        :param user_id:
+        :param version: token version of user, bumping it revokes the token
+        :return: token
+        """
+        return self._auth_serializer().dumps([user_id, version])
+
+    def verify_auth_token(self, token):
+        """
+        Check signature and age of token, without database.
+        :param token:
+        :return: tuple (user id, token version), None when token is tampered or older than AUTH_TOKEN_MAX_AGE
+        """
+        try:
+            user_id, version = self._auth_serializer().loads(token, max_age=self.app.config.get('AUTH_TOKEN_MAX_AGE'))
+            return int(user_id), int(version)
+        except (BadData, TypeError, ValueError):
+            return None
+
+
+def init_app(app):
+    app.extensions['tokens'] = TokenService(app)
+
+
+tokens = LocalProxy(lambda: current_app.extensions['tokens'])
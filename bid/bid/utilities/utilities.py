@@ -1,24 +1,67 @@
-import secrets
-import os
-from PIL import Image
+from flask import current_app, before_render_template, template_rendered
 
-from bid import app
+from bid import db
+from bid.models import Product
+from bid.utilities.images import pipeline
 
+# Separates levels of category names, e.g. 'Electronics / Cameras'
+CATEGORY_SEPARATOR = ' / '
 
-def save_picture(form_picture):
+
+def save_picture(form_picture, user_id):
     """
-    Save picture to directory created in location 'static/pics'
+    Save picture to directory created in location 'static/pics' and schedule its renditions.
+    Same picture uploaded again is stored only once.
     :param form_picture:
+    :param user_id: owner of products showing picture, their fragments are refreshed once it is rendered
+    :return: file name of picture thumbnail
+    :raises InvalidPicture: when file is not a readable picture
+    """
+    app = current_app._get_current_object()
+    return pipeline.save(form_picture.stream, form_picture.filename,
+                         callback=lambda picture: picture_ready(app, user_id, picture))
+
+
+def picture_ready(app, user_id, picture):
+    """
+    Refresh cached fragments of products of user showing picture once its renditions are generated.
+    Runs on image pipeline threads.
+    """
+    with app.app_context():
+        try:
+            # Fragments show the default picture until the thumbnail exists, nothing else changes on the row.
+            Product.query.filter(Product.user_id == user_id, Product.picture == picture) \
+                .update({Product.version: Product.version + 1}, synchronize_session=False)
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def normalize_category(category):
+    """
+    Normalize free-form category so the same category typed differently is grouped together in search facets
+    and category browsing. '  home   appliances ' becomes 'Home Appliances', levels of subcategories are separated
+    by '/': 'electronics/cameras' becomes 'Electronics / Cameras'.
+    :param category:
     :return:
     """
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.root_path, 'static/pics', picture_fn)
+    if category is None:
+        return None
+    return CATEGORY_SEPARATOR.join(' '.join(level.split()).title() for level in category.split('/') if level.strip())
 
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
 
-    return picture_fn
+def stream_template(template_name, **context):
+    """
+    Render template piece by piece, e.g. pages looping over queries read in chunks, sending the same signals as
+    render_template() once rendering starts and ends. Wrap in stream_with_context() to keep the request.
+    :param template_name:
+    :param context:
+    :return: generator of text chunks
+    """
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_or_select_template(template_name)
+    app.update_template_context(context)
+
+    before_render_template.send(app, template=template, context=context)
+    yield from template.generate(context)
+    template_rendered.send(app, template=template, context=context)
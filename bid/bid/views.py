@@ -1,86 +1,119 @@
 from logging import error
-from datetime import datetime, timedelta
-from flask import render_template, url_for, flash, redirect, request, abort
+from datetime import datetime
+from flask import Blueprint, render_template, url_for, flash, redirect, request, abort, Response, jsonify, \
+    stream_with_context, current_app
 from flask_login import login_user, current_user, logout_user, login_required
 from flask_mail import Message
 
-from bid import app, bcrypt, db, mail
-from bid.models import User, Product, Bidder
-from bid.utilities.utilities import save_picture
-from bid.forms import RegistrationForm, LoginForm, RequestResetForm, ResetPasswordForm, AddProductForm, ApplyBid
+from bid import db
+from bid.models import User, Product, Bidder, BidEvent
+from bid.utilities.utilities import save_picture, stream_template
+from bid.utilities.images import InvalidPicture
+from bid.utilities.fragments import forget_fragments
+from bid.utilities.bidding import place_bid, BID_ACCEPTED, BID_OUTBID
+from bid.utilities.mailer import dispatcher
+from bid.utilities.hashing import hasher
+from bid.utilities.orderbook import order_books, leaderboard
+from bid.utilities.categories import assign_category, adjust_active_counts, category_tree, find_category
+from bid.utilities.dashboard import dashboard_summary, active_bids, seller_stats, invalidate_dashboards
+from bid.utilities.listing import paginate_listing, keyset_listing, home_listing_query, user_listing_query, \
+    browse_category, BROWSE_SORTS
+from bid.utilities.search import search_products
+from bid.utilities.pubsub import pubsub, product_channel, bid_update, event_stream, poll_stream
+from bid.utilities.ratelimit import rate_limit
+from bid.utilities.database import use_replica, ping, pool_status, REPLICA_BIND
+from bid.utilities.bulk import import_products, uploaded_pictures, export_query, export_rows, format_of, FORMATS, \
+    MIMETYPES
+from bid.forms import RegistrationForm, LoginForm, RequestResetForm, ResetPasswordForm, AddProductForm, ApplyBid, \
+    ImportProductsForm
+
+main = Blueprint('main', __name__)
+
+
+def listing_page(query):
+    """
+    Paginate product listing by cursor when requested or configured, by page number otherwise.
+    :param query:
+    :return:
+    """
+    cursor = request.args.get('cursor')
+    if cursor or current_app.config.get('LISTING_PAGINATION') == 'cursor':
+        return keyset_listing(query, cursor=cursor, per_page=5, strategy='denormalized')
+
+    page = request.args.get('page', 1, type=int)
+    return paginate_listing(query, page=page, per_page=5, strategy='denormalized')
 
 
-@app.route('/', methods=['GET', 'POST'])
+@main.route('/', methods=['GET', 'POST'])
+@use_replica
 def home():
     products = []
     if not current_user.is_authenticated:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     if request.method == 'GET':
-        page = request.args.get('page', 1, type=int)
-        products = Product.query \
-            .filter(Product.last_date_to_bid >= (datetime.now().replace(microsecond=0) + timedelta(days=-1))) \
-            .order_by(Product.post_created.desc()) \
-            .paginate(page=page, per_page=5)
-
-        for prod in products.items:
-            if prod.bids:
-                prod.bids.bid_value = max(item.bid_value for item in prod.bids)
+        products = listing_page(home_listing_query())
 
     return render_template('home.html', products=products)
 
 
-@app.route("/register", methods=['GET', 'POST'])
+@main.route("/register", methods=['GET', 'POST'])
 def register():
     """
     User registration
     :return:
     """
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = RegistrationForm()
 
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hasher.generate_password_hash(form.password.data)
         user = User(username=form.username.data, email=form.email.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
         flash(f'Your account has been created! You are now able to log-in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html', title='Register', form=form)
 
 
-# @app.route(''/'')?
-@app.route('/login', methods=['GET', 'POST'])
+# @main.route(''/'')?
+@main.route('/login', methods=['GET', 'POST'])
+@rate_limit()
 def login():
     """
     User authentication
     :return:
     """
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = LoginForm()
 
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and hasher.check_password_hash(user.password, form.password.data):
+            if hasher.needs_rehash(user.password):
+                # Cost factor changed since password was hashed, upgrade the hash while plain password is at hand.
+                user.password = hasher.generate_password_hash(form.password.data)
+                db.session.commit()
+
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('home'))
+            return redirect(next_page) if next_page else redirect(url_for('main.home'))
         else:
             flash('Login Unsuccessful. Please, check email or password', 'danger')
 
     return render_template('login.html', title='Login', form=form)
 
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
 def send_reset_email(user):
@@ -92,21 +125,22 @@ def send_reset_email(user):
     token = user.get_reset_token()
     msg = Message('Password Reset Request', sender='noreply@demo.com', recipients=[user.email])
     msg.body = f'''To reset your password, visit the following link:
-    {url_for('reset_token', token=token, _external=True)}
+    {url_for('main.reset_token', token=token, _external=True)}
 
     If you did not make this request then simply ignore this email and no changes will be made.
     '''
-    mail.send(msg)
+    dispatcher.send(msg)
 
 
-@app.route('/reset_password', methods=['GET', 'POST'])
+@main.route('/reset_password', methods=['GET', 'POST'])
+@rate_limit()
 def reset_request():
     """
     Reset password request
     :return:
     """
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = RequestResetForm()
 
@@ -114,12 +148,12 @@ def reset_request():
         user = User.query.filter_by(email=form.email.data).first()
         send_reset_email(user)
         flash('An email has been sent with instructions to reset your password.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('reset_request.html', title='Reset Password', form=form)
 
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])
+@main.route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_token(token):
     """
     Reset password. After click on link received in mail user will hit this api url.
@@ -127,27 +161,29 @@ def reset_token(token):
     :return:
     """
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     user = User.verify_reset_token(token)
 
     if user is None:
         flash('That is an invalid or expired token.', 'warning')
-        return redirect(url_for('reset_request'))
+        return redirect(url_for('main.reset_request'))
 
     form = ResetPasswordForm()
 
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hasher.generate_password_hash(form.password.data)
         user.password = hashed_password
+        # Signs out every session and API client, and makes the reset link single use.
+        user.revoke_tokens()
         db.session.commit()
         flash(f'Your password has been updated! You are now able to log-in.', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     return render_template('reset_token.html', title='Reset Password', form=form)
 
 
-@app.route('/product/new', methods=['GET', 'POST'])
+@main.route('/product/new', methods=['GET', 'POST'])
 @login_required
 def add_product():
     """
@@ -163,19 +199,15 @@ def add_product():
 
                 product_image = ''
                 if form.picture.data:
-                    product_image = save_picture(form.picture.data)
-
-                current_user_id = User.query.filter(
-                    User.email == current_user.email,
-                    User.username == current_user.username
-                ).first()
-
-                if not current_user_id.id:
-                    logout_user()
-                    return redirect(url_for('home'))
+                    try:
+                        product_image = save_picture(form.picture.data, current_user.id)
+                    except InvalidPicture:
+                        form.picture.errors.append('File is not a readable picture.')
+                        return render_template('add_products.html', title='Add Product', form=form,
+                                               legend='Add Product')
 
                 new_product = Product(
-                    user_id=current_user_id.id,
+                    user_id=current_user.id,
                     product_name=form.product_name.data,
                     product_description=form.product_description.data,
                     category=form.category.data,
@@ -183,9 +215,11 @@ def add_product():
                     last_date_to_bid=form.last_date_to_bid.data,
                     picture=product_image
                 )
+                assign_category(new_product, form.category.data)
 
                 db.session.add(new_product)
                 db.session.commit()
+                invalidate_dashboards([current_user.id])
                 flash('Product has been added!', 'success')
             else:
                 flash('Please, insert correct values!', 'warning')
@@ -197,10 +231,55 @@ def add_product():
     except Exception as e:
         error(str(e), exc_info=True)
 
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
-@app.route('/product/<int:product_id>')
+@main.route('/product/import', methods=['GET', 'POST'])
+@login_required
+@rate_limit()
+def bulk_import():
+    """
+    Add products of current user from uploaded CSV or JSON lines file, along with pictures named in its rows.
+    :return:
+    """
+    form = ImportProductsForm()
+    result = None
+    if form.validate_on_submit():
+        try:
+            upload = form.products_file.data
+            result = import_products(upload.stream, format_of(upload.filename, 'csv'), current_user.id,
+                                     open_picture=uploaded_pictures(form.pictures.data or ()))
+            flash(f'{result.imported} product(s) imported.', 'success' if not result.failed else 'warning')
+        except Exception as e:
+            flash('Products could not be imported!', 'warning')
+            error(str(e), exc_info=True)
+    elif request.method == 'POST':
+        flash('Please, select a CSV or JSON lines file!', 'warning')
+
+    return render_template('import_products.html', title='Import Products', form=form, legend='Import Products',
+                           result=result)
+
+
+@main.route('/product/export')
+@login_required
+def bulk_export():
+    """
+    Download products of current user, or bids on them with ?data=bids, as CSV or JSON lines (?format=jsonl).
+    Rows are streamed as they are read from database.
+    :return:
+    """
+    fmt = request.args.get('format', 'csv')
+    data = request.args.get('data', 'products')
+    if fmt not in FORMATS or data not in ('products', 'bids'):
+        abort(400)
+
+    query, serializer = export_query(current_user.id, data)
+    response = Response(stream_with_context(export_rows(query, serializer, fmt)), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={data}.{fmt}'
+    return response
+
+
+@main.route('/product/<int:product_id>')
 @login_required
 def product(product_id):
     """
@@ -209,14 +288,48 @@ def product(product_id):
     :return:
     """
     my_product = Product.query.get_or_404(product_id)
+    top_bids, my_rank = leaderboard(my_product, bidder_id=current_user.id)
+    bidder_ids = [bid.bidder_id for bid in top_bids]
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(bidder_ids))) if bidder_ids else {}
 
-    if my_product.bids:
-        my_product.bids.bid_value = max(item.bid_value for item in my_product.bids)
+    return render_template('product.html', title=my_product.product_name, my_product=my_product, top_bids=top_bids,
+                           my_rank=my_rank, usernames=usernames)
 
-    return render_template('product.html', title=my_product.product_name, my_product=my_product)
 
-
-@app.route('/product/<int:product_id>/update', methods=['GET', 'POST'])
+@main.route('/product/<int:product_id>/events')
+@login_required
+def product_events(product_id):
+    """
+    Stream new highest bids of product as server-sent events, starting with the current one.
+    :param product_id:
+    :return:
+    """
+    # Every stream holds a worker thread, past SSE_MAX_STREAMS pages poll instead of starving other requests: they
+    # get the current bid and their event source reconnects SSE_POLL_INTERVAL seconds later.
+    if not current_app.config.get('SSE_MAX_STREAMS'):
+        abort(503)
+    if not pubsub.acquire_stream():
+        update = bid_update(Product.query.get_or_404(product_id))
+        return Response(poll_stream(update, interval=current_app.config.get('SSE_POLL_INTERVAL', 30)),
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    subscription = pubsub.subscribe(product_channel(product_id))
+    my_product = Product.query.get(product_id)
+    if my_product is None:
+        subscription.close()
+        pubsub.release_stream()
+        abort(404)
+
+    stream = event_stream(subscription, initial=bid_update(my_product),
+                          heartbeat=current_app.config.get('SSE_HEARTBEAT', 15))
+    response = Response(stream, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Called by the server once the stream ends, even when it was never iterated.
+    response.call_on_close(pubsub.release_stream)
+    return response
+
+
+@main.route('/product/<int:product_id>/update', methods=['GET', 'POST'])
 @login_required
 def update_product(product_id):
     """
@@ -236,11 +349,16 @@ def update_product(product_id):
 
                 product_image = ''
                 if form.picture.data:
-                    product_image = save_picture(form.picture.data)
+                    try:
+                        product_image = save_picture(form.picture.data, current_user.id)
+                    except InvalidPicture:
+                        form.picture.errors.append('File is not a readable picture.')
+                        return render_template('add_products.html', title='Update Product', form=form,
+                                               legend='Update Product')
 
                 my_product.product_name = form.product_name.data
                 my_product.product_description = form.product_description.data
-                my_product.category = form.category.data
+                assign_category(my_product, form.category.data)
                 my_product.minimum_bid = form.minimum_bid.data
                 my_product.last_date_to_bid = form.last_date_to_bid.data
                 my_product.picture = product_image
@@ -248,7 +366,7 @@ def update_product(product_id):
 
                 db.session.commit()
                 flash('Product details has been updated!', 'success')
-                return redirect(url_for('product', product_id=my_product.id))
+                return redirect(url_for('main.product', product_id=my_product.id))
 
             else:
                 flash('Please, insert correct values!', 'warning')
@@ -267,7 +385,7 @@ def update_product(product_id):
     return render_template('add_products.html', title='Update Product', form=form, legend='Update Product')
 
 
-@app.route('/product/<int:product_id>/delete', methods=['POST'])
+@main.route('/product/<int:product_id>/delete', methods=['POST'])
 @login_required
 def delete_product(product_id):
     """
@@ -282,9 +400,18 @@ def delete_product(product_id):
             abort(403)
 
         if my_product:
+            bidder_ids = [bidder_id for bidder_id, in db.session.query(Bidder.bidders_id)
+                          .filter(Bidder.product_id == product_id)]
             Bidder.query.filter(Bidder.product_id == product_id).delete()
+            BidEvent.query.filter(BidEvent.product_id == product_id).delete()
+            if my_product.closed_at is None:
+                adjust_active_counts({my_product.category_id: -1})
+            # Before the row is gone, a new product may get its id.
+            forget_fragments(my_product)
             Product.query.filter(Product.id == product_id).delete()
             db.session.commit()
+            order_books.discard(product_id)
+            invalidate_dashboards(bidder_ids + [current_user.id])
             flash('Your product has been deleted!', 'success')
 
         else:
@@ -293,32 +420,87 @@ def delete_product(product_id):
     except Exception as e:
         error(str(e), exc_info=True)
 
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
-@app.route("/user/<string:username>")
+@main.route("/user/<string:username>")
 @login_required
+@use_replica
 def user_product(username):
     """
     View all products of selected user profile
     :param username:
     :return:
     """
-    page = request.args.get('page', 1, type=int)
     user = User.query.filter_by(username=username).first_or_404()
-    products = Product.query.filter_by(owner=user) \
-        .order_by(Product.post_created.desc()) \
-        .paginate(page=page, per_page=5)
-
-    for prod in products.items:
-        if prod.bids:
-            prod.bids.bid_value = max(item.bid_value for item in prod.bids)
+    products = listing_page(user_listing_query(user))
 
     return render_template('user_products.html', products=products, user=user)
 
 
-@app.route('/bid/product/<int:product_id>', methods=['GET', 'POST'])
+@main.route("/dashboard")
 @login_required
+def dashboard():
+    """
+    Active bids of current user, winning or outbid, and bids received by each of their products. Totals are
+    cached, lists are streamed as they are read from database however long they are.
+    :return:
+    """
+    return Response(stream_with_context(stream_template(
+        'dashboard.html', title='Dashboard', summary=dashboard_summary(current_user.id),
+        bids=active_bids(current_user.id), products=seller_stats(current_user.id))))
+
+
+@main.route("/categories")
+@main.route("/category/<int:category_id>")
+@login_required
+@use_replica
+def category(category_id=None):
+    """
+    Category tree with active auction counts and open auctions of selected category, ending soonest first
+    (?sort=ending) or highest bid first (?sort=highest), paginated by cursor.
+    :param category_id:
+    :return:
+    """
+    sort = request.args.get('sort', 'ending')
+    if sort not in BROWSE_SORTS:
+        abort(400)
+
+    node = products = None
+    if category_id is not None:
+        node = find_category(category_id)
+        if node is None:
+            abort(404)
+        products = browse_category(node, sort, cursor=request.args.get('cursor'),
+                                   per_page=current_app.config.get('CATEGORY_PER_PAGE', 10))
+
+    return render_template('category.html', title=node.name if node else 'Categories', tree=category_tree(),
+                           node=node, products=products, sort=sort)
+
+
+@main.route("/search")
+@login_required
+@use_replica
+def search():
+    """
+    Search products open for bidding, narrowed down by category and price band facets.
+    :return:
+    """
+    text = request.args.get('q', '').strip()
+    category = request.args.get('category') or None
+    price_band = request.args.get('price', type=int)
+    page = request.args.get('page', 1, type=int)
+
+    result = search_products(text, category=category, price_band=price_band, page=page,
+                             per_page=current_app.config.get('SEARCH_PER_PAGE', 10))
+
+    return render_template('search.html', result=result, products=result.products, q=text or None, category=category,
+                           price_band=price_band)
+
+
+@main.route('/bid/product/<int:product_id>', methods=['GET', 'POST'])
+@login_required
+@rate_limit()
 def bid_product(product_id):
     """
     Apply bidding aon any selected product
@@ -327,48 +509,40 @@ def bid_product(product_id):
     """
     form = ApplyBid()
     try:
-        my_product = Product.query.get_or_404(product_id)
-        update_bidding = Bidder.query \
-            .filter(Bidder.bidders_id == current_user.id, Bidder.product_id == product_id) \
-            .first()
+        Product.query.get_or_404(product_id)
 
         if request.method == 'GET':
+            update_bidding = Bidder.query \
+                .filter(Bidder.bidders_id == current_user.id, Bidder.product_id == product_id) \
+                .first()
+
             if update_bidding:
                 flash('Seems previously you bid on this product!', 'info')
                 form.bid_value.data = update_bidding.bid_value
+                form.max_bid.data = update_bidding.max_bid
                 form.note.data = update_bidding.note
 
         if request.method == 'POST':
             if form.validate_on_submit():
 
-                if int(form.bid_value.data) <= int(my_product.minimum_bid):
-                    flash('Bidding value must be greater that minimum bidding value!', 'warning')
-                    return render_template('apply_bid.html', form=form, legend='Apply Bidding')
-
                 try:
-                    if update_bidding:
-                        update_bidding.bidders_id = current_user.id
-                        update_bidding.product_id = product_id
-                        update_bidding.bid_value = form.bid_value.data
-                        update_bidding.note = form.note.data
-
-                    else:
-                        query_result = Bidder(
-                            bidders_id=current_user.id,
-                            product_id=product_id,
-                            bid_value=form.bid_value.data,
-                            note=form.note.data
-                        )
-
-                        db.session.add(query_result)
-                    db.session.commit()
+                    result = place_bid(product_id, current_user.id, form.bid_value.data, form.note.data,
+                                       max_bid=form.max_bid.data)
                 except Exception as e:
                     flash('Incorrect values!', 'warning')
                     error(str(e), exc_info=True)
                     return render_template('apply_bid.html', form=form, legend='Apply Bidding')
 
-                flash('Bidding applied!', 'success')
-                return redirect(url_for('home'))
+                if result.status == BID_OUTBID:
+                    flash(result.message, 'warning')
+                    return redirect(url_for('main.product', product_id=product_id))
+
+                if result.status != BID_ACCEPTED:
+                    flash(result.message, 'warning')
+                    return render_template('apply_bid.html', form=form, legend='Apply Bidding')
+
+                flash(result.message, 'success')
+                return redirect(url_for('main.home'))
 
             else:
                 flash('Please, fill fields correctly!', 'warning')
@@ -377,3 +551,39 @@ def bid_product(product_id):
         error(str(e), exc_info=True)
 
     return render_template('apply_bid.html', form=form, legend='Apply Bidding')
+
+
+@main.route('/health/db')
+def health_db():
+    """
+    Ping primary and replica databases and report their connection pools: size, checked out connections,
+    overflow, checkouts and time spent waiting for a connection. Answers 503 when a database is unreachable.
+    :return:
+    """
+    engines = {'primary': db.get_engine()}
+    if REPLICA_BIND in (current_app.config.get('SQLALCHEMY_BINDS') or ()):
+        engines[REPLICA_BIND] = db.get_engine(bind=REPLICA_BIND)
+
+    databases = dict()
+    for name, engine in engines.items():
+        ok, latency, reason = ping(engine)
+        databases[name] = dict(status='ok' if ok else 'unavailable', latency_ms=latency, **pool_status(engine))
+        if reason:
+            databases[name]['error'] = reason
+
+    healthy = all(database['status'] == 'ok' for database in databases.values())
+    return jsonify(status='ok' if healthy else 'unavailable', databases=databases), 200 if healthy else 503
+
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """
+    Request, query, template, cache, connection pool and rate limit metrics of this worker process in Prometheus
+    text format. Not found unless METRICS_ENABLED config is set.
+    :return:
+    """
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        abort(404)
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -8,14 +8,152 @@ PASSWORD = ''
 HOST = '127.0.0.1'
 DATABASE = 'bidder_database'
 
-SQLALCHEMY_DATABASE_URI = f'mysql://{USERNAME}:{PASSWORD}@{HOST}/{DATABASE}'
-SQLALCHEMY_TRACK_MODIFICATIONS = True
+SQLALCHEMY_DATABASE_URI = environ.get('DATABASE_URL', f'mysql://{USERNAME}:{PASSWORD}@{HOST}/{DATABASE}')
+# Model change signals are not used, tracking them costs an event per flushed object
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read-only replica serving product listings (home, user products, search), primary serves them when unset
+SQLALCHEMY_BINDS = {'replica': environ['DATABASE_REPLICA_URL']} if environ.get('DATABASE_REPLICA_URL') else {}
+
+# Connection pool of every database engine, per worker process. Pool sizing is ignored for SQLite.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(environ.get('DB_POOL_SIZE', 10)),
+    # Connections opened beyond pool_size under load, closed again when returned
+    'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+    # Seconds a request waits for a free connection before failing
+    'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 10)),
+    # Seconds after which connections are replaced, below MySQL wait_timeout and proxy idle timeouts
+    'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 280)),
+    # Test connections on checkout so ones dropped by server are replaced instead of failing the request
+    'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+}
 
 # TODO: Email configuration
-MAIL_SERVER = 'smtp.gmail.com'
-MAIL_PORT = 465
-MAIL_USE_TLS = False
-MAIL_USE_SSL = True
+MAIL_SERVER = environ.get('MAIL_SERVER', 'smtp.gmail.com')
+MAIL_PORT = int(environ.get('MAIL_PORT', 465))
+MAIL_USE_TLS = environ.get('MAIL_USE_TLS', 'false').lower() == 'true'
+MAIL_USE_SSL = environ.get('MAIL_USE_SSL', 'true').lower() == 'true'
 
 MAIL_USERNAME = environ.get('EMAIL_USER')
 MAIL_PASSWORD = environ.get('EMAIL_PASSWORD')
+
+# Mails are sent from a background thread, in batches over one SMTP connection
+MAIL_ASYNC = True
+MAIL_BATCH_SIZE = 20
+# Seconds SMTP connection is kept open while there is nothing to send
+MAIL_IDLE_TIMEOUT = 30
+# Failed mails are retried after MAIL_RETRY_BACKOFF seconds, doubled on every attempt
+MAIL_MAX_RETRIES = 5
+MAIL_RETRY_BACKOFF = 2
+# Seconds to wait for queued mails on shutdown
+MAIL_SHUTDOWN_TIMEOUT = 10
+
+# Product listings pagination: 'page' (numbered pages) or 'cursor' (keyset, no COUNT/OFFSET scans)
+LISTING_PAGINATION = environ.get('LISTING_PAGINATION', 'page')
+
+# Bid placement: 'optimistic' (product version check) or 'pessimistic' (SELECT ... FOR UPDATE on product)
+BID_LOCKING = environ.get('BID_LOCKING', 'optimistic')
+# Times a bid which lost a race with concurrent bids is retried before user is asked to submit it again
+BID_RETRIES = 5
+# Step automatic bids outbid other bids by, see max_bid of bid.utilities.bidding.place_bid
+BID_INCREMENT = 1
+
+# Password hashing cost factor, existing hashes are upgraded on next login when it changes
+BCRYPT_LOG_ROUNDS = int(environ.get('BCRYPT_LOG_ROUNDS', 12))
+# Processes hashing passwords, 0 hashes on request threads
+BCRYPT_POOL_SIZE = int(environ.get('BCRYPT_POOL_SIZE', 2))
+# Hashes waiting for a free process before further requests block
+BCRYPT_MAX_PENDING = 16
+
+# Threads generating picture renditions in background
+IMAGE_WORKERS = 2
+# Directory of uploaded pictures as received, must not be served. Defaults to originals/ in the instance folder.
+IMAGE_ORIGINALS_DIR = environ.get('IMAGE_ORIGINALS_DIR')
+
+# Seconds signed API tokens (Authorization: Bearer <token>) are valid. Tokens and sessions carry the token version of
+# their user, revoking bumps it and ends them all, in other processes once their cached user expires.
+AUTH_TOKEN_MAX_AGE = 30 * 24 * 3600
+
+# Users of authenticated sessions are cached instead of being loaded from database on every request
+USER_CACHE_BACKEND = 'bid.utilities.cache.LRUCache'
+USER_CACHE_SIZE = 10000
+# Seconds a cached user is trusted, changes made by other processes show up at the latest after this time
+USER_CACHE_TTL = 300
+
+# Rendered product cards and details, keyed by version column of product which bids, updates and closing bump
+FRAGMENT_CACHE_BACKEND = 'bid.utilities.cache.LRUCache'
+FRAGMENT_CACHE_SIZE = 5000
+FRAGMENT_CACHE_TTL = 600
+
+# Category tree with active auction counts shown for navigation, counts lag at most CATEGORY_CACHE_TTL seconds
+CATEGORY_CACHE_BACKEND = 'bid.utilities.cache.LRUCache'
+CATEGORY_CACHE_SIZE = 1
+CATEGORY_CACHE_TTL = 60
+CATEGORY_PER_PAGE = 10
+
+# Bid and sales totals of user dashboards, dropped by bids, closing and deletion of products in this process.
+# Totals shown by other processes lag at most DASHBOARD_CACHE_TTL seconds.
+DASHBOARD_CACHE_BACKEND = 'bid.utilities.cache.LRUCache'
+DASHBOARD_CACHE_SIZE = 10000
+DASHBOARD_CACHE_TTL = 60
+
+# Upper bounds of price bands counted by search facets, last band holds everything above
+SEARCH_PRICE_BANDS = (1000, 5000, 10000, 50000)
+SEARCH_PER_PAGE = 10
+
+# Bid updates pushed to product pages, in-process broker reaches only subscribers of the publishing process
+PUBSUB_BROKER = 'bid.utilities.pubsub.InProcessBroker'
+# Updates buffered per subscriber before oldest ones are dropped
+PUBSUB_QUEUE_SIZE = 16
+# Seconds between keep-alive comments on idle event streams
+SSE_HEARTBEAT = 15
+# Open event streams per worker process, every one holds a worker thread until its product page is closed. Serve them
+# from threaded workers (gunicorn --worker-class gthread) with more threads than this, further pages poll for the
+# highest bid every SSE_POLL_INTERVAL seconds instead. 0 disables streams, e.g. with sync workers, where one stream
+# blocks a whole worker.
+SSE_MAX_STREAMS = int(environ.get('SSE_MAX_STREAMS', 50))
+SSE_POLL_INTERVAL = 30
+
+# Background thread closing auctions once their last date to bid is over, `flask close-auctions` does the same
+AUCTION_CLOSER_ENABLED = environ.get('AUCTION_CLOSER_ENABLED', 'true').lower() == 'true'
+# Seconds between checks for newly added auctions closing before the nearest known deadline
+AUCTION_CLOSER_INTERVAL = 60
+AUCTION_CLOSER_BATCH_SIZE = 500
+
+# Request limits of endpoints (blueprint.view), '<requests>/<second|minute|hour|day> per <user|ip|email|URL variable>'.
+# Only POST requests are limited, see bid.utilities.ratelimit.rate_limit.
+RATE_LIMIT_ENABLED = environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# TokenBucketBackend or SlidingWindowBackend keep limits per process, point to a shared store backend to share them
+RATE_LIMIT_BACKEND = 'bid.utilities.ratelimit.TokenBucketBackend'
+RATE_LIMIT_MAX_KEYS = 100000
+RATE_LIMITS = {
+    'main.login': ['10/minute per ip', '5/minute per email'],
+    'main.reset_request': ['5/hour per ip', '3/hour per email'],
+    'main.bid_product': ['20/minute per user', '120/minute per product'],
+    'api.api_place_bid': ['20/minute per user', '120/minute per product'],
+    'main.bulk_import': ['10/hour per user'],
+    'api.api_create_token': ['10/minute per ip', '5/minute per email'],
+}
+# Number of reverse proxies in front of the application whose X-Forwarded-For and X-Forwarded-Proto are trusted.
+# Limits per ip count the proxy's address as every client's unless it is set, e.g. 1 behind a single nginx. Never set
+# it higher than the proxies actually there, clients could then choose their address by sending the header.
+TRUSTED_PROXIES = int(environ.get('TRUSTED_PROXIES', 0))
+
+# Per endpoint request latency, SQL query count and time and template render time, exposed on /metrics.
+# Metrics are per worker process, scrape every worker or aggregate them in front of Prometheus.
+METRICS_ENABLED = environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+# Seconds after which queries are logged as slow
+SLOW_QUERY_THRESHOLD = float(environ.get('SLOW_QUERY_THRESHOLD', 0.25))
+# Fraction of requests run under cProfile, their stats are logged when they take PROFILE_SLOW_REQUEST seconds or more
+PROFILE_SAMPLE_RATE = float(environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_REQUEST = 1.0
+# Directory receiving .prof files of slow sampled requests, e.g. for snakeviz, not written when unset
+PROFILE_DIR = environ.get('PROFILE_DIR')
+
+# Products inserted per statement and transaction by bulk imports
+BULK_IMPORT_BATCH_SIZE = 1000
+
+# Products whose order book (current bid of every bidder, ranked) is kept in memory by each process
+ORDER_BOOK_PRODUCTS = 1000
+# Highest bids kept per order book, lower bids are ranked from database
+ORDER_BOOK_DEPTH = 100
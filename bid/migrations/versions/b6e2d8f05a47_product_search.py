@@ -0,0 +1,70 @@
+"""product search
+
+Revision ID: b6e2d8f05a47
+Revises: 3f9a6c1d2e85
+Create Date: 2026-10-18 12:04:51.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d8f05a47'
+down_revision = '3f9a6c1d2e85'
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE product_fts USING fts5("
+    "product_name, product_description, category, content='product', content_rowid='id')",
+    "CREATE TRIGGER product_fts_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, product_name, product_description, category) "
+    "VALUES (new.id, new.product_name, new.product_description, new.category); END",
+    "CREATE TRIGGER product_fts_delete AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, product_name, product_description, category) "
+    "VALUES ('delete', old.id, old.product_name, old.product_description, old.category); END",
+    "CREATE TRIGGER product_fts_update AFTER UPDATE OF product_name, product_description, category ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, product_name, product_description, category) "
+    "VALUES ('delete', old.id, old.product_name, old.product_description, old.category); "
+    "INSERT INTO product_fts(rowid, product_name, product_description, category) "
+    "VALUES (new.id, new.product_name, new.product_description, new.category); END",
+)
+
+
+def normalize_categories():
+    """
+    Normalize categories typed before the form started doing it, so facets group them together.
+    """
+    bind = op.get_bind()
+    product = sa.table('product', sa.column('id', sa.Integer), sa.column('category', sa.String))
+
+    rows = bind.execute(sa.select([product.c.id, product.c.category])).fetchall()
+    for product_id, category in rows:
+        normalized = ' '.join((category or '').split()).title()
+        if normalized != category:
+            bind.execute(product.update().where(product.c.id == product_id).values(category=normalized))
+
+
+def upgrade():
+    normalize_categories()
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.execute('ALTER TABLE product ADD FULLTEXT INDEX ft_product_search '
+                   '(product_name, product_description, category)')
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        # Index products which existed before the triggers.
+        op.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ft_product_search', table_name='product')
+    elif dialect == 'sqlite':
+        for trigger in ('product_fts_insert', 'product_fts_delete', 'product_fts_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS product_fts')
@@ -1,4 +1,6 @@
-from bid import app
+from bid import create_app
+
+app = create_app()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+"""
+Fixtures of the test suite. Run it from project directory, like the benchmarks:
+
+    $ python -m pytest tests
+"""
+import pytest
+
+from bid import create_app, db as _db
+
+TEST_SETTINGS = {
+    'SECRET_KEY': 'test',
+    'WTF_CSRF_ENABLED': False,
+    'MAIL_SUPPRESS_SEND': True,
+    'RATE_LIMIT_ENABLED': False,
+    'AUCTION_CLOSER_ENABLED': False,
+    # Lowest cost bcrypt accepts, tests log in far more often than users do
+    'BCRYPT_LOG_ROUNDS': 4,
+}
+
+
+@pytest.fixture
+def make_app():
+    """
+    Create the application of a test with its tables, its application context is pushed until the test ends.
+    Applications of one thread share the database session, so a test creates one application only.
+    :return: function of database URI, defaults to in-memory SQLite, and settings overriding TEST_SETTINGS
+    """
+    contexts = list()
+
+    def make(database_uri='sqlite://', **settings):
+        assert not contexts, 'One application per test.'
+        app = create_app(dict(TEST_SETTINGS, SQLALCHEMY_DATABASE_URI=database_uri, **settings))
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        _db.create_all()
+        return app
+
+    yield make
+
+    for context in contexts:
+        _db.session.remove()
+        _db.drop_all()
+        _db.engine.dispose()
+        context.pop()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def db(app):
+    return _db
@@ -0,0 +1,116 @@
+import threading
+from collections import Counter
+from random import Random
+
+import pytest
+
+from benchmarks.common import seed
+from bid.models import Product, Bidder
+from bid.utilities.bidding import place_bid, reconcile_bid_aggregates, BID_ACCEPTED, BID_TOO_LOW
+
+THREADS = 20
+BIDS_PER_THREAD = 5
+
+
+def aggregates(db):
+    """
+    :return: dict of product id -> (highest bid, highest bidder id, bid count) stored on products
+    """
+    return {row.id: (row.highest_bid, row.highest_bidder_id, row.bid_count) for row in
+            db.session.query(Product.id, Product.highest_bid, Product.highest_bidder_id, Product.bid_count)}
+
+
+def test_reconcile_bids_repairs_drifted_aggregates(app, db):
+    seed(db, users=10, products=20, bids_per_product=3)
+    expected = aggregates(db)
+    Product.query.filter(Product.id <= 10) \
+        .update({Product.highest_bid: 1, Product.highest_bidder_id: None, Product.bid_count: 0},
+                synchronize_session=False)
+    db.session.commit()
+    versions = dict(db.session.query(Product.id, Product.version))
+
+    result = app.test_cli_runner().invoke(args=['reconcile-bids', '--batch-size', '4'])
+
+    assert result.exit_code == 0, result.output
+    assert 'corrected for 10 product(s)' in result.output
+    db.session.remove()
+    assert aggregates(db) == expected
+    assert dict(db.session.query(Product.id, Product.version)) == \
+        {product_id: version + 1 if product_id <= 10 else version for product_id, version in versions.items()}
+    assert reconcile_bid_aggregates() == 0
+
+
+def test_bid_equal_to_maximum_of_leader_is_rejected(app, db):
+    user_ids = seed(db, users=3, products=1, bids_per_product=0)
+    product = Product.query.first()
+    leader_id, bidder_id = [user_id for user_id in user_ids if user_id != product.user_id][:2]
+    value = int(product.minimum_bid) + 1
+    assert place_bid(product.id, leader_id, value, max_bid=value + 50).status == BID_ACCEPTED
+    before = aggregates(db)
+
+    result = place_bid(product.id, bidder_id, value + 10, max_bid=value + 50)
+
+    assert result.status == BID_TOO_LOW
+    assert Bidder.query.filter(Bidder.bidders_id == bidder_id).count() == 0
+    assert aggregates(db) == before
+    assert place_bid(product.id, bidder_id, value + 50).status == BID_TOO_LOW
+    assert place_bid(product.id, bidder_id, value + 51).status == BID_ACCEPTED
+
+
+@pytest.mark.parametrize('locking', ['optimistic', 'pessimistic'])
+def test_concurrent_bids_keep_bid_rows_and_aggregates_consistent(make_app, tmp_path, locking):
+    app = make_app(f'sqlite:///{tmp_path / "bids.db"}', SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+                   BID_LOCKING=locking)
+    from bid import db
+
+    user_ids = seed(db, users=THREADS // 2 + 1, products=1, bids_per_product=0)
+    product = Product.query.first()
+    product_id, minimum_bid = product.id, product.minimum_bid
+    # Threads share bidders to provoke duplicate bid rows.
+    bidders = [user_id for user_id in user_ids if user_id != product.user_id]
+    db.session.remove()
+
+    accepted = list()
+    failures = list()
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(THREADS)
+
+    def worker(index):
+        rnd = Random(index)
+        with app.app_context():
+            try:
+                start_barrier.wait()
+                for _ in range(BIDS_PER_THREAD):
+                    # Outbid whatever this thread saw last, concurrent threads race on the same value.
+                    highest_bid = db.session.query(Product.highest_bid).filter(Product.id == product_id).scalar()
+                    value = int(highest_bid or minimum_bid) + rnd.randrange(1, 10)
+                    db.session.rollback()
+                    bidder_id = bidders[index % len(bidders)]
+                    result = place_bid(product_id, bidder_id, value)
+                    if result.status == BID_ACCEPTED:
+                        with lock:
+                            accepted.append((value, bidder_id))
+            except Exception as e:
+                failures.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not failures
+    assert accepted
+    product = Product.query.get(product_id)
+    rows = Bidder.query.filter(Bidder.product_id == product_id).all()
+    assert max(Counter(row.bidders_id for row in rows).values()) == 1, 'duplicate bid rows of a bidder'
+    # Every accepted bid had to beat the previous one, so no two accepted bids can share a value.
+    values = [value for value, _ in accepted]
+    assert len(set(values)) == len(values)
+    assert (product.highest_bid, product.highest_bidder_id) == max(accepted), 'highest bid lost'
+    assert product.bid_count == len(rows)
+    assert (product.highest_bid, product.highest_bidder_id) == \
+        max((row.bid_value, row.bidders_id) for row in rows)
+    assert reconcile_bid_aggregates() == 0
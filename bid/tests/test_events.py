@@ -0,0 +1,43 @@
+from benchmarks.common import seed, login
+from bid.utilities.pubsub import pubsub
+
+
+def open_stream(client, product_id):
+    return client.get(f'/product/{product_id}/events', buffered=False)
+
+
+def test_event_streams_past_limit_of_process_poll(make_app):
+    app = make_app(SSE_MAX_STREAMS=2)
+    from bid import db
+    seed(db, users=2, products=1, bids_per_product=0)
+    client = login(app, 'user1@example.com')
+
+    assert client.get('/product/2/events').status_code == 404
+    streams = [open_stream(client, 1), open_stream(client, 1)]
+    assert [stream.status_code for stream in streams] == [200, 200]
+    polled = open_stream(client, 1)
+    assert polled.status_code == 200
+    assert polled.mimetype == 'text/event-stream'
+    assert list(polled.response) == [b'retry: 30000\n\n',
+                                     b'event: bid\ndata: {"product_id": 1, "highest_bid": null, "highest_bidder_id": '
+                                     b'null, "bid_count": 0, "closed": false}\n\n']
+    assert pubsub._streams == 2
+
+    streams.pop().close()
+    stream = open_stream(client, 1)
+    assert stream.status_code == 200
+    assert next(stream.response).startswith(b'retry:')
+    stream.close()
+    streams.pop().close()
+    assert pubsub._streams == 0
+    assert b'new EventSource' in client.get('/product/1').data
+
+
+def test_event_streams_can_be_disabled(make_app):
+    app = make_app(SSE_MAX_STREAMS=0)
+    from bid import db
+    seed(db, users=2, products=1, bids_per_product=0)
+    client = login(app, 'user1@example.com')
+
+    assert open_stream(client, 1).status_code == 503
+    assert b'new EventSource' not in client.get('/product/1').data
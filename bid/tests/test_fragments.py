@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from benchmarks.common import seed, login
+from bid.models import Product
+from bid.utilities.bidding import place_bid, BID_PLACED
+
+
+def shown_bid(client, product_id, value):
+    """
+    :return: tuple (value is shown as highest bid by product details, by product card on home page)
+    """
+    product = client.get(f'/product/{product_id}').data.decode()
+    home = client.get('/').data.decode()
+    return f'id="highest-bid-value">{value}' in product, f'&#8377;{value}' in home
+
+
+def test_fragments_follow_product_version(app, db):
+    seed(db, users=3, products=1, bids_per_product=1)
+    product = Product.query.first()
+    product_id, highest_bid = product.id, int(product.highest_bid)
+    bidder_id = next(user_id for user_id in (1, 2, 3) if user_id not in (product.user_id, product.highest_bidder_id))
+    client = login(app, f'user{bidder_id}@example.com')
+    db.session.remove()
+    assert shown_bid(client, product_id, highest_bid) == (True, True)
+
+    # Bid placed by another process: only the row changes, caches of this process are not told.
+    Product.query.filter(Product.id == product_id) \
+        .update({Product.highest_bid: highest_bid + 100, Product.version: Product.version + 1},
+                synchronize_session=False)
+    db.session.commit()
+    assert shown_bid(client, product_id, highest_bid + 100) == (True, True)
+
+    db.session.remove()
+    assert place_bid(product_id, bidder_id, highest_bid + 200).status in BID_PLACED
+    assert shown_bid(client, product_id, highest_bid + 200) == (True, True)
+
+
+def test_product_reusing_id_of_deleted_product_is_not_shown_as_it(app, db):
+    seed(db, users=1, products=0)
+    client = login(app, 'user1@example.com')
+
+    def add_product(name):
+        product = Product(user_id=1, product_name=name, product_description=name, category='Home', minimum_bid=10,
+                          last_date_to_bid=datetime.now() + timedelta(days=3), picture='default.png')
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+    first_id = add_product('FirstThing')
+    assert b'FirstThing' in client.get('/').data
+    assert client.post(f'/product/{first_id}/delete').status_code == 302
+
+    assert add_product('SecondThing') == first_id
+    home = client.get('/').data
+    assert b'SecondThing' in home and b'FirstThing' not in home
@@ -0,0 +1,103 @@
+import io
+import os
+import threading
+from datetime import date, timedelta
+
+import pytest
+from PIL import Image
+
+from benchmarks.common import seed, login
+from bid.models import Product
+from bid.utilities.images import pipeline, PICTURES_DIR, LEGACY_ORIGINALS_DIR, InvalidPicture
+
+# EXIF tag of camera make
+EXIF_MAKE = 0x010f
+
+
+def camera_picture():
+    image = Image.new('RGB', (300, 200), 'red')
+    exif = Image.Exif()
+    exif[EXIF_MAKE] = 'Camera'
+    stream = io.BytesIO()
+    image.save(stream, 'JPEG', exif=exif.tobytes())
+    stream.seek(0)
+    return stream
+
+
+def use_directory(app, tmp_path):
+    """
+    Store pictures of app in tmp_path instead of the static folder of the project.
+    """
+    app.root_path = str(tmp_path)
+    os.makedirs(os.path.join(app.root_path, PICTURES_DIR))
+    app.config['IMAGE_ORIGINALS_DIR'] = str(tmp_path / 'originals')
+
+
+def test_originals_are_not_served(app, tmp_path):
+    use_directory(app, tmp_path)
+    with app.test_request_context():
+        picture = pipeline.save(camera_picture(), 'upload.jpg')
+    pipeline.drain()
+
+    assert os.listdir(tmp_path / 'originals') == [picture]
+    assert not os.path.exists(os.path.join(app.root_path, LEGACY_ORIGINALS_DIR))
+    client = app.test_client()
+    assert client.get(f'/static/pics/originals/{picture}').status_code == 404
+    response = client.get(f'/static/pics/{picture}')
+    assert response.status_code == 200
+    assert EXIF_MAKE not in Image.open(io.BytesIO(response.data)).getexif()
+    response.close()
+
+
+def test_move_legacy_originals(app, tmp_path):
+    use_directory(app, tmp_path)
+    legacy = os.path.join(app.root_path, LEGACY_ORIGINALS_DIR)
+    os.makedirs(legacy)
+    with open(os.path.join(legacy, 'abc.jpg'), 'wb') as picture:
+        picture.write(camera_picture().read())
+
+    result = app.test_cli_runner().invoke(args=['move-originals'])
+
+    assert result.exit_code == 0, result.output
+    assert os.listdir(legacy) == []
+    assert os.listdir(tmp_path / 'originals') == ['abc.jpg']
+
+
+def test_renditions_are_generated_off_the_request_thread(app, tmp_path, monkeypatch):
+    use_directory(app, tmp_path)
+    render = pipeline.render
+    threads = set()
+
+    def recording_render(*args):
+        threads.add(threading.current_thread().name)
+        render(*args)
+
+    monkeypatch.setattr(pipeline._get_current_object(), 'render', recording_render)
+    ready = list()
+    picture = pipeline.save(camera_picture(), 'upload.jpg', callback=ready.append)
+    pipeline.drain()
+
+    assert ready == [picture]
+    assert threads and all(name.startswith('image-pipeline') for name in threads)
+    assert os.path.exists(os.path.join(app.root_path, PICTURES_DIR, picture))
+
+
+def test_unreadable_upload_stores_nothing(app, tmp_path):
+    use_directory(app, tmp_path)
+    with pytest.raises(InvalidPicture):
+        pipeline.save(io.BytesIO(b'not a picture'), 'upload.png')
+    assert os.listdir(tmp_path / 'originals') == []
+
+
+def test_unreadable_upload_is_rejected_by_form(app, db, tmp_path):
+    app.config['IMAGE_ORIGINALS_DIR'] = str(tmp_path / 'originals')
+    seed(db, users=1, products=0)
+    client = login(app, 'user1@example.com')
+    response = client.post('/product/new', content_type='multipart/form-data', data={
+        'product_name': 'Lamp', 'product_description': 'Lamp', 'category': 'Home', 'minimum_bid': 10,
+        'last_date_to_bid': (date.today() + timedelta(days=3)).isoformat(),
+        'picture': (io.BytesIO(b'not a picture'), 'lamp.png')})
+
+    assert b'File is not a readable picture.' in response.data
+    assert os.listdir(tmp_path / 'originals') == []
+    assert Product.query.count() == 0
@@ -0,0 +1,50 @@
+import pytest
+
+from benchmarks.common import seed, login, count_queries
+from bid.utilities.listing import LISTING_STRATEGIES, paginate_listing, keyset_listing, home_listing_query
+
+BID_VOLUMES = (0, 5, 50)
+
+
+def listing_queries(app, db, strategy, bids_per_product):
+    """
+    :return: tuple (queries of a listing page, queries of home view), products of page are fully used
+    """
+    db.drop_all()
+    db.create_all()
+    seed(db, users=max(bids_per_product + 1, 10), products=20, bids_per_product=bids_per_product)
+    client = login(app, 'user1@example.com')
+    db.session.remove()
+
+    with count_queries(db.engine) as statements:
+        with app.test_request_context('/'):
+            for product in paginate_listing(home_listing_query(), page=2, per_page=5, strategy=strategy).items:
+                product.owner.username, product.bid_stats.highest_bid
+            for product in keyset_listing(home_listing_query(), per_page=5, strategy=strategy).items:
+                product.owner.username, product.bid_stats.highest_bid
+    page_queries = len(statements)
+    db.session.remove()
+
+    # Warm up session user cache, so every volume counts the same queries.
+    client.get('/')
+    with count_queries(db.engine) as statements:
+        assert client.get('/?page=2').status_code == 200
+    return page_queries, len(statements)
+
+
+@pytest.mark.parametrize('strategy', LISTING_STRATEGIES)
+def test_listing_queries_do_not_depend_on_bid_volume(app, db, strategy):
+    counts = {bids_per_product: listing_queries(app, db, strategy, bids_per_product)
+              for bids_per_product in BID_VOLUMES}
+
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_aggregate_strategy_counts_bids_of_page_products(app, db):
+    seed(db, users=10, products=30, bids_per_product=4)
+
+    with app.test_request_context('/'):
+        for page in (1, 2, 3):
+            products = paginate_listing(home_listing_query(), page=page, per_page=10, strategy='aggregate').items
+            assert [(product.id, product.bid_stats) for product in products] == \
+                [(product.id, (product.highest_bid, product.bid_count)) for product in products]
@@ -0,0 +1,50 @@
+from benchmarks.common import seed, login
+from bid.models import Product
+from bid.utilities.bidding import place_bid, BID_PLACED
+
+
+def place_bids(db, count):
+    """
+    Bids of every seeded user but the seller on a product without bids, each one outbidding the previous.
+    :return: tuple (product id, list of tuples (bidder id, bid value) in the order placed)
+    """
+    user_ids = seed(db, users=count + 1, products=1, bids_per_product=0)
+    product = Product.query.first()
+    product_id, value = product.id, int(product.minimum_bid)
+    placed = list()
+    for bidder_id in [user_id for user_id in user_ids if user_id != product.user_id][:count]:
+        value += 10
+        assert place_bid(product_id, bidder_id, value).status in BID_PLACED
+        placed.append((bidder_id, value))
+    return product_id, placed
+
+
+def test_product_bids_streams_bid_history_in_order_placed(app, db):
+    product_id, placed = place_bids(db, 3)
+    bidder_id, value = placed[0]
+    assert place_bid(product_id, bidder_id, value + 100).status in BID_PLACED
+    placed.append((bidder_id, value + 100))
+
+    response = login(app, 'user1@example.com').get(f'/api/v1/products/{product_id}/bids')
+
+    assert response.status_code == 200
+    bids = response.get_json()
+    assert [(bid['bidder_id'], float(bid['bid_value'])) for bid in bids] == placed
+    assert [bid['id'] for bid in bids] == sorted(bid['id'] for bid in bids)
+    assert not {'note', 'max_bid'} & set(bids[0])
+
+
+def test_leaderboard_formats_recorded_and_loaded_bids_alike(app, db):
+    product_id, placed = place_bids(db, 2)
+    client = login(app, 'user1@example.com')
+    # First request loads the book from bid history, the next bid is recorded into it.
+    loaded = client.get(f'/api/v1/products/{product_id}/leaderboard').get_json()['items']
+    bidder_id, value = placed[0]
+    assert place_bid(product_id, bidder_id, value + 100).status in BID_PLACED
+
+    items = client.get(f'/api/v1/products/{product_id}/leaderboard').get_json()['items']
+
+    assert len(items) == len(loaded) == 2
+    recorded, kept = items
+    assert recorded['bidder_id'] == bidder_id and kept == loaded[0]
+    assert len(recorded['bid_value'].partition('.')[2]) == len(kept['bid_value'].partition('.')[2])
@@ -0,0 +1,28 @@
+import pytest
+
+
+def login_attempts(app, addresses):
+    """
+    Failed logins, each with another email, sent through a proxy on behalf of the given client addresses.
+    :return: list of response status codes
+    """
+    client = app.test_client()
+    return [client.post('/login', data={'email': f'nobody{index}@example.com', 'password': 'wrong'},
+                        headers={'X-Forwarded-For': address}, environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code
+            for index, address in enumerate(addresses)]
+
+
+@pytest.mark.parametrize('trusted_proxies, limited', [(0, True), (1, False)])
+def test_limits_per_ip_use_client_address_behind_trusted_proxy(make_app, trusted_proxies, limited):
+    app = make_app(RATE_LIMIT_ENABLED=True, TRUSTED_PROXIES=trusted_proxies,
+                   RATE_LIMITS={'main.login': ['3/minute per ip']})
+
+    statuses = login_attempts(app, [f'203.0.113.{index}' for index in range(5)])
+
+    assert (429 in statuses) == limited
+
+
+def test_client_address_sent_through_trusted_proxy_is_still_limited(make_app):
+    app = make_app(RATE_LIMIT_ENABLED=True, TRUSTED_PROXIES=1, RATE_LIMITS={'main.login': ['3/minute per ip']})
+
+    assert login_attempts(app, ['203.0.113.7'] * 5)[-1] == 429
@@ -0,0 +1,27 @@
+import pytest
+
+from benchmarks.common import seed
+
+
+@pytest.mark.parametrize('body', ['[1, 2]', '"x"', '1', 'null', '{"email": ["user1@example.com"]}'])
+def test_create_token_rejects_bodies_which_are_not_credentials(make_app, body):
+    app = make_app(RATE_LIMIT_ENABLED=True)
+    from bid import db
+    seed(db, users=1, products=0)
+
+    response = app.test_client().post('/api/v1/tokens', data=body, content_type='application/json')
+
+    assert response.status_code in (400, 415)
+    assert 'error' in response.get_json()
+
+
+def test_token_authenticates_until_revoked(app, db):
+    seed(db, users=1, products=0)
+    client = app.test_client()
+    response = client.post('/api/v1/tokens', json={'email': 'user1@example.com', 'password': 'password'})
+    assert response.status_code == 201
+    bearer = {'Authorization': f'Bearer {response.get_json()["token"]}'}
+    assert client.get('/api/v1/dashboard', headers=bearer).status_code == 200
+
+    assert client.delete('/api/v1/tokens', headers=bearer).status_code == 204
+    assert client.get('/api/v1/dashboard', headers=bearer).status_code == 401
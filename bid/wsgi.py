@@ -0,0 +1,23 @@
+"""
+WSGI entry point. With a preloading server the application is created once in the master process and shared by
+forked workers, e.g.:
+
+    $ gunicorn --preload --workers 4 --worker-class gthread --threads 64 wsgi:app
+
+Threaded workers are required: every open product page streams bid updates and holds a thread, at most SSE_MAX_STREAMS
+per worker, which must stay below --threads. A sync worker would be blocked by a single page, with sync workers set
+SSE_MAX_STREAMS=0.
+
+Creating the application opens no database connection and starts no thread, every worker opens its own pool and
+starts its own background threads on first use.
+"""
+import gc
+
+from bid import create_app, warm_up
+
+app = create_app()
+warm_up(app)
+
+# Objects created so far live as long as the workers do. Moving them out of the garbage collector's reach keeps
+# collections in workers from writing to, and so copying, memory pages shared with the master.
+gc.freeze()